@@ -1,11 +1,17 @@
 import os
-import uuid
+import math
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from dotenv import load_dotenv
 import logging
-from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
+
+from services.tts_cache import TTSCache
+from services.tts_gateway import TTSGateway, GatewayUnavailable
+from services.wav_writer import StreamingWavWriter, streaming_wav_header
+from services.batch_narration import plan_batches, build_batch_text, split_by_alignment
+from services.tts_backends import (
+    ElevenLabsBackend, PiperBackend, StubBackend, BackendUnavailable, select_backend
+)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,29 +23,57 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get ElevenLabs API key from environment variables
+# Persistent synthesis cache shared by all requests
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+tts_cache = TTSCache() if TTS_CACHE_ENABLED else None
+
+# Rate limiting, priority lanes and circuit breaker in front of ElevenLabs
+gateway = TTSGateway()
+
+# Default backend for /generate-voice-batch when the request names none (e.g. "stub" for offline runs)
+TTS_BATCH_BACKEND = os.getenv("TTS_BATCH_BACKEND")
+
+# Synthesis engines; ElevenLabs is only available with an API key
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 if not ELEVENLABS_API_KEY:
-    logger.error("ElevenLabs API key not found in .env file")
-    raise ValueError("ELEVENLABS_API_KEY environment variable not set")
+    logger.warning("ElevenLabs API key not found in .env file; only local backends are available")
 
-# Initialize ElevenLabs client
-client = ElevenLabs(
-    api_key=ELEVENLABS_API_KEY,
-)
-
-# Voice mapping - maps your system's voice names to ElevenLabs voice IDs
-VOICE_MAPPING = {
-    "male1": "YmP1fAL2C7KGze05u879",  # Your preferred voice
-    "male2": "NFG5qt843uXKj4pFvR7C", 
-    "male3": "vNm4u40hTe4NQoRG82Bs",
-    "female1": "gmv0PPPs8m6FEf03PImj",
-    "female2": "ZF6FPAbjXT4488VcRRnw",
-    "female3": "tQ4MEZFJOzsahSEEZtHK",
-    # Add more voice mappings as needed
-    "default": "EXAVITQu4vr4xnSDxMaL"  # Default fallback voice
+backends = {
+    "elevenlabs": ElevenLabsBackend(ELEVENLABS_API_KEY, gateway),
+    "local": PiperBackend(),
+    "stub": StubBackend(),
 }
 
+def synthesize_to_wav(backend, voice_name, text, output_file_path, cache_key, lease=None):
+    """Stream PCM from a backend into a WAV file, yielding each chunk as it is written.
+    
+    The file only appears at output_file_path once the clip is complete.
+    The gateway lease, if any, is held for the whole stream.
+    """
+    writer = StreamingWavWriter(output_file_path)
+    try:
+        for chunk in backend.stream(voice_name, text, lease):
+            writer.write(chunk)
+            yield chunk
+        writer.commit()
+    except BaseException as e:
+        writer.abort()
+        if lease:
+            lease.release(e)
+        raise
+    if lease:
+        lease.release()
+    
+    logger.info(f"Successfully generated voice with {backend.name} and saved to {output_file_path}")
+    if tts_cache and cache_key:
+        tts_cache.store(cache_key, str(output_file_path))
+
+def gateway_unavailable_response(error):
+    """Answer 503 with Retry-After so callers back off instead of failing the job."""
+    retry_after = max(1, math.ceil(error.retry_after))
+    logger.warning(f"TTS gateway unavailable: {error} (retry after {retry_after}s)")
+    return jsonify({"error": str(error), "retry_after": retry_after}), 503, {"Retry-After": str(retry_after)}
+
 @app.route('/generate-voice', methods=['POST'])
 def generate_voice():
     try:
@@ -59,21 +93,11 @@ def generate_voice():
         file_name = payload["filename"]
         output_dir = payload["filepath"]
         
-        # Map the voice name to ElevenLabs voice ID
-        voice_id = VOICE_MAPPING.get(voice_name, VOICE_MAPPING["default"])
+        # Route to a backend by request ("backend") or policy ("draft")
+        backend = select_backend(backends, payload)
         
-        # Set fixed parameters for ElevenLabs
-        model_id = "eleven_turbo_v2"
-        output_format = "mp3_22050_32"  # Using WAV format
-        optimize_streaming_latency = "0"
-        
-        # Fixed voice settings
-        voice_settings = VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-        )
+        # Optionally return the audio as a chunked response while it is generated
+        stream_response = bool(payload.get("stream", False))
         
         # Ensure the output directory exists
         output_path = Path(output_dir)
@@ -82,46 +106,157 @@ def generate_voice():
         # Full path for the output audio file
         output_file_path = output_path / f"{file_name}.wav"
         
-        logger.info(f"Generating voice using ElevenLabs SDK: {voice_id} for text: '{text}'")
+        # Serve repeated lines from the cache instead of paying for them again
+        cache_key = backend.cache_key(voice_name, text)
+        if tts_cache and cache_key and tts_cache.fetch(cache_key, str(output_file_path)):
+            logger.info(f"TTS cache hit for {output_file_path}")
+            if stream_response:
+                return send_file(str(output_file_path), mimetype="audio/wav")
+            return jsonify({
+                "status": "success",
+                "message": "Voice served from cache",
+                "file_path": str(output_file_path),
+                "backend": backend.name,
+                "cached": True
+            })
+        
+        logger.info(f"Generating voice with {backend.name}: {voice_name} for text: '{text}'")
         
-        # Call the ElevenLabs SDK
-        response = client.text_to_speech.convert(
-            voice_id=voice_id,
-            optimize_streaming_latency=optimize_streaming_latency,
-            output_format=output_format,
-            text=text,
-            model_id=model_id,
-            voice_settings=voice_settings,
-        )
+        # Wait for a slot before answering, so overload becomes a 503 the client can retry
+        lease = backend.admit(text, payload.get("priority", "interactive"))
+        chunks = synthesize_to_wav(backend, voice_name, text, output_file_path, cache_key, lease)
         
-        # Save the audio file
-        with open(output_file_path, "wb") as f:
-            for chunk in response:
-                if chunk:
-                    f.write(chunk)
+        if stream_response:
+            def generate():
+                yield streaming_wav_header()
+                yield from chunks
+            response = Response(
+                stream_with_context(generate()),
+                mimetype="audio/wav",
+                headers={"X-File-Path": str(output_file_path)}
+            )
+            if lease:
+                # Frees the slot if the client goes away before the stream starts
+                response.call_on_close(lease.release)
+            return response
         
-        logger.info(f"Successfully generated voice and saved to {output_file_path}")
+        # Write the whole clip before responding
+        for _ in chunks:
+            pass
         
         # Return success response
         return jsonify({
             "status": "success",
             "message": "Voice generated successfully",
-            "file_path": str(output_file_path)
+            "file_path": str(output_file_path),
+            "backend": backend.name,
+            "cached": False
         })
     
+    except GatewayUnavailable as e:
+        return gateway_unavailable_response(e)
+    except (ValueError, BackendUnavailable) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception("Error in generate_voice endpoint")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/generate-voice-batch', methods=['POST'])
+def generate_voice_batch():
+    """Narrate a whole movie in as few timestamped synthesis calls as possible.
+    
+    Scene lines are joined with markers, synthesised together, and split
+    back into one WAV per scene using the character timestamps. Backends
+    without timestamps synthesise each scene on its own.
+    """
+    try:
+        payload = request.json
+        logger.info(f"Received batch payload with {len(payload.get('scenes', []))} scenes")
+        
+        required_fields = ["voice", "filepath", "scenes"]
+        for field in required_fields:
+            if field not in payload:
+                return jsonify({"error": f"Missing required field: {field}"}), 400
+        for scene in payload["scenes"]:
+            if "text" not in scene or "filename" not in scene:
+                return jsonify({"error": "Each scene needs 'text' and 'filename'"}), 400
+        
+        voice_name = payload["voice"]
+        if TTS_BATCH_BACKEND and "backend" not in payload:
+            payload["backend"] = TTS_BATCH_BACKEND
+        backend = select_backend(backends, payload)
+        priority = payload.get("priority", "batch")
+        output_path = Path(payload["filepath"])
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        files = {}
+        pending = []
+        for scene in payload["scenes"]:
+            output_file_path = output_path / f"{scene['filename']}.wav"
+            cache_key = backend.cache_key(voice_name, scene["text"])
+            files[scene["filename"]] = str(output_file_path)
+            if tts_cache and cache_key and tts_cache.fetch(cache_key, str(output_file_path)):
+                continue
+            pending.append((scene, output_file_path, cache_key))
+        
+        if backend.supports_timestamps:
+            batches = plan_batches([scene["text"] for scene, _, _ in pending])
+        else:
+            batches = [[i] for i in range(len(pending))]
+        
+        for batch in batches:
+            if not backend.supports_timestamps:
+                scene, output_file_path, cache_key = pending[batch[0]]
+                lease = backend.admit(scene["text"], priority)
+                for _ in synthesize_to_wav(backend, voice_name, scene["text"], output_file_path, cache_key, lease):
+                    pass
+                continue
+            
+            batch_text, spans = build_batch_text([pending[i][0]["text"] for i in batch])
+            logger.info(f"Synthesising {len(batch)} scenes ({len(batch_text)} chars) with {backend.name}")
+            pcm, alignment = backend.synthesize_with_timestamps(voice_name, batch_text, priority)
+            
+            for i, clip in zip(batch, split_by_alignment(pcm, alignment, spans)):
+                _, output_file_path, cache_key = pending[i]
+                writer = StreamingWavWriter(output_file_path)
+                writer.write(clip)
+                writer.commit()
+                if tts_cache and cache_key:
+                    tts_cache.store(cache_key, str(output_file_path))
+        
+        logger.info(f"Batch narration complete: {len(files)} scenes, {len(batches)} synthesis calls")
+        return jsonify({
+            "status": "success",
+            "message": "Voices generated successfully",
+            "files": files,
+            "backend": backend.name,
+            "synthesis_calls": len(batches),
+            "cached": len(files) - len(pending)
+        })
+    
+    except GatewayUnavailable as e:
+        return gateway_unavailable_response(e)
+    except (ValueError, BackendUnavailable) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in generate_voice_batch endpoint")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/voices', methods=['GET'])
 def list_voices():
     """Get available voices from ElevenLabs and map to internal voice names"""
     try:
-        elevenlabs_voices = client.voices.get_all()
+        elevenlabs = backends["elevenlabs"]
+        response = elevenlabs.client.voices.get_all() if elevenlabs.available() else None
+        # The SDK returns pydantic models, which jsonify cannot serialise
+        elevenlabs_voices = [
+            {"voice_id": voice.voice_id, "name": voice.name, "category": voice.category, "labels": voice.labels}
+            for voice in (response.voices if response else [])
+        ]
         
-        # Create a simple mapping that your system can understand
+        # Create a simple mapping that your system can understand, per backend
         system_voices = {
-            name: voice_id for name, voice_id in VOICE_MAPPING.items()
+            name: backend.voices() for name, backend in backends.items()
         }
         
         return jsonify({
@@ -136,7 +271,12 @@ def list_voices():
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"})
+    return jsonify({
+        "status": "healthy",
+        "backends": {name: backend.available() for name, backend in backends.items()},
+        "tts_cache": tts_cache.stats() if tts_cache else None,
+        "gateway": gateway.stats()
+    })
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5010))
@@ -0,0 +1,125 @@
+import base64
+import struct
+import math
+
+from services.wav_writer import CANONICAL_SAMPLE_RATE, CANONICAL_SAMPLE_WIDTH
+
+BATCH_MAX_CHARS = 4500  # Stay under the per-request character limit of the TTS model
+SCENE_SEPARATOR = "\n\n"  # Marks scene boundaries and gives the voice a natural pause
+
+def plan_batches(texts, max_chars=BATCH_MAX_CHARS):
+    """Group scene indices into as few synthesis calls as the character limit allows."""
+    batches = []
+    current = []
+    current_chars = 0
+    for index, text in enumerate(texts):
+        added = len(text) + (len(SCENE_SEPARATOR) if current else 0)
+        if current and current_chars + added > max_chars:
+            batches.append(current)
+            current, current_chars = [], 0
+            added = len(text)
+        current.append(index)
+        current_chars += added
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_text(texts):
+    """Join scene lines with separators and return (text, [(start, end), ...]) character spans."""
+    spans = []
+    parts = []
+    offset = 0
+    for i, text in enumerate(texts):
+        if i:
+            parts.append(SCENE_SEPARATOR)
+            offset += len(SCENE_SEPARATOR)
+        spans.append((offset, offset + len(text)))
+        parts.append(text)
+        offset += len(text)
+    return "".join(parts), spans
+
+def _speech_bounds(alignment, start, end):
+    """Return (first_start_time, last_end_time) of the non-space characters in a span."""
+    characters = alignment["characters"]
+    starts = alignment["character_start_times_seconds"]
+    ends = alignment["character_end_times_seconds"]
+
+    indices = [i for i in range(start, min(end, len(characters))) if not characters[i].isspace()]
+    if not indices:
+        return None
+    return starts[indices[0]], ends[indices[-1]]
+
+def split_by_alignment(pcm, alignment, spans, sample_rate=CANONICAL_SAMPLE_RATE,
+                       sample_width=CANONICAL_SAMPLE_WIDTH):
+    """Split one synthesised PCM buffer into per-scene buffers using character timestamps.
+
+    Each cut sits halfway through the pause between two scenes, so no
+    speech is clipped and the silence is shared between neighbours.
+    """
+    total_frames = len(pcm) // sample_width
+    total_seconds = total_frames / sample_rate
+
+    bounds = [_speech_bounds(alignment, start, end) for start, end in spans]
+
+    cuts = [0.0]
+    for i in range(1, len(spans)):
+        previous = next((b for b in reversed(bounds[:i]) if b), None)
+        following = next((b for b in bounds[i:] if b), None)
+        if previous and following:
+            cuts.append((previous[1] + following[0]) / 2)
+        else:
+            # No speech to anchor on; fall back to the character position
+            cuts.append(total_seconds * spans[i][0] / max(spans[-1][1], 1))
+    cuts.append(total_seconds)
+
+    clips = []
+    for i in range(len(spans)):
+        start_frame = min(total_frames, int(round(cuts[i] * sample_rate)))
+        end_frame = min(total_frames, max(start_frame, int(round(cuts[i + 1] * sample_rate))))
+        clips.append(pcm[start_frame * sample_width:end_frame * sample_width])
+    return clips
+
+def synthesize_with_timestamps_elevenlabs(client, voice_id, text, model_id, output_format, voice_settings):
+    """Synthesise text with character timestamps via ElevenLabs. Returns (pcm, alignment)."""
+    response = client.text_to_speech.convert_with_timestamps(
+        voice_id=voice_id,
+        text=text,
+        model_id=model_id,
+        output_format=output_format,
+        voice_settings=voice_settings,
+    )
+    if not isinstance(response, dict):
+        response = response.dict()
+
+    alignment = response["alignment"]
+    if not isinstance(alignment, dict):
+        alignment = alignment.dict()
+    return base64.b64decode(response["audio_base64"]), alignment
+
+def synthesize_with_timestamps_stub(text, seconds_per_char=0.06, sample_rate=CANONICAL_SAMPLE_RATE):
+    """Offline stand-in for timestamped synthesis.
+
+    Produces a quiet tone for every non-space character and silence for
+    whitespace, with matching alignment, so batching and splitting can be
+    exercised without network access or API cost.
+    """
+    frames_per_char = int(seconds_per_char * sample_rate)
+    tone = b"".join(
+        struct.pack("<h", int(1000 * math.sin(2 * math.pi * 220 * n / sample_rate)))
+        for n in range(frames_per_char)
+    )
+    silence = b"\x00\x00" * frames_per_char
+
+    pcm = bytearray()
+    starts, ends = [], []
+    for i, char in enumerate(text):
+        starts.append(i * seconds_per_char)
+        ends.append((i + 1) * seconds_per_char)
+        pcm += silence if char.isspace() else tone
+
+    alignment = {
+        "characters": list(text),
+        "character_start_times_seconds": starts,
+        "character_end_times_seconds": ends,
+    }
+    return bytes(pcm), alignment
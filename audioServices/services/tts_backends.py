@@ -0,0 +1,238 @@
+import os
+import threading
+
+from services.tts_cache import TTSCache
+from services.wav_writer import CANONICAL_SAMPLE_RATE
+from services.batch_narration import synthesize_with_timestamps_elevenlabs, synthesize_with_timestamps_stub
+
+try:
+    from elevenlabs import VoiceSettings
+    from elevenlabs.client import ElevenLabs
+except ImportError:  # Only the local and stub backends are available
+    ElevenLabs = None
+
+try:
+    from piper.voice import PiperVoice
+except ImportError:  # The local backend reports itself unavailable
+    PiperVoice = None
+
+# Routing policy: backend used when a request names none, and the one used for drafts
+TTS_DEFAULT_BACKEND = os.getenv("TTS_DEFAULT_BACKEND", "elevenlabs")
+TTS_DRAFT_BACKEND = os.getenv("TTS_DRAFT_BACKEND", "local")
+
+PIPER_VOICES_DIR = os.getenv("PIPER_VOICES_DIR", os.path.expanduser("~/.local/share/piper-voices"))
+LOCAL_TTS_CONCURRENCY = int(os.getenv("LOCAL_TTS_CONCURRENCY", max(1, (os.cpu_count() or 2) // 2)))
+
+# Fixed parameters for ElevenLabs
+ELEVENLABS_MODEL_ID = "eleven_turbo_v2"
+OUTPUT_FORMAT = f"pcm_{CANONICAL_SAMPLE_RATE}"  # Raw 16-bit mono PCM, wrapped as WAV on write
+VOICE_SETTINGS = {
+    "stability": 0.0,
+    "similarity_boost": 1.0,
+    "style": 0.0,
+    "use_speaker_boost": True,
+}
+
+# Voice mapping - maps your system's voice names to ElevenLabs voice IDs
+VOICE_MAPPING = {
+    "male1": "YmP1fAL2C7KGze05u879",  # Your preferred voice
+    "male2": "NFG5qt843uXKj4pFvR7C",
+    "male3": "vNm4u40hTe4NQoRG82Bs",
+    "female1": "gmv0PPPs8m6FEf03PImj",
+    "female2": "ZF6FPAbjXT4488VcRRnw",
+    "female3": "tQ4MEZFJOzsahSEEZtHK",
+    # Add more voice mappings as needed
+    "default": "EXAVITQu4vr4xnSDxMaL"  # Default fallback voice
+}
+
+# The same voice names mapped to Piper models (22050 Hz "medium" voices)
+LOCAL_VOICE_MAPPING = {
+    "male1": "en_US-ryan-medium",
+    "male2": "en_US-joe-medium",
+    "male3": "en_GB-alan-medium",
+    "female1": "en_US-amy-medium",
+    "female2": "en_US-kristin-medium",
+    "female3": "en_GB-jenny_dioco-medium",
+    "default": "en_US-lessac-medium"
+}
+
+class BackendUnavailable(Exception):
+    """Raised when a request is routed to a backend that is not configured."""
+
+class TTSBackend:
+    """Interface every synthesis engine implements.
+
+    Backends produce 16-bit mono PCM at CANONICAL_SAMPLE_RATE and accept the
+    system voice names in VOICE_MAPPING, so callers never see engine IDs.
+    """
+
+    name = None
+    supports_timestamps = False  # Whether /generate-voice-batch can use synthesize_with_timestamps
+
+    def available(self):
+        return True
+
+    def voices(self):
+        """Return the system voice names mapped to this engine's voice IDs."""
+        raise NotImplementedError
+
+    def cache_key(self, voice_name, text):
+        """Return the TTS cache key for a request, or None if output must not be cached."""
+        return None
+
+    def admit(self, text, priority):
+        """Wait for capacity to synthesise `text`. Returns a lease to release, or None."""
+        return None
+
+    def stream(self, voice_name, text, lease=None):
+        """Yield PCM chunks for `text` as they are produced."""
+        raise NotImplementedError
+
+    def synthesize_with_timestamps(self, voice_name, text, priority):
+        """Return (pcm, alignment) with per-character timings."""
+        raise NotImplementedError
+
+class ElevenLabsBackend(TTSBackend):
+    name = "elevenlabs"
+    supports_timestamps = True
+
+    def __init__(self, api_key, gateway):
+        self.gateway = gateway
+        self.client = ElevenLabs(api_key=api_key) if api_key and ElevenLabs else None
+
+    def available(self):
+        return self.client is not None
+
+    def voices(self):
+        return dict(VOICE_MAPPING)
+
+    def _voice_id(self, voice_name):
+        return VOICE_MAPPING.get(voice_name, VOICE_MAPPING["default"])
+
+    def cache_key(self, voice_name, text):
+        return TTSCache.make_key(self._voice_id(voice_name), ELEVENLABS_MODEL_ID, OUTPUT_FORMAT, VOICE_SETTINGS, text)
+
+    def admit(self, text, priority):
+        return self.gateway.acquire(len(text), priority)
+
+    def stream(self, voice_name, text, lease=None):
+        # A 429 before any audio arrives is retried after the backoff ElevenLabs asks for
+        started = False
+        while True:
+            try:
+                response = self.client.text_to_speech.convert_as_stream(
+                    voice_id=self._voice_id(voice_name),
+                    optimize_streaming_latency="0",
+                    output_format=OUTPUT_FORMAT,
+                    text=text,
+                    model_id=ELEVENLABS_MODEL_ID,
+                    voice_settings=VoiceSettings(**VOICE_SETTINGS),
+                )
+                for chunk in response:
+                    if chunk:
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started or lease is None or not lease.backoff(e):
+                    raise
+
+    def synthesize_with_timestamps(self, voice_name, text, priority):
+        return self.gateway.call(
+            lambda: synthesize_with_timestamps_elevenlabs(
+                self.client, self._voice_id(voice_name), text, ELEVENLABS_MODEL_ID, OUTPUT_FORMAT,
+                VoiceSettings(**VOICE_SETTINGS)
+            ),
+            len(text), priority
+        )
+
+class PiperBackend(TTSBackend):
+    """Offline CPU synthesis with Piper voice models.
+
+    Models are loaded lazily from PIPER_VOICES_DIR (`{name}.onnx` plus
+    `{name}.onnx.json`) and kept in memory. Synthesis is CPU bound, so at
+    most LOCAL_TTS_CONCURRENCY lines are rendered at once.
+    """
+
+    name = "local"
+
+    def __init__(self, voices_dir=PIPER_VOICES_DIR, concurrency=LOCAL_TTS_CONCURRENCY):
+        self.voices_dir = voices_dir
+        self._models = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _model_path(self, voice_name):
+        model = LOCAL_VOICE_MAPPING.get(voice_name, LOCAL_VOICE_MAPPING["default"])
+        return os.path.join(self.voices_dir, f"{model}.onnx")
+
+    def available(self):
+        return PiperVoice is not None and os.path.exists(self._model_path("default"))
+
+    def voices(self):
+        return dict(LOCAL_VOICE_MAPPING)
+
+    def _load(self, voice_name):
+        path = self._model_path(voice_name)
+        if not os.path.exists(path):
+            path = self._model_path("default")
+        with self._lock:
+            if path not in self._models:
+                voice = PiperVoice.load(path)
+                if voice.config.sample_rate != CANONICAL_SAMPLE_RATE:
+                    raise ValueError(f"{path} is {voice.config.sample_rate} Hz; "
+                                     f"use a {CANONICAL_SAMPLE_RATE} Hz (medium) voice")
+                self._models[path] = voice
+            return path, self._models[path]
+
+    def cache_key(self, voice_name, text):
+        path, _ = self._load(voice_name)
+        return TTSCache.make_key(os.path.basename(path), "piper", OUTPUT_FORMAT, {}, text)
+
+    def stream(self, voice_name, text, lease=None):
+        _, voice = self._load(voice_name)
+        with self._slots:
+            if hasattr(voice, "synthesize_stream_raw"):
+                for chunk in voice.synthesize_stream_raw(text):
+                    yield chunk
+            else:  # piper-tts >= 1.3 yields AudioChunk objects
+                for chunk in voice.synthesize(text):
+                    yield chunk.audio_int16_bytes
+
+class StubBackend(TTSBackend):
+    """Offline stand-in producing tones with synthetic timestamps. Never cached."""
+
+    name = "stub"
+    supports_timestamps = True
+
+    def voices(self):
+        return {name: "stub" for name in VOICE_MAPPING}
+
+    def stream(self, voice_name, text, lease=None):
+        pcm, _ = synthesize_with_timestamps_stub(text)
+        yield pcm
+
+    def synthesize_with_timestamps(self, voice_name, text, priority):
+        return synthesize_with_timestamps_stub(text)
+
+def select_backend(backends, payload):
+    """Pick the backend for a request.
+
+    An explicit "backend" is honoured or rejected. Otherwise drafts use
+    TTS_DRAFT_BACKEND and everything else TTS_DEFAULT_BACKEND, falling back
+    to the local engine when the preferred one is not configured.
+    """
+    requested = payload.get("backend")
+    if requested:
+        if requested not in backends:
+            raise ValueError(f"Unknown TTS backend: {requested}")
+        if not backends[requested].available():
+            raise BackendUnavailable(f"TTS backend not available: {requested}")
+        return backends[requested]
+
+    preferred = TTS_DRAFT_BACKEND if payload.get("draft") else TTS_DEFAULT_BACKEND
+    for name in (preferred, "local"):
+        backend = backends.get(name)
+        if backend and backend.available():
+            return backend
+    raise BackendUnavailable(f"No TTS backend available (wanted {preferred})")
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.expanduser("~/.cache/deepflix/tts"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))  # 2 GB
+
+class TTSCache:
+    """Content-addressed on-disk cache of synthesised audio with LRU eviction.
+
+    Entries are keyed by everything that affects the audio, so any change to
+    the voice, model, format or settings produces a new entry. Recency is
+    tracked through file modification times, which survive restarts.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    @staticmethod
+    def make_key(voice_id, model_id, output_format, voice_settings, text):
+        """Return the cache key for a synthesis request."""
+        key_data = json.dumps({
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "output_format": output_format,
+            "voice_settings": voice_settings,
+            "text": text
+        }, sort_keys=True)
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, destination):
+        """Link or copy a cached entry to destination. Returns True on a hit."""
+        entry = self._entry_path(key)
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            try:
+                os.link(entry, destination)
+            except OSError:
+                shutil.copy2(entry, destination)
+        except FileNotFoundError:
+            # Not cached, or evicted by another request since the lookup began
+            with self._lock:
+                self.misses += 1
+            return False
+        try:
+            os.utime(entry)  # Mark as recently used
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, source):
+        """Add a synthesised file to the cache and evict old entries if over the cap."""
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+        # Copy then rename so a concurrent fetch never sees a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry))
+        os.close(fd)
+        shutil.copyfile(source, temp_path)
+        new_size = os.path.getsize(temp_path)
+
+        with self._lock:
+            # Overwriting an entry replaces its bytes rather than adding to them
+            old_size = os.path.getsize(entry) if os.path.exists(entry) else 0
+            os.replace(temp_path, entry)
+            self._total_bytes += new_size - old_size
+            over_cap = self._total_bytes > self.max_bytes
+        if over_cap:
+            self.evict()
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = self._scan()
+        total_bytes = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            evicted += 1
+
+        with self._lock:
+            self._total_bytes = total_bytes
+        return evicted
+
+    def stats(self):
+        """Return hit/miss counters for the health endpoint."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size_bytes": self._total_bytes
+            }
@@ -0,0 +1,216 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+
+ELEVENLABS_MAX_CONCURRENCY = int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", 4))  # Keep at or below the plan's limit
+ELEVENLABS_CHARS_PER_MINUTE = int(os.getenv("ELEVENLABS_CHARS_PER_MINUTE", 20000))
+GATEWAY_QUEUE_TIMEOUT = float(os.getenv("GATEWAY_QUEUE_TIMEOUT", 300))  # Seconds a request may wait for a slot
+GATEWAY_MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", 4))  # Retries after a 429 from ElevenLabs
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))  # Seconds the breaker stays open
+
+# Lower value is served first; interactive requests overtake queued batch work
+LANES = {"interactive": 0, "batch": 1}
+
+class GatewayUnavailable(Exception):
+    """Raised when a request cannot be sent upstream now; clients should retry after `retry_after`."""
+
+    def __init__(self, message, retry_after=5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def error_status(error):
+    """Return the HTTP status carried by an SDK or requests error, if any."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def error_retry_after(error, default):
+    """Return the Retry-After seconds carried by an error, or `default`."""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return default
+
+class Lease:
+    """One admitted upstream request. Release it exactly once with the outcome."""
+
+    def __init__(self, gateway, cost):
+        self.gateway = gateway
+        self.cost = cost
+        self.attempts = 0
+        self._released = False
+
+    def backoff(self, error):
+        """Handle a 429 while holding the slot. Returns True if the caller should retry."""
+        if error_status(error) != 429 or self.attempts >= GATEWAY_MAX_RETRIES:
+            return False
+        wait_time = error_retry_after(error, 2 ** self.attempts)
+        self.attempts += 1
+        self.gateway.record_throttle(wait_time)
+        time.sleep(wait_time)
+        return True
+
+    def release(self, error=None):
+        if not self._released:
+            self._released = True
+            self.gateway.release(error)
+
+class TTSGateway:
+    """Admission control in front of the ElevenLabs API.
+
+    Requests wait in priority lanes until a concurrency slot is free and
+    the character bucket (refilled continuously at chars_per_minute) can
+    cover their text. A 429 pauses admission and empties the bucket, and
+    repeated upstream failures open a circuit breaker so callers get a
+    fast 503 with Retry-After instead of a hard failure.
+    """
+
+    def __init__(self, max_concurrency=ELEVENLABS_MAX_CONCURRENCY,
+                 chars_per_minute=ELEVENLABS_CHARS_PER_MINUTE,
+                 failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.max_concurrency = max_concurrency
+        self.chars_per_minute = chars_per_minute
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._cond = threading.Condition()
+        self._waiting = []  # Heap of (lane, ticket)
+        self._tickets = itertools.count()
+        self._in_flight = 0
+        self._tokens = float(chars_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+
+        self._counts = {"admitted": 0, "throttled": 0, "failed": 0, "rejected": 0}
+
+    def _refill(self, now):
+        rate = self.chars_per_minute / 60.0
+        self._tokens = min(float(self.chars_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _check_breaker(self, now):
+        if self._state == "open":
+            remaining = self._opened_at + self.cooldown - now
+            if remaining > 0:
+                self._counts["rejected"] += 1
+                raise GatewayUnavailable("ElevenLabs circuit breaker is open", retry_after=remaining)
+            self._state = "half_open"
+
+    def _wait_time(self, entry, cost, now):
+        """Return 0 if `entry` may be admitted now, else how long to wait (None = until notified)."""
+        if self._waiting[0] != entry:
+            return None
+        limit = 1 if self._state == "half_open" else self.max_concurrency
+        if self._in_flight >= limit:
+            return None
+        if self._paused_until > now:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens < cost:
+            return (cost - self._tokens) * 60.0 / self.chars_per_minute
+        return 0
+
+    def acquire(self, chars, priority="interactive", timeout=GATEWAY_QUEUE_TIMEOUT):
+        """Block until the request may be sent and return its Lease."""
+        # Texts longer than a full bucket are admitted once the bucket is full
+        cost = min(max(chars, 1), self.chars_per_minute)
+        entry = (LANES.get(priority, LANES["interactive"]), next(self._tickets))
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._check_breaker(now)
+                    wait_time = self._wait_time(entry, cost, now)
+                    if wait_time == 0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._counts["rejected"] += 1
+                        raise GatewayUnavailable("Timed out waiting for ElevenLabs capacity",
+                                                 retry_after=min(wait_time or 5.0, 60.0))
+                    # Wake at least once a second so breaker cooldowns are noticed
+                    self._cond.wait(min(wait_time if wait_time is not None else 1.0, remaining, 1.0))
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+            self._tokens -= cost
+            self._in_flight += 1
+            self._counts["admitted"] += 1
+        return Lease(self, cost)
+
+    def record_throttle(self, retry_after):
+        """Pause admission after ElevenLabs answered 429; does not count towards the breaker."""
+        with self._cond:
+            self._counts["throttled"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0  # The upstream budget is spent, whatever our estimate says
+
+    def release(self, error=None):
+        """Free the slot and update the breaker from the request's outcome."""
+        status = error_status(error) if error is not None else None
+        with self._cond:
+            self._in_flight -= 1
+            if error is None:
+                self._state = "closed"
+                self._failures = 0
+            elif isinstance(error, Exception) and status != 429 and not (status and 400 <= status < 500):
+                # Server errors and network failures count; bad requests and client disconnects do not
+                self._counts["failed"] += 1
+                self._failures += 1
+                if self._state == "half_open" or self._failures >= self.failure_threshold:
+                    self._state = "open"
+                    self._opened_at = time.monotonic()
+            elif self._state == "half_open":
+                self._state = "closed"
+            self._cond.notify_all()
+
+    def call(self, fn, chars, priority="interactive"):
+        """Run fn() through the gateway, retrying on 429 as ElevenLabs asks."""
+        lease = self.acquire(chars, priority)
+        while True:
+            try:
+                result = fn()
+            except BaseException as e:
+                if isinstance(e, Exception) and lease.backoff(e):
+                    continue
+                lease.release(e)
+                if error_status(e) == 429:
+                    raise GatewayUnavailable("ElevenLabs rate limit persisted",
+                                             retry_after=error_retry_after(e, 30.0)) from e
+                raise
+            lease.release()
+            return result
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            depth = {lane: 0 for lane in LANES}
+            names = {value: name for name, value in LANES.items()}
+            for lane, _ in self._waiting:
+                depth[names[lane]] += 1
+            return {
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_lane": depth,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "chars_available": int(self._tokens),
+                "chars_per_minute": self.chars_per_minute,
+                "paused_for": round(max(0.0, self._paused_until - now), 1),
+                "breaker": self._state,
+                **self._counts
+            }
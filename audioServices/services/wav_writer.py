@@ -0,0 +1,58 @@
+import os
+import wave
+import struct
+
+CANONICAL_SAMPLE_RATE = 22050  # Sample rate used throughout the video pipeline
+CANONICAL_CHANNELS = 1
+CANONICAL_SAMPLE_WIDTH = 2  # 16-bit PCM
+
+class StreamingWavWriter:
+    """Write PCM chunks to a WAV file as they arrive and publish it atomically.
+
+    Audio is written to `{path}.part` and renamed into place by commit(), so
+    readers polling for the final path never see a partial file.
+    """
+
+    def __init__(self, path, sample_rate=CANONICAL_SAMPLE_RATE, channels=CANONICAL_CHANNELS,
+                 sample_width=CANONICAL_SAMPLE_WIDTH):
+        self.path = str(path)
+        self.temp_path = f"{self.path}.part"
+        self.frame_size = channels * sample_width
+        self._pending = b""
+        self._wav = wave.open(self.temp_path, "wb")
+        self._wav.setnchannels(channels)
+        self._wav.setsampwidth(sample_width)
+        self._wav.setframerate(sample_rate)
+
+    def write(self, chunk):
+        """Append raw PCM bytes, holding back any partial frame for the next chunk."""
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self.frame_size
+        self._pending = data[usable:]
+        if usable:
+            self._wav.writeframes(data[:usable])
+
+    def commit(self):
+        """Finalise the header and rename the file into place."""
+        self._wav.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """Discard the partial file."""
+        try:
+            self._wav.close()
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+def streaming_wav_header(sample_rate=CANONICAL_SAMPLE_RATE, channels=CANONICAL_CHANNELS,
+                         sample_width=CANONICAL_SAMPLE_WIDTH):
+    """Return a WAV header for a stream of unknown length, for chunked HTTP responses."""
+    unknown_size = 0xFFFFFFFF
+    byte_rate = sample_rate * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", unknown_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate,
+                                channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", unknown_size)
+    )
@@ -0,0 +1,65 @@
+from services.batch_narration import (
+    SCENE_SEPARATOR, build_batch_text, plan_batches, split_by_alignment, synthesize_with_timestamps_stub
+)
+from services.tts_backends import StubBackend
+from services.wav_writer import CANONICAL_SAMPLE_RATE, CANONICAL_SAMPLE_WIDTH
+
+SECONDS_PER_CHAR = 0.06  # Stub default
+
+def test_plan_batches_packs_scenes_under_the_limit():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 90]
+    batches = plan_batches(texts, max_chars=100)
+    assert batches == [[0, 1], [2], [3]]
+    for batch in batches:
+        joined, _ = build_batch_text([texts[i] for i in batch])
+        assert len(joined) <= 100 or len(batch) == 1
+
+def test_plan_batches_keeps_an_oversized_scene_on_its_own():
+    assert plan_batches(["x" * 150, "y"], max_chars=100) == [[0], [1]]
+    assert plan_batches([]) == []
+
+def test_build_batch_text_spans_index_each_scene():
+    texts = ["First line.", "Second.", "Third one."]
+    joined, spans = build_batch_text(texts)
+    assert joined == SCENE_SEPARATOR.join(texts)
+    assert [joined[start:end] for start, end in spans] == texts
+
+def test_split_by_alignment_cuts_inside_the_pauses():
+    texts = ["Hello there.", "General Kenobi.", "Bold one."]
+    joined, spans = build_batch_text(texts)
+    pcm, alignment = StubBackend().synthesize_with_timestamps("default", joined, "batch")
+    clips = split_by_alignment(pcm, alignment, spans)
+
+    assert len(clips) == len(texts)
+    assert b"".join(clips) == pcm  # Nothing lost or duplicated at the cuts
+
+    frames_per_char = int(SECONDS_PER_CHAR * CANONICAL_SAMPLE_RATE)
+    for clip, text in zip(clips, texts):
+        assert len(clip) % CANONICAL_SAMPLE_WIDTH == 0
+        # Each clip holds its own speech plus part of the neighbouring pauses
+        speech_frames = len(text) * frames_per_char
+        pause_frames = len(SCENE_SEPARATOR) * frames_per_char
+        assert speech_frames <= len(clip) // CANONICAL_SAMPLE_WIDTH <= speech_frames + pause_frames
+
+def test_split_by_alignment_never_clips_speech():
+    texts = ["One.", "Two words.", "Three short words."]
+    joined, spans = build_batch_text(texts)
+    pcm, alignment = synthesize_with_timestamps_stub(joined)
+    clips = split_by_alignment(pcm, alignment, spans)
+
+    frames_per_char = int(SECONDS_PER_CHAR * CANONICAL_SAMPLE_RATE)
+    offset = 0
+    for clip, (start, end) in zip(clips, spans):
+        clip_start = offset // CANONICAL_SAMPLE_WIDTH
+        clip_end = clip_start + len(clip) // CANONICAL_SAMPLE_WIDTH
+        assert clip_start <= start * frames_per_char
+        assert end * frames_per_char <= clip_end
+        offset += len(clip)
+
+def test_split_by_alignment_falls_back_to_character_position_for_silent_scenes():
+    texts = ["Spoken.", "   ", "Also spoken."]
+    joined, spans = build_batch_text(texts)
+    pcm, alignment = synthesize_with_timestamps_stub(joined)
+    clips = split_by_alignment(pcm, alignment, spans)
+    assert len(clips) == 3
+    assert b"".join(clips) == pcm
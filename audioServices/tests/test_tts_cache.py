@@ -0,0 +1,84 @@
+import os
+
+from services.tts_cache import TTSCache
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\x01" * size)
+    return path
+
+def age(cache, key, seconds_ago):
+    path = cache._entry_path(key)
+    mtime = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+def test_fetch_reports_hits_and_misses(tmp_path):
+    cache = TTSCache(str(tmp_path / "cache"), max_bytes=1000)
+    key = TTSCache.make_key("voice", "model", "pcm_22050", {}, "Hello")
+    destination = str(tmp_path / "out.wav")
+
+    assert not cache.fetch(key, destination)
+    cache.store(key, write(str(tmp_path / "src.wav"), 100))
+    assert cache.fetch(key, destination)
+    assert os.path.getsize(destination) == 100
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size_bytes": 100}
+
+def test_make_key_depends_on_every_setting():
+    base = ("voice", "model", "pcm_22050", {"stability": 0.0}, "Hello")
+    keys = {TTSCache.make_key(*base)}
+    for i, changed in enumerate(["other", "model2", "pcm_44100", {"stability": 0.5}, "Hello!"]):
+        args = list(base)
+        args[i] = changed
+        keys.add(TTSCache.make_key(*args))
+    assert len(keys) == 6
+
+def test_store_evicts_least_recently_used(tmp_path):
+    cache = TTSCache(str(tmp_path / "cache"), max_bytes=250)
+    source = write(str(tmp_path / "src.wav"), 100)
+
+    cache.store("aa" * 32, source)
+    cache.store("bb" * 32, source)
+    age(cache, "aa" * 32, 20)
+    age(cache, "bb" * 32, 10)
+    # Reading the oldest entry makes it the most recently used
+    assert cache.fetch("aa" * 32, str(tmp_path / "out.wav"))
+
+    cache.store("cc" * 32, source)
+    assert os.path.exists(cache._entry_path("aa" * 32))
+    assert not os.path.exists(cache._entry_path("bb" * 32))
+    assert os.path.exists(cache._entry_path("cc" * 32))
+    assert cache.stats()["size_bytes"] == 200
+
+def test_overwriting_an_entry_does_not_inflate_the_size(tmp_path):
+    cache = TTSCache(str(tmp_path / "cache"), max_bytes=250)
+    key = "dd" * 32
+    cache.store(key, write(str(tmp_path / "small.wav"), 100))
+    for _ in range(5):
+        cache.store(key, write(str(tmp_path / "big.wav"), 150))
+    assert cache.stats()["size_bytes"] == 150
+    assert os.path.exists(cache._entry_path(key))
+
+def test_size_is_recovered_from_disk_on_restart(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = TTSCache(cache_dir, max_bytes=1000)
+    source = write(str(tmp_path / "src.wav"), 100)
+    cache.store("aa" * 32, source)
+    cache.store("bb" * 32, source)
+
+    reopened = TTSCache(cache_dir, max_bytes=150)
+    assert reopened.stats()["size_bytes"] == 200
+    assert reopened.evict() == 1
+    assert reopened.stats()["size_bytes"] == 100
+
+def test_entry_evicted_during_fetch_is_a_miss(tmp_path, monkeypatch):
+    cache = TTSCache(str(tmp_path / "cache"), max_bytes=1000)
+    key = "cc" * 32
+    cache.store(key, write(str(tmp_path / "src.wav"), 100))
+
+    def evicted_first(source, destination):
+        os.remove(source)  # Another request evicts the entry between lookup and link
+        raise OSError("cross-device link")
+    monkeypatch.setattr(os, "link", evicted_first)
+
+    assert not cache.fetch(key, str(tmp_path / "out.wav"))
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from services import tts_gateway
+from services.tts_gateway import GatewayUnavailable, TTSGateway
+
+class UpstreamError(Exception):
+    """Shaped like an SDK error: carries a status code and response headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff sleeps instead of waiting them out."""
+    calls = []
+    monkeypatch.setattr(tts_gateway.time, "sleep", calls.append)
+    return calls
+
+def test_token_bucket_admits_up_to_its_size_then_queues():
+    gateway = TTSGateway(max_concurrency=4, chars_per_minute=600)  # 10 chars per second
+    gateway.acquire(600).release()
+
+    with pytest.raises(GatewayUnavailable) as exc:
+        gateway.acquire(300, timeout=0.05)
+    # The bucket needs about 30 s to cover the request
+    assert 25 <= exc.value.retry_after <= 30
+    assert gateway.stats()["rejected"] == 1
+
+def test_token_bucket_refills_over_time():
+    gateway = TTSGateway(max_concurrency=4, chars_per_minute=6000)  # 100 chars per second
+    gateway.acquire(6000).release()
+    lease = gateway.acquire(20, timeout=2)  # Admitted after about 0.2 s of refill
+    lease.release()
+    assert gateway.stats()["admitted"] == 2
+
+def test_oversized_text_is_admitted_once_the_bucket_is_full():
+    gateway = TTSGateway(chars_per_minute=600)
+    gateway.acquire(10_000).release()
+    assert gateway.stats()["chars_available"] == 0
+
+def test_concurrency_limit_blocks_until_a_slot_is_released():
+    gateway = TTSGateway(max_concurrency=1, chars_per_minute=10_000)
+    first = gateway.acquire(10)
+    with pytest.raises(GatewayUnavailable):
+        gateway.acquire(10, timeout=0.05)
+
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: (gateway.acquire(10, timeout=2).release(), admitted.set()))
+    waiter.start()
+    first.release()
+    waiter.join(2)
+    assert admitted.is_set()
+
+def test_call_retries_a_429_after_the_retry_after_header(sleeps):
+    gateway = TTSGateway(chars_per_minute=10_000)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise UpstreamError(429, {"retry-after": "7"})
+        return "audio"
+
+    assert gateway.call(flaky, 10) == "audio"
+    assert sleeps == [7.0]
+    stats = gateway.stats()
+    assert stats["throttled"] == 1
+    assert stats["chars_available"] < 10  # A 429 empties the bucket
+    assert stats["paused_for"] > 0
+    assert stats["in_flight"] == 0
+
+def test_call_backs_off_exponentially_without_retry_after(sleeps, monkeypatch):
+    monkeypatch.setattr(tts_gateway, "GATEWAY_MAX_RETRIES", 3)
+    gateway = TTSGateway(chars_per_minute=10_000)
+
+    def throttled():
+        raise UpstreamError(429)
+
+    with pytest.raises(GatewayUnavailable) as exc:
+        gateway.call(throttled, 10)
+    assert sleeps == [1, 2, 4]
+    assert exc.value.retry_after == 30.0
+    # Throttling does not count towards the breaker
+    assert gateway.stats()["breaker"] == "closed"
+
+def test_persistent_429_reports_the_upstream_retry_after(sleeps, monkeypatch):
+    monkeypatch.setattr(tts_gateway, "GATEWAY_MAX_RETRIES", 0)
+    gateway = TTSGateway(chars_per_minute=10_000)
+
+    def throttled():
+        raise UpstreamError(429, {"Retry-After": "12"})
+
+    with pytest.raises(GatewayUnavailable) as exc:
+        gateway.call(throttled, 10)
+    assert exc.value.retry_after == 12.0
+
+def test_server_errors_open_the_breaker_and_client_errors_do_not():
+    gateway = TTSGateway(chars_per_minute=10_000, failure_threshold=2, cooldown=60)
+
+    def bad_request():
+        raise UpstreamError(400)
+
+    def server_error():
+        raise UpstreamError(503)
+
+    for fn in (bad_request, bad_request, server_error):
+        with pytest.raises(UpstreamError):
+            gateway.call(fn, 10)
+    assert gateway.stats()["breaker"] == "closed"
+
+    with pytest.raises(UpstreamError):
+        gateway.call(server_error, 10)
+    assert gateway.stats()["breaker"] == "open"
+
+    with pytest.raises(GatewayUnavailable) as exc:
+        gateway.acquire(10)
+    assert 0 < exc.value.retry_after <= 60
@@ -3,6 +3,7 @@ import os
 import time
 import subprocess
 import logging
+import threading
 import requests
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -11,10 +12,11 @@ import glob
 import random
 from dotenv import load_dotenv
 
-from services.narration_service import generate_narration, estimate_text_duration, adjust_text_for_duration, select_voice
+from services.narration_service import generate_narration, generate_narrations, generate_narrations_batch, estimate_text_duration, adjust_text_for_duration, select_voice, prepare_narration_folder, fit_narration, plan_clip_duration, MAX_CLIP_DURATION
 from services.music_service import generate_music_score, add_background_music
-from services.firebase_service import validate_firebase_connections, upload_video_to_firebase, update_firestore_with_video_url
-from services.media_service import merge_video_audio, concatenate_videos
+from services.firebase_service import validate_firebase_connections, upload_video_to_firebase, update_firestore_with_video_url, upload_file_to_firebase, update_firestore_with_scene, get_movie_voice, update_firestore_with_voice
+from services.media_service import merge_video_audio, concatenate_videos, get_media_duration, get_audio_duration
+from services.delivery_service import package_hls
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +28,9 @@ COMFYUI_OUTPUT_DIR = os.path.join(COMFYUI_BASE_DIR, "output", "output")
 TTS_API_URL = "http://localhost:5010/generate-voice"
 MUSIC_GEN_API_URL = "http://localhost:5009/generate"
 VIDEO_GENERATION_TIMEOUT = 1800  # 30 minutes timeout
+HLS_DELIVERY_ENABLED = os.getenv("HLS_DELIVERY_ENABLED", "true").lower() in ("true", "1", "t")
+SCENE_PUBLISHING_ENABLED = os.getenv("SCENE_PUBLISHING_ENABLED", "true").lower() in ("true", "1", "t")
+NARRATION_MODE = os.getenv("NARRATION_MODE", "batch")  # "batch" (one TTS call per movie) or "concurrent"
 
 app = Flask(__name__)
 CORS(app)
@@ -72,8 +77,8 @@ def validate_clip_action(clip_action, duration):
 
 def build_video_workflow(image_path, clip_action, output_folder, clip_duration=3.0625, transition_type="none", seed=1):
     """Constructs the ComfyUI workflow for video generation."""
-    # Cap clip_duration at 6 seconds to prevent OOM
-    clip_duration = min(float(clip_duration), 6.0)
+    # Cap clip_duration to prevent OOM; narration is fitted to the same cap before rendering
+    clip_duration = min(float(clip_duration), MAX_CLIP_DURATION)
     
     # Calculate frames based on duration + 1 second buffer
     FPS = 24
@@ -299,6 +304,51 @@ def log_processing_stats(logger, sequence_data, processed_scenes):
     
     logger.info("=== End Statistics ===\n")
 
+def publish_scene(folder_id, base_name, merged_output):
+    """Upload a merged scene and record it on the movie so the UI can play it early."""
+    try:
+        scene_number = int(base_name.split("_")[1])
+        duration = get_media_duration(merged_output)
+
+        storage_path = f"movies/{folder_id}/scenes/{os.path.basename(merged_output)}"
+        print(f"📤 Publishing scene {scene_number} ({duration:.2f}s)")
+        scene_url = upload_file_to_firebase(merged_output, storage_path)
+
+        return update_firestore_with_scene(folder_id, scene_number, scene_url, duration)
+    except Exception as e:
+        # Publishing is best-effort; the final movie is still uploaded at the end
+        print(f"⚠️ Failed to publish scene {base_name}: {str(e)}")
+        return False
+
+def merge_scene(output_folder, video_file, silent=False):
+    """Merge a rendered clip with its narration. Returns (base_name, merged path), or None if it has no audio."""
+    base_name = os.path.splitext(os.path.basename(video_file))[0].replace("__00001", "")
+    merged_output = os.path.join(output_folder, f"{base_name}_final.mp4")
+    
+    print(f"\nProcessing video: {base_name}")
+    
+    audio_patterns = [
+        os.path.join(output_folder, f"{base_name}__00001.wav"),
+        os.path.join(output_folder, f"{base_name}__00001_.wav"),
+        os.path.join(output_folder, f"{base_name}___00001_.wav")
+    ]
+    
+    audio_file = None
+    for pattern in audio_patterns:
+        if os.path.exists(pattern):
+            audio_file = pattern
+            print(f"Found audio file: {pattern}")
+            break
+    
+    if not audio_file:
+        print(f"No audio file found for: {base_name} - skipping")
+        return None
+    
+    print(f"Merging with audio file: {audio_file}")
+    if not merge_video_audio(video_file, audio_file, merged_output, silent=silent):
+        return None
+    return base_name, merged_output
+
 def process_video_generation(folder_id, data):
     """Process video generation for a sequence of images in strict sequential order."""
     output_folder = os.path.join(COMFYUI_OUTPUT_DIR, folder_id)
@@ -319,108 +369,118 @@ def process_video_generation(folder_id, data):
     print("\nSequence Data Structure:")
     print(json.dumps(sequence_data, indent=2))
     
-    # Phase 1: Generate background music
-    print("\n=== Phase 1: Generating Background Music ===")
-    music_score = data.get("music_score")
-    
-    if music_score:
-        print("Found music score in data")
-        success = generate_music_score(output_folder, music_score)
-        if not success:
-            return {"status": "error", "message": "Failed to generate background music"}
-    else:
-        print("No music score found in data")
+    # Select voice once for the entire movie, reusing the one stored by a previous run
+    selected_voice = get_movie_voice(folder_id)
+    if not selected_voice:
+        selected_voice = select_voice(data.get("character"), folder_id)
+        update_firestore_with_voice(folder_id, selected_voice)
+    print(f"\n🎙️ Selected voice for entire movie: {selected_voice}")
     
-    # Phase 2: Generate all videos
-    print("\n=== Phase 2: Generating Videos ===")
+    # Phase 1: Narrate the spoken scenes up front. Narration is cheap next to video,
+    # so each scene can be merged and published as soon as its clip is rendered
+    print("\n=== Phase 1: Generating Narration ===")
+    scene_items = []
+    narration_scenes = []
     for item in sequence_data:
         scene_number = item.get("sequence_number")
         if not scene_number:
             continue
-            
-        print(f"\nProcessing scene {scene_number}...")
+        
         base_name = f"scene_{format_sequence_number(scene_number)}_{item.get('type', 'character')}_00001_"
-        video_file = os.path.join(output_folder, f"{base_name}__00001.mp4")
+        silent = "voice_narration" in item and (not item["voice_narration"] or item["voice_narration"].strip() == "...")
+        if "voice_narration" in item and not silent:
+            # Clips cannot run past MAX_CLIP_DURATION, so narration that would is shortened first
+            item = dict(item, voice_narration=fit_narration(item["voice_narration"], selected_voice))
+        scene_items.append((item, base_name, silent))
+        if "voice_narration" in item and not silent:
+            narration_scenes.append((scene_number, item["voice_narration"], os.path.join(output_folder, f"{base_name}.png")))
+    
+    # Drafts go to the TTS service's draft backend (local by default); "tts_backend" pins one
+    tts_options = {}
+    if data.get("draft"):
+        tts_options["draft"] = True
+    if data.get("tts_backend"):
+        tts_options["backend"] = data["tts_backend"]
+    prepare_narration_folder(output_folder, selected_voice, tts_options)
+    
+    logger = setup_detailed_logging(folder_id)
+    narrate = generate_narrations_batch if NARRATION_MODE == "batch" else generate_narrations
+    narration_results = narrate(
+        narration_scenes,
+        output_folder,
+        logger,
+        data.get("character"),  # Pass the character data
+        selected_voice,  # Pass the pre-selected voice
+        tts_options
+    ) if narration_scenes else {}
+    
+    for scene_number, (success, status) in sorted(narration_results.items()):
+        if not success:
+            return {"status": "error", "message": f"Failed to generate audio for scene {scene_number}: {status}"}
+    
+    # Phase 2: Render each scene, then merge and publish it right away
+    print("\n=== Phase 2: Generating, Merging and Publishing Scenes ===")
+    merged_videos = []
+    for item, base_name, silent in scene_items:
+        scene_number = item["sequence_number"]
+        print(f"\nProcessing scene {scene_number}...")
+        image_path = os.path.join(output_folder, f"{base_name}.png")
+        
+        # Narration is already synthesised, so the clip is sized from its measured length
+        narration_file = os.path.join(output_folder, f"{base_name}_00001_.wav")
+        narration_duration = get_audio_duration(narration_file) if not silent and os.path.exists(narration_file) else None
         
         success = generate_video(
-            os.path.join(output_folder, f"{base_name}.png"),
-            video_file,
-            item.get("clip_duration", 3.0625),
+            image_path,
+            os.path.join(output_folder, f"{base_name}__00001.mp4"),
+            plan_clip_duration(item, selected_voice, narration_duration),
             item.get("clip_action"),
             seed  # Pass the seed to generate_video
         )
-        
         if not success:
             return {"status": "error", "message": f"Failed to generate video for scene {scene_number}"}
-    
-    # Select voice once for the entire movie
-    selected_voice = select_voice(data.get("character"))
-    print(f"\n🎙️ Selected voice for entire movie: {selected_voice}")
-    
-    # Phase 3: Generate all audio
-    print("\n=== Phase 3: Generating Audio ===")
-    for item in sequence_data:
-        if "voice_narration" not in item:
-            continue
-            
-        scene_number = item.get("sequence_number")
-        base_name = f"scene_{format_sequence_number(scene_number)}_{item.get('type', 'character')}_00001_"
         
-        print(f"\nGenerating audio for scene {scene_number}...")
-        success = generate_narration(
-            item["voice_narration"],
-            os.path.join(output_folder, f"{base_name}.png"),
-            output_folder,
-            setup_detailed_logging(folder_id),
-            data.get("character"),  # Pass the character data
-            selected_voice  # Pass the pre-selected voice
-        )
+        if silent:
+            # Silence is sized to the rendered clip, so it can only be written now
+            success, status = generate_narration(item["voice_narration"], image_path, output_folder, logger,
+                                                 data.get("character"), selected_voice, tts_options)
+            if not success and status != "video_not_found":
+                return {"status": "error", "message": f"Failed to generate audio for scene {scene_number}: {status}"}
+            if not success:
+                # Silent scene without a clip to match; the merge below skips it as before
+                print(f"⚠️ No silent audio created for scene {scene_number}: {status}")
         
-        if not success:
-            return {"status": "error", "message": f"Failed to generate audio for scene {scene_number}"}
+        scene_videos = glob.glob(os.path.join(output_folder, f"scene_{format_sequence_number(scene_number)}_*_00001__00001.mp4"))
+        for video_file in sorted(scene_videos):
+            merged = merge_scene(output_folder, video_file, silent)
+            if merged:
+                merged_videos.append(merged[1])
+                if SCENE_PUBLISHING_ENABLED:
+                    publish_scene(folder_id, *merged)
     
-    # Phase 4: Merge videos with audio
-    print("\n=== Phase 4: Merging Videos with Audio ===")
-    video_files = sorted(glob.glob(os.path.join(output_folder, "scene_*_*_00001__00001.mp4")))
-    merged_videos = []
+    # Phase 3: Generate background music - only the final mix needs it, so it no longer delays the first scene
+    print("\n=== Phase 3: Generating Background Music ===")
+    music_score = data.get("music_score")
     
-    for video_file in video_files:
-        base_name = os.path.splitext(os.path.basename(video_file))[0].replace("__00001", "")
-        merged_output = os.path.join(output_folder, f"{base_name}_final.mp4")
-        
-        print(f"\nProcessing video: {base_name}")
-        
-        audio_patterns = [
-            os.path.join(output_folder, f"{base_name}__00001.wav"),
-            os.path.join(output_folder, f"{base_name}__00001_.wav"),
-            os.path.join(output_folder, f"{base_name}___00001_.wav")
-        ]
-        
-        audio_file = None
-        for pattern in audio_patterns:
-            if os.path.exists(pattern):
-                audio_file = pattern
-                print(f"Found audio file: {pattern}")
-                break
-        
-        if audio_file:
-            print(f"Merging with audio file: {audio_file}")
-            success = merge_video_audio(video_file, audio_file, merged_output)
-            if success:
-                merged_videos.append(merged_output)
-        else:
-            print(f"No audio file found for: {base_name} - skipping")
-            continue
+    if music_score:
+        print("Found music score in data")
+        # Fit the score to the merged scenes' real length instead of looping a fixed clip
+        movie_duration = sum(get_media_duration(path) for path in merged_videos) if merged_videos else None
+        success = generate_music_score(output_folder, music_score, movie_duration, sequence=sequence_data, voice=selected_voice)
+        if not success:
+            return {"status": "error", "message": "Failed to generate background music"}
+    else:
+        print("No music score found in data")
     
-    # Phase 5: Concatenate all scenes
-    print("\n=== Phase 5: Concatenating All Scenes ===")
+    # Phase 4: Concatenate all scenes
+    print("\n=== Phase 4: Concatenating All Scenes ===")
     success = concatenate_videos(output_folder)
     
     if not success:
         return {"status": "error", "message": "Failed to concatenate videos"}
     
-    # Phase 6: Add background music
-    print("\n=== Phase 6: Adding Background Music ===")
+    # Phase 5: Add background music
+    print("\n=== Phase 5: Adding Background Music ===")
     if music_score:
         success = add_background_music(output_folder)
         if not success:
@@ -552,6 +612,20 @@ def generate_video(image_path, output_path, clip_duration=5, clip_action=None, s
         print(f"❌ Error generating video: {str(e)}")
         return False
 
+def start_hls_delivery(final_video_path, output_folder, folder_id, logger):
+    """Package the uploaded movie as HLS on a background thread.
+
+    The MP4 is already live, so a slow or failed packaging run only means
+    the movie has no playlist_url; it never delays or fails the request.
+    """
+    def package():
+        if not package_hls(final_video_path, output_folder, folder_id):
+            logger.warning("HLS packaging failed, the movie is delivered as MP4 only")
+
+    thread = threading.Thread(target=package, name=f"hls-{folder_id}", daemon=True)
+    thread.start()
+    return thread
+
 @app.route("/generateVideos/<folder_id>", methods=["POST"])
 def generate_videos(folder_id):
     """API endpoint to generate images for a sequence of shots."""
@@ -578,7 +652,8 @@ def generate_videos(folder_id):
         if not os.path.exists(final_video_path):
             return jsonify({"error": "Final video not found"}), 500
 
-        # Upload video to Firebase using folder_id as movie_id
+        # Phase 6: The MP4 is the primary delivery, so it is uploaded before anything optional runs
+        print("\n=== Phase 6: Uploading Movie ===")
         try:
             video_url = upload_video_to_firebase(final_video_path, folder_id)
             update_firestore_with_video_url(folder_id, video_url)
@@ -586,9 +661,17 @@ def generate_videos(folder_id):
             logger.error(f"Error uploading to Firebase: {str(e)}")
             return jsonify({"error": "Failed to upload video to Firebase"}), 500
 
+        # Phase 7: HLS is optional; it is packaged in the background and its playlist URL lands in Firestore
+        hls_status = "disabled"
+        if HLS_DELIVERY_ENABLED:
+            print("\n=== Phase 7: Packaging HLS Delivery (background) ===")
+            start_hls_delivery(final_video_path, output_folder, folder_id, logger)
+            hls_status = "packaging"
+
         return jsonify({
             "message": "Video generated and uploaded successfully",
-            "video_url": video_url
+            "video_url": video_url,
+            "hls": hls_status
         }), 200
 
     except Exception as e:
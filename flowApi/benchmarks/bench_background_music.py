@@ -0,0 +1,79 @@
+"""Benchmark the in-process NumPy mixer against the four-pass ffmpeg path.
+
+Builds a synthetic movie (test pattern video + tone narration at 22050 Hz
+mono AAC) and a stereo music track, then times both ways of producing
+final_movie_with_music_smooth.mp4.
+
+Usage (from flowApi/):
+    python -m benchmarks.bench_background_music --duration 600
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import audio_mixer
+from services.music_service import add_background_music_ffmpeg
+from services.media_service import get_media_duration
+
+def build_fixtures(work_dir, duration, music_duration):
+    """Create final_movie.mp4 and output.wav like Phase 5 and Phase 1 leave them."""
+    movie = os.path.join(work_dir, "final_movie.mp4")
+    music = os.path.join(work_dir, "output.wav")
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size=1024x576:rate=24:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=22050:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-ac", "1", movie
+    ], check=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={music_duration}",
+        "-ac", "2", "-acodec", "pcm_s16le", music
+    ], check=True)
+
+def timed(label, func):
+    start = time.perf_counter()
+    ok = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.2f}s  {'ok' if ok else 'FAILED'}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark background music mixing")
+    parser.add_argument("--duration", type=float, default=300, help="Movie length in seconds")
+    parser.add_argument("--music-duration", type=float, default=95, help="Music length in seconds")
+    args = parser.parse_args()
+
+    if not audio_mixer.is_available():
+        print("❌ NumPy is not installed; the in-process mixer cannot run")
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="mix_bench_")
+    try:
+        print(f"Building fixtures in {work_dir} ({args.duration:.0f}s movie, {args.music_duration:.0f}s music)...")
+        build_fixtures(work_dir, args.duration, args.music_duration)
+        output = os.path.join(work_dir, "final_movie_with_music_smooth.mp4")
+
+        # Both engines get the same probed duration, as add_background_music passes it, so neither times a probe
+        video_duration = get_media_duration(os.path.join(work_dir, "final_movie.mp4"))
+        ffmpeg_time = timed("ffmpeg (4 passes)", lambda: add_background_music_ffmpeg(work_dir, video_duration))
+        os.remove(output)
+        numpy_time = timed("numpy (single mux)", lambda: audio_mixer.mix_background_music(
+            os.path.join(work_dir, "final_movie.mp4"), os.path.join(work_dir, "output.wav"), output,
+            video_duration=video_duration))
+
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"\nSpeedup: {ffmpeg_time / numpy_time:.2f}x")
+        print(f"Peak RSS of this process: {peak_mb:.1f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import struct
+import subprocess
+
+try:
+    import numpy as np
+except ImportError:  # The ffmpeg mixing path in music_service is used instead
+    np = None
+
+MIX_SAMPLE_RATE = 22050  # Matches the narration rate produced by the TTS service
+MIX_CHUNK_SECONDS = 10  # Audio processed per chunk; keeps memory flat for long movies
+MUSIC_GAIN = 0.15
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def is_available():
+    """Return True when NumPy is installed and the in-process mixer can run."""
+    return np is not None
+
+def read_wav_layout(wav_path):
+    """Parse a WAV header and return (format, channels, rate, bits, data_offset, data_size)."""
+    with open(wav_path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"Not a WAV file: {wav_path}")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No data chunk in: {wav_path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                chunk = f.read(chunk_size)
+                audio_format, channels, rate, _, _, bits = struct.unpack("<HHIIHH", chunk[:16])
+                if audio_format == WAVE_FORMAT_EXTENSIBLE and len(chunk) >= 26:
+                    audio_format = struct.unpack("<H", chunk[24:26])[0]
+                fmt = (audio_format, channels, rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"Data chunk before fmt chunk in: {wav_path}")
+                data_offset = f.tell()
+                # Streaming writers leave the size unset; trust the file length instead
+                data_size = min(chunk_size, os.path.getsize(wav_path) - data_offset)
+                return fmt + (data_offset, data_size)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def map_wav(wav_path):
+    """Memory-map WAV sample data as a (frames, channels) array and its sample rate."""
+    audio_format, channels, rate, bits, data_offset, data_size = read_wav_layout(wav_path)
+
+    if audio_format == WAVE_FORMAT_PCM and bits == 16:
+        dtype, scale = np.int16, 1.0 / 32768.0
+    elif audio_format == WAVE_FORMAT_PCM and bits == 32:
+        dtype, scale = np.int32, 1.0 / 2147483648.0
+    elif audio_format == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        dtype, scale = np.float32, 1.0
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format={audio_format}, bits={bits})")
+
+    frames = data_size // (channels * (bits // 8))
+    samples = np.memmap(wav_path, dtype=dtype, mode="r", offset=data_offset, shape=(frames, channels))
+    return samples, rate, scale
+
+class MusicBed:
+    """Faded music track rendered on demand at the mix sample rate.
+
+    When the track is at least as long as the movie it plays once, fading
+    in at the start and out at the end of the movie. Shorter tracks loop,
+    with the same per-loop fade in/out as the ffmpeg path. Samples are
+    gathered straight from the memory-mapped source with linear
+    interpolation, so no intermediate WAV files are written.
+    """
+
+    def __init__(self, music_path, sample_rate=MIX_SAMPLE_RATE, total_length=None):
+        self.samples, self.source_rate, self.scale = map_wav(music_path)
+        self.sample_rate = sample_rate
+        self.source_frames = self.samples.shape[0]
+        self.duration = self.source_frames / self.source_rate
+        self.loop_length = int(self.duration * sample_rate)
+        self.looped = total_length is None or self.loop_length < total_length
+        self.end = self.loop_length if self.looped else total_length
+        self.fade_length = int(min(2.0, self.duration * 0.1) * sample_rate)
+
+    def render(self, start, count):
+        """Return `count` mono float32 samples starting at output sample `start`."""
+        position = np.arange(start, start + count, dtype=np.int64)
+        if self.looped:
+            position %= self.loop_length
+
+        source_position = position * (self.source_rate / self.sample_rate)
+        index = np.minimum(source_position.astype(np.int64), self.source_frames - 1)
+        next_index = np.minimum(index + 1, self.source_frames - 1)
+        frac = (source_position - index).astype(np.float32)[:, None]
+
+        low = self.samples[index].astype(np.float32)
+        high = self.samples[next_index].astype(np.float32)
+        mono = (low + (high - low) * frac).mean(axis=1) * self.scale
+
+        if self.fade_length > 0:
+            envelope = np.clip(
+                np.minimum(position, self.end - position) / self.fade_length, 0.0, 1.0
+            ).astype(np.float32)
+            mono *= envelope
+
+        return mono
+
+def _decode_command(input_video, sample_rate):
+    return [
+        "ffmpeg", "-v", "error", "-i", input_video,
+        "-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate),
+        "pipe:1"
+    ]
+
+def _mux_command(input_video, output_video, sample_rate):
+    return [
+        "ffmpeg", "-y", "-v", "error", "-i", input_video,
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "2", "-i", "pipe:0",
+        "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+        output_video
+    ]
+
+def mix_background_music(input_video, music_path, output_video, music_gain=MUSIC_GAIN,
+                         sample_rate=MIX_SAMPLE_RATE, chunk_seconds=MIX_CHUNK_SECONDS,
+                         video_duration=None):
+    """Mix a music bed under the movie's narration in a single mux pass.
+
+    The narration track is decoded to a PCM pipe, mixed chunk by chunk with
+    the memory-mapped music, and the stereo result is piped straight into
+    the final ffmpeg mux. Passing video_duration lets a fitted score fade
+    out with the movie instead of looping. Returns True on success.
+    """
+    total_length = int(video_duration * sample_rate) if video_duration else None
+    bed = MusicBed(music_path, sample_rate, total_length)
+    chunk_bytes = int(sample_rate * chunk_seconds) * 2
+
+    decoder = subprocess.Popen(_decode_command(input_video, sample_rate),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    muxer = subprocess.Popen(_mux_command(input_video, output_video, sample_rate),
+                             stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    position = 0
+    try:
+        while True:
+            raw = decoder.stdout.read(chunk_bytes)
+            if not raw:
+                break
+            narration = np.frombuffer(raw[:len(raw) - len(raw) % 2], dtype=np.int16).astype(np.float32) / 32768.0
+
+            mixed = narration + music_gain * bed.render(position, narration.shape[0])
+            np.clip(mixed, -1.0, 1.0, out=mixed)
+            pcm = (mixed * 32767.0).astype(np.int16)
+
+            # Same mix on both channels, as the pan=stereo filter produced
+            muxer.stdin.write(np.repeat(pcm, 2).tobytes())
+            position += narration.shape[0]
+    except BrokenPipeError:
+        pass
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+        muxer.stdin.close()
+
+    stderr = muxer.stderr.read()
+    muxer.wait()
+    if muxer.returncode != 0 or decoder.returncode != 0:
+        print(f"❌ Error in in-process mix: {stderr.decode(errors='replace') if stderr else 'decoder failed'}")
+        return False
+
+    print(f"Mixed {position / sample_rate:.2f}s of audio with {bed.duration:.2f}s music bed")
+    return True
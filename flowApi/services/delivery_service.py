@@ -0,0 +1,90 @@
+import os
+import subprocess
+
+from services.firebase_service import upload_file_to_firebase, update_firestore_with_playlist_url
+from services.hls_playlist import read_playlist_entries, rewrite_playlist
+
+HLS_SEGMENT_DURATION = 4  # Target segment length in seconds
+HLS_PLAYLIST_NAME = "playlist.m3u8"
+HLS_INIT_SEGMENT = "init.mp4"
+HLS_PUBLISH_EVERY = 5  # Segments uploaded between playlist updates
+
+def publish_playlist(hls_dir, movie_id, uploaded_urls, playlist_url=None):
+    """Upload the rewritten playlist and record its URL on first publish."""
+    playlist_path = os.path.join(hls_dir, HLS_PLAYLIST_NAME)
+    published_path = os.path.join(hls_dir, f"published_{HLS_PLAYLIST_NAME}")
+
+    if not rewrite_playlist(playlist_path, published_path, uploaded_urls):
+        return playlist_url
+
+    storage_path = f"movies/{movie_id}/hls/{HLS_PLAYLIST_NAME}"
+    url = upload_file_to_firebase(published_path, storage_path)
+    if playlist_url is None:
+        update_firestore_with_playlist_url(movie_id, url)
+        print(f"▶️ Playlist is live: {url}")
+    return url
+
+def upload_segment(hls_dir, movie_id, name, uploaded_urls):
+    """Upload one finished segment (or the init segment) and record its URL."""
+    storage_path = f"movies/{movie_id}/hls/{name}"
+    uploaded_urls[name] = upload_file_to_firebase(os.path.join(hls_dir, name), storage_path)
+    print(f"📤 Uploaded segment: {name}")
+
+def package_hls(input_video, output_folder, movie_id, segment_duration=HLS_SEGMENT_DURATION):
+    """Package a finished video as fMP4 HLS and publish the playlist while its segments upload.
+
+    VideoGenService calls this after the MP4 has been uploaded, on a
+    background thread, so HLS is an optional extra that never delays the
+    MP4. Segmenting with stream copy takes seconds; the uploads are what
+    take time. The segments are uploaded in order, and the EVENT playlist
+    is published once the first segment is up and extended every
+    HLS_PUBLISH_EVERY segments after that. Returns the playlist URL, or
+    None on failure.
+    """
+    try:
+        if not os.path.exists(input_video):
+            print(f"❌ Input video not found: {input_video}")
+            return None
+
+        hls_dir = os.path.join(output_folder, "hls")
+        os.makedirs(hls_dir, exist_ok=True)
+        for stale in os.listdir(hls_dir):
+            os.remove(os.path.join(hls_dir, stale))
+
+        print(f"\n📦 Packaging HLS segments for: {os.path.basename(input_video)}")
+        cmd = [
+            "ffmpeg", "-y", "-v", "error", "-i", input_video,
+            "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(segment_duration),
+            "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", HLS_INIT_SEGMENT,
+            "-hls_segment_filename", os.path.join(hls_dir, "segment_%05d.m4s"),
+            os.path.join(hls_dir, HLS_PLAYLIST_NAME)
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            print(f"❌ Error packaging HLS: {result.stderr}")
+            return None
+
+        init_segment, segments = read_playlist_entries(os.path.join(hls_dir, HLS_PLAYLIST_NAME))
+        uploaded_urls = {}
+        playlist_url = None
+        if init_segment:
+            upload_segment(hls_dir, movie_id, init_segment, uploaded_urls)
+        for count, name in enumerate(segments, 1):
+            upload_segment(hls_dir, movie_id, name, uploaded_urls)
+            # Go live after the first segment, then extend the playlist every few uploads
+            if count < len(segments) and (count == 1 or count % HLS_PUBLISH_EVERY == 0):
+                playlist_url = publish_playlist(hls_dir, movie_id, uploaded_urls, playlist_url)
+
+        # The complete playlist, ending with #EXT-X-ENDLIST
+        playlist_url = publish_playlist(hls_dir, movie_id, uploaded_urls, playlist_url)
+
+        print(f"✅ HLS delivery complete: {len(uploaded_urls)} files uploaded")
+        return playlist_url
+
+    except Exception as e:
+        print(f"❌ Error in package_hls: {str(e)}")
+        return None
@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import threading
+
+DURATION_MODEL_PATH = os.getenv(
+    "DURATION_MODEL_PATH",
+    os.path.expanduser("~/Desktop/ComfyUI/output/duration_model.json")
+)
+
+# Prior used before a voice has any observations: 0.4s per word, short
+# pauses for commas and longer ones at sentence ends
+PRIOR_WEIGHTS = [0.4, 0.15, 0.3, 0.1]
+PRIOR_STRENGTH = 5.0  # How many clips' worth of evidence the prior is worth
+
+FEATURE_NAMES = ["words", "minor_pauses", "major_pauses", "intercept"]
+
+def text_features(text):
+    """Return the features the model uses: words, minor pauses, major pauses, intercept."""
+    words = len(text.split())
+    minor_pauses = len(re.findall(r"[,;:—]|--", text))
+    major_pauses = len(re.findall(r"[.!?]+|\.\.\.|…", text))
+    return [float(words), float(minor_pauses), float(major_pauses), 1.0]
+
+def _solve(matrix, vector):
+    """Solve a small linear system with Gaussian elimination and partial pivoting."""
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, n):
+            factor = a[r][col] / a[col][col]
+            for c in range(col, n + 1):
+                a[r][c] -= factor * a[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (a[r][n] - sum(a[r][c] * x[c] for c in range(r + 1, n))) / a[r][r]
+    return x
+
+class SpeakingRateModel:
+    """Per-voice linear model of narration duration, refined from real clips.
+
+    Each voice keeps the normal equations of a ridge regression pulled
+    towards PRIOR_WEIGHTS, so every observed clip updates the fit exactly
+    and the state stays a few numbers per voice on disk.
+    """
+
+    def __init__(self, path=DURATION_MODEL_PATH):
+        self.path = path
+        self.voices = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.voices = json.load(f).get("voices", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"features": FEATURE_NAMES, "voices": self.voices}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def _state(self, voice):
+        if voice not in self.voices:
+            n = len(PRIOR_WEIGHTS)
+            self.voices[voice] = {
+                "xtx": [[PRIOR_STRENGTH if i == j else 0.0 for j in range(n)] for i in range(n)],
+                "xty": [PRIOR_STRENGTH * w for w in PRIOR_WEIGHTS],
+                "samples": 0
+            }
+        return self.voices[voice]
+
+    def weights(self, voice):
+        """Return the fitted weights for a voice (the prior if it has no clips yet)."""
+        with self._lock:
+            state = self.voices.get(voice)
+            if not state or not state["samples"]:
+                return list(PRIOR_WEIGHTS)
+            return _solve(state["xtx"], state["xty"])
+
+    def predict(self, text, voice):
+        """Predict the narration length of `text` in seconds for `voice`."""
+        if not text or not text.strip():
+            return 0.0
+        weights = self.weights(voice)
+        return max(0.0, sum(w * x for w, x in zip(weights, text_features(text))))
+
+    def seconds_per_word(self, voice):
+        """Return the fitted cost of one word, for trimming text to a duration."""
+        return max(0.1, self.weights(voice)[0])
+
+    def observe(self, text, voice, duration, persist=True):
+        """Update the voice's fit with the real duration of a synthesised clip."""
+        if not text or not text.strip() or duration <= 0:
+            return
+        features = text_features(text)
+        with self._lock:
+            state = self._state(voice)
+            for i, xi in enumerate(features):
+                state["xty"][i] += xi * duration
+                for j, xj in enumerate(features):
+                    state["xtx"][i][j] += xi * xj
+            state["samples"] += 1
+            if persist:
+                self.save()
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_duration_model():
+    """Return the process-wide speaking-rate model, loading it on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = SpeakingRateModel()
+        return _model
@@ -88,4 +88,111 @@ def update_firestore_with_video_url(movie_id, video_url):
         print("✅ Firestore updated successfully")
     except Exception as e:
         print(f"❌ Error updating Firestore: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+def upload_file_to_firebase(local_path, storage_path):
+    """Upload any file to a Firebase Storage path and return the public URL."""
+    try:
+        storage.child(storage_path).put(local_path)
+        return storage.child(storage_path).get_url(None)
+    except Exception as e:
+        print(f"❌ Error uploading {os.path.basename(local_path)} to Firebase: {str(e)}")
+        raise
+
+def update_firestore_with_playlist_url(movie_id, playlist_url):
+    """Update Firestore document with the HLS playlist URL."""
+    try:
+        movie_ref = db.collection('movies').document(movie_id)
+
+        print(f"\n📝 Updating Firestore with playlist URL for movie: {movie_id}")
+        movie_ref.update({
+            'playlist_url': playlist_url,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+        print("✅ Firestore updated successfully")
+    except Exception as e:
+        print(f"❌ Error updating Firestore: {str(e)}")
+        raise
+
+def build_playable_prefix(sequence):
+    """Build the manifest of published scenes that play back-to-back from scene 1."""
+    scenes = []
+    total_duration = 0.0
+    for scene in sorted(sequence, key=lambda item: item.get('sequence_number', 0)):
+        if not scene.get('scene_url'):
+            break
+        scenes.append({
+            'sequence_number': scene.get('sequence_number'),
+            'url': scene['scene_url'],
+            'duration': scene.get('scene_duration', 0.0)
+        })
+        total_duration += scene.get('scene_duration', 0.0)
+
+    return {
+        'scenes': scenes,
+        'scene_count': len(scenes),
+        'duration': round(total_duration, 3)
+    }
+
+@firestore.transactional
+def _record_scene(transaction, doc_ref, sequence_number, scene_url, duration):
+    # Read and write in one transaction so concurrent scene updates cannot drop each other's entries
+    doc = doc_ref.get(transaction=transaction)
+    if not doc.exists:
+        print(f"❌ No movie found with ID: {doc_ref.id}")
+        return None
+
+    sequence = (doc.to_dict() or {}).get('sequence', [])
+    for i, scene in enumerate(sequence):
+        if scene.get('sequence_number', i + 1) == sequence_number:
+            scene['sequence_number'] = sequence_number
+            scene['scene_url'] = scene_url
+            scene['scene_duration'] = round(duration, 3)
+            break
+    else:
+        print(f"⚠️ Scene {sequence_number} not found in movie sequence")
+        return None
+
+    playable_prefix = build_playable_prefix(sequence)
+    transaction.update(doc_ref, {
+        'sequence': sequence,
+        'playable_prefix': playable_prefix,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    return playable_prefix
+
+def update_firestore_with_scene(movie_id, sequence_number, scene_url, duration):
+    """Record a published scene on its sequence entry and refresh the playable prefix."""
+    try:
+        doc_ref = db.collection('movies').document(movie_id)
+        playable_prefix = _record_scene(db.transaction(), doc_ref, sequence_number, scene_url, duration)
+        if playable_prefix is None:
+            return False
+        print(f"✅ Published scene {sequence_number} (playable prefix: {playable_prefix['scene_count']} scenes, {playable_prefix['duration']:.1f}s)")
+        return True
+    except Exception as e:
+        print(f"❌ Error updating Firestore with scene: {str(e)}")
+        return False
+
+def get_movie_voice(movie_id):
+    """Return the narration voice stored on the movie document, if any."""
+    try:
+        doc = db.collection('movies').document(movie_id).get()
+        if doc.exists:
+            return (doc.to_dict() or {}).get('narration_voice')
+    except Exception as e:
+        print(f"⚠️ Could not read narration voice from Firestore: {str(e)}")
+    return None
+
+def update_firestore_with_voice(movie_id, voice):
+    """Store the narration voice so re-runs of the movie use the same narrator."""
+    try:
+        db.collection('movies').document(movie_id).update({
+            'narration_voice': voice,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not store narration voice in Firestore: {str(e)}")
+        return False
@@ -0,0 +1,52 @@
+import os
+
+def read_playlist_entries(playlist_path):
+    """Return the init segment and media segments listed in a playlist."""
+    init_segment = None
+    segments = []
+    if not os.path.exists(playlist_path):
+        return init_segment, segments
+
+    with open(playlist_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                init_segment = line.split('URI="', 1)[1].split('"', 1)[0]
+            elif line and not line.startswith("#"):
+                segments.append(line)
+
+    return init_segment, segments
+
+def rewrite_playlist(playlist_path, output_path, uploaded_urls):
+    """Write a copy of the playlist that points at the uploaded segment URLs.
+
+    Firebase download URLs encode the object path, so segment URIs cannot be
+    resolved relative to the playlist URL and have to be absolute. Segments
+    that are not uploaded yet are left out, which keeps the copy playable.
+    """
+    lines = []
+    pending_extinf = None
+    with open(playlist_path, 'r') as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("#EXT-X-MAP:"):
+                init_segment = line.split('URI="', 1)[1].split('"', 1)[0]
+                if init_segment not in uploaded_urls:
+                    return False
+                lines.append(f'#EXT-X-MAP:URI="{uploaded_urls[init_segment]}"')
+            elif line.startswith("#EXTINF:"):
+                pending_extinf = line
+            elif line and not line.startswith("#"):
+                if line not in uploaded_urls:
+                    break
+                lines.append(pending_extinf)
+                lines.append(uploaded_urls[line])
+                pending_extinf = None
+            elif line.startswith("#EXT-X-ENDLIST"):
+                lines.append(line)
+            elif line:
+                lines.append(line)
+
+    with open(output_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return True
@@ -1,18 +1,101 @@
 import os
+import json
 import time
+import wave
+import threading
 import subprocess
 import glob
 
-def merge_video_audio(video_path, audio_path, output_path):
-    """Merge video and audio files."""
+CLIP_METADATA_FILE = "clip_metadata.json"
+SILENCE_SAMPLE_RATE = 22050  # Matches the narration produced by the TTS service
+
+_clip_metadata_lock = threading.Lock()
+
+def get_media_duration(media_path):
+    """Return the duration of a media file in seconds."""
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", media_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+def get_audio_duration(audio_path):
+    """Return a WAV file's duration from its header, falling back to ffprobe."""
+    try:
+        with wave.open(audio_path, "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError):
+        # Not PCM WAV (e.g. MP3 bytes from an older TTS service)
+        return get_media_duration(audio_path)
+
+def get_clip_duration(video_path):
+    """Return a clip's duration, probing it at most once per file version.
+    
+    Durations are cached in clip_metadata.json next to the clip, keyed by
+    file name, size and modification time, so the narration and merge
+    phases share a single ffprobe per clip.
+    """
+    folder = os.path.dirname(video_path)
+    metadata_path = os.path.join(folder, CLIP_METADATA_FILE)
+    name = os.path.basename(video_path)
+    stat = os.stat(video_path)
+    
+    with _clip_metadata_lock:
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        
+        entry = metadata.get(name)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["duration"]
+        
+        duration = get_media_duration(video_path)
+        metadata[name] = {"size": stat.st_size, "mtime": stat.st_mtime, "duration": duration}
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        return duration
+
+def write_silent_wav(audio_path, duration, sample_rate=SILENCE_SAMPLE_RATE):
+    """Write exactly `duration` seconds of 16-bit mono silence without spawning ffmpeg."""
+    frames = int(round(duration * sample_rate))
+    temp_path = f"{audio_path}.part"
+    with wave.open(temp_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        block = b"\x00\x00" * sample_rate
+        for _ in range(frames // sample_rate):
+            wav.writeframes(block)
+        wav.writeframes(b"\x00\x00" * (frames % sample_rate))
+    os.replace(temp_path, audio_path)
+
+def merge_video_audio(video_path, audio_path, output_path, silent=False):
+    """Merge video and audio files.
+    
+    Silent scenes already have audio of exactly the clip's length, so they
+    skip the duration checks and padding filter.
+    """
     try:
+        if silent:
+            print(f"\n🔇 Merging silent scene: {os.path.basename(video_path)}")
+            cmd = [
+                "ffmpeg", "-y", "-v", "error", "-i", video_path, "-i", audio_path,
+                "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-shortest", output_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"❌ Failed to merge silent scene: {result.stderr}")
+                return False
+            print(f"✅ Successfully merged video and audio: {os.path.basename(output_path)}")
+            return True
+        
         # First get video duration
-        video_duration_cmd = f"ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {video_path}"
-        video_duration = float(os.popen(video_duration_cmd).read().strip())
+        video_duration = get_clip_duration(video_path)
         
         # Get audio duration
-        audio_duration_cmd = f"ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {audio_path}"
-        audio_duration = float(os.popen(audio_duration_cmd).read().strip())
+        audio_duration = get_audio_duration(audio_path)
         
         print(f"\n🎬 Merging video and audio:")
         print(f"Video duration: {video_duration:.2f}s")
@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+
+MUSIC_CACHE_DIR = os.getenv("MUSIC_CACHE_DIR", os.path.expanduser("~/Desktop/ComfyUI/output/music_cache"))
+MUSIC_CACHE_MAX_ENTRIES = int(os.getenv("MUSIC_CACHE_MAX_ENTRIES", 200))
+MUSIC_CACHE_MAX_BYTES = int(os.getenv("MUSIC_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))  # 20 GB
+
+def normalize_music_prompt(music_prompt):
+    """Normalise a music prompt so equivalent descriptors share a cache key.
+
+    Each "Field: a, b, c" part is lowercased and its comma-separated values
+    are de-duplicated and sorted, so "dark, ominous" and "Ominous, dark"
+    produce the same key.
+    """
+    fields = {}
+    for part in re.split(r",\s*(?=[A-Za-z ]+:)", music_prompt):
+        if ":" not in part:
+            continue
+        name, values = part.split(":", 1)
+        items = {re.sub(r"\s+", " ", v).strip() for v in values.lower().split(",")}
+        fields[name.strip().lower()] = ", ".join(sorted(item for item in items if item))
+
+    return "; ".join(f"{name}: {fields[name]}" for name in sorted(fields))
+
+def get_cache_key(music_prompt, audio_length, repo_id, section=0):
+    """Return the content key for a music request.
+
+    Sections of a long score share a prompt and length, so the section
+    index is part of the key to keep them from collapsing into a loop.
+    """
+    key_data = json.dumps({
+        "prompt": normalize_music_prompt(music_prompt),
+        "audio_length": int(round(float(audio_length))),
+        "repo_id": repo_id,
+        "section": section
+    }, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+def _entry_path(cache_key):
+    return os.path.join(MUSIC_CACHE_DIR, f"{cache_key}.wav")
+
+def copy_atomic(source, destination):
+    """Copy source to destination through a temp file, so readers never see a partial file.
+
+    Entries are copied rather than hard-linked: DiffRhythm rewrites its
+    output.wav in place, which would also rewrite a linked cache entry.
+    """
+    temp_path = f"{destination}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def has_music(cache_key):
+    entry = _entry_path(cache_key)
+    return os.path.exists(entry) and os.path.getsize(entry) > 0
+
+def lookup_music(cache_key, output_file):
+    """Copy a cached score into output_file. Returns True on a cache hit."""
+    if not has_music(cache_key):
+        return False
+
+    entry = _entry_path(cache_key)
+    try:
+        copy_atomic(entry, output_file)
+        os.utime(entry)  # Mark as recently used for LRU eviction
+    except FileNotFoundError:
+        return False  # Evicted by another job since has_music
+    return True
+
+def store_music(cache_key, source_file, metadata=None):
+    """Add a generated score to the cache and evict the least recently used entries."""
+    try:
+        os.makedirs(MUSIC_CACHE_DIR, exist_ok=True)
+        copy_atomic(source_file, _entry_path(cache_key))
+
+        if metadata:
+            with open(os.path.join(MUSIC_CACHE_DIR, f"{cache_key}.json"), "w") as f:
+                json.dump(dict(metadata, cached_at=time.time()), f, indent=2)
+
+        evict_music_cache()
+        return True
+    except Exception as e:
+        print(f"⚠️ Failed to store music in cache: {str(e)}")
+        return False
+
+def evict_music_cache(max_entries=MUSIC_CACHE_MAX_ENTRIES, max_bytes=MUSIC_CACHE_MAX_BYTES):
+    """Remove least recently used entries until the cache fits its limits."""
+    if not os.path.isdir(MUSIC_CACHE_DIR):
+        return 0
+
+    entries = []
+    for name in os.listdir(MUSIC_CACHE_DIR):
+        if name.endswith(".wav"):
+            try:
+                stat = os.stat(os.path.join(MUSIC_CACHE_DIR, name))
+            except FileNotFoundError:
+                continue  # Removed by a concurrent eviction
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+    entries.sort()
+
+    total_bytes = sum(size for _, size, _ in entries)
+    evicted = 0
+    while entries and (len(entries) > max_entries or total_bytes > max_bytes):
+        _, size, cache_key = entries.pop(0)
+        for suffix in (".wav", ".json"):
+            path = os.path.join(MUSIC_CACHE_DIR, f"{cache_key}{suffix}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total_bytes -= size
+        evicted += 1
+
+    if evicted:
+        print(f"🧹 Evicted {evicted} music cache entries")
+    return evicted
@@ -1,37 +1,190 @@
 import os
+import math
 import time
+import argparse
+import tempfile
 import subprocess
 import requests
 
+from services.music_cache import get_cache_key, has_music, lookup_music, store_music
+from services import audio_mixer
+from services.media_service import get_media_duration
+from services.narration_service import plan_clip_duration
+
 MUSIC_GEN_API_URL = "http://localhost:5009/generate"
+MUSIC_REPO_ID = "ASLP-lab/DiffRhythm-base"
+MUSIC_MAX_SECTION_LENGTH = 95  # Longest clip DiffRhythm-base generates in one request
+MUSIC_LENGTH_STEP = 10  # Section lengths are rounded up to this step
+MUSIC_TAIL_PADDING = 2  # Seconds of music past the last scene for the fade-out
+MUSIC_CROSSFADE_DURATION = 4  # Overlap between generated sections
+MUSIC_CACHE_ENABLED = os.getenv("MUSIC_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+MUSIC_MIX_ENGINE = os.getenv("MUSIC_MIX_ENGINE", "numpy")  # "numpy" or "ffmpeg"
+MUSIC_PREWARM_MAX_DURATION = 300  # Longest movie, in seconds, whose section lengths are pre-warmed
+MUSIC_OUTPUT_STABLE_CHECKS = 2  # Polls with an unchanged size before output.wav counts as written
+
+# Fixed genre preset scores for pre-warming. Generated stories write their own music_score, which
+# rarely normalises to the same cache key, so warming only helps movies that use a preset verbatim
+GENRE_MUSIC_SCORES = {
+    "noir": {"type": "darkwave", "style": "brooding, melancholic", "tempo": "slow", "instrumentation": "synthesizers, post-punk guitars, piano"},
+    "sci-fi": {"type": "atmospheric", "style": "reverb-drenched, cyberpunk", "tempo": "moderate", "instrumentation": "wave synths, pads, arpeggiators"},
+    "horror": {"type": "dark ambient", "style": "distorted, dissonant", "tempo": "slow, building tension", "instrumentation": "wave bass, string glitches, mechanical percussion"},
+    "romance": {"type": "lo-fi", "style": "emotional, dreamy", "tempo": "slow", "instrumentation": "piano, guitar samples, wave atmospherics"},
+    "action": {"type": "trap", "style": "driving, tense", "tempo": "fast", "instrumentation": "trap percussion, 808s, synth stabs"},
+    "indie": {"type": "lo-fi", "style": "nostalgic, emo", "tempo": "moderate", "instrumentation": "guitar textures, trap beats, analog synths"},
+    "post-apocalyptic": {"type": "industrial ambient", "style": "distorted, sparse", "tempo": "slow", "instrumentation": "distorted textures, sparse percussion"},
+    "western": {"type": "latin-infused", "style": "desert, atmospheric", "tempo": "moderate", "instrumentation": "guitar, minimal percussion"},
+    "cyberpunk": {"type": "industrial", "style": "chillwave, futuristic", "tempo": "moderate", "instrumentation": "industrial rhythms, synths, techno elements"},
+    "fantasy": {"type": "ethereal", "style": "ancient, ambient", "tempo": "slow", "instrumentation": "bells, ancient instruments, trap undercurrents"},
+    "superhero": {"type": "heroic", "style": "bold, melodic", "tempo": "moderate", "instrumentation": "brass, electronic production, melodic bass"},
+    "blockbuster": {"type": "orchestral", "style": "epic, powerful", "tempo": "moderate, building", "instrumentation": "orchestra, electronic elements, percussion"},
+}
+
+def build_music_prompt(music_score):
+    """Format a music score as the DiffRhythm reference prompt."""
+    return (
+        f"Style: {music_score.get('style', '')}, "
+        f"Type: {music_score.get('type', '')}, "
+        f"Instrumentation: {music_score.get('instrumentation', '')}, "
+        f"Tempo: {music_score.get('tempo', '')}"
+    )
+
+def estimate_movie_duration(sequence, voice="default"):
+    """Estimate the final movie length from the planned scene durations.
+
+    Uses the same plan_clip_duration as VideoGenService, so clips extended
+    for their narration are counted (up to MAX_CLIP_DURATION), plus the
+    0.5 second render buffer.
+    """
+    total = 0.0
+    for item in sequence or []:
+        total += plan_clip_duration(item, voice) + 0.5
+    return total
+
+def plan_music_sections(movie_duration):
+    """Split the movie length into section lengths DiffRhythm can generate.
 
-def generate_music_score(output_folder, music_score):
-    """Generate background music for the final movie."""
+    Short movies get a single section sized to the movie, long movies get
+    equal sections that overlap by MUSIC_CROSSFADE_DURATION so they can be
+    crossfaded instead of looped. Lengths are rounded up to
+    MUSIC_LENGTH_STEP so similar movies still share cache entries.
+    """
+    def bucket(length):
+        return min(MUSIC_MAX_SECTION_LENGTH, MUSIC_LENGTH_STEP * math.ceil(length / MUSIC_LENGTH_STEP))
+    
+    target = movie_duration + MUSIC_TAIL_PADDING
+    if target <= MUSIC_MAX_SECTION_LENGTH:
+        return [bucket(target)]
+    
+    usable = MUSIC_MAX_SECTION_LENGTH - MUSIC_CROSSFADE_DURATION
+    num_sections = math.ceil((target - MUSIC_CROSSFADE_DURATION) / usable)
+    section_length = (target + (num_sections - 1) * MUSIC_CROSSFADE_DURATION) / num_sections
+    return [bucket(section_length)] * num_sections
+
+def generate_music_score(output_folder, music_score, audio_length=None, sequence=None, voice="default"):
+    """Generate background music for the final movie.
+    
+    audio_length is the length of movie to cover; when it is not given it
+    is planned from the sequence's scene durations. Long movies are
+    generated in sections and crossfaded into a single output.wav.
+    """
     try:
+        if audio_length is None:
+            audio_length = estimate_movie_duration(sequence, voice) if sequence else MUSIC_MAX_SECTION_LENGTH - MUSIC_TAIL_PADDING
+        sections = plan_music_sections(audio_length)
+        
         print("\n🎵 Generating Music Score:")
         print(f"Style: {music_score.get('style', 'N/A')}")
         print(f"Type: {music_score.get('type', 'N/A')}")
         print(f"Instrumentation: {music_score.get('instrumentation', 'N/A')}")
         print(f"Tempo: {music_score.get('tempo', 'N/A')}")
-        print(f"Duration: 95 seconds")
+        print(f"Duration: {audio_length:.1f} seconds ({len(sections)} section(s) of {sections[0]}s)")
         
         # Format music score as a string
-        music_prompt = (
-            f"Style: {music_score.get('style', '')}, "
-            f"Type: {music_score.get('type', '')}, "
-            f"Instrumentation: {music_score.get('instrumentation', '')}, "
-            f"Tempo: {music_score.get('tempo', '')}"
-        )
+        music_prompt = build_music_prompt(music_score)
+        output_file = os.path.join(output_folder, "output.wav")
         
-        # Prepare the request payload
-        payload = {
-            "ref_prompt": music_prompt,
-            "audio_length": 95,  # Hardcoded to 95 seconds
-            "repo_id": "ASLP-lab/DiffRhythm-base",
-            "output_dir": output_folder,
-            "chunked": True
-        }
+        if len(sections) == 1:
+            return generate_music_section(output_folder, music_prompt, sections[0])
+        
+        section_files = []
+        for index, section_length in enumerate(sections):
+            section_folder = os.path.join(output_folder, "music_sections", str(index))
+            os.makedirs(section_folder, exist_ok=True)
+            print(f"\n🎼 Section {index + 1}/{len(sections)}")
+            if not generate_music_section(section_folder, music_prompt, section_length, index):
+                return False
+            section_files.append(os.path.join(section_folder, "output.wav"))
         
+        return crossfade_music_sections(section_files, output_file)
+            
+    except Exception as e:
+        print(f"❌ Error generating music: {str(e)}")
+        return False
+
+def generate_music_section(output_folder, music_prompt, audio_length, section=0):
+    """Generate one music section into output_folder/output.wav, using the cache."""
+    output_file = os.path.join(output_folder, "output.wav")
+    
+    # Reuse a previously generated score when the descriptors match
+    cache_key = get_cache_key(music_prompt, audio_length, MUSIC_REPO_ID, section)
+    if MUSIC_CACHE_ENABLED and lookup_music(cache_key, output_file):
+        print(f"✅ Music cache hit ({cache_key[:12]}), copied into: {output_file}")
+        return True
+    
+    # A leftover output.wav would satisfy the wait below before the new score is written
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    
+    # Prepare the request payload
+    payload = {
+        "ref_prompt": music_prompt,
+        "audio_length": audio_length,
+        "repo_id": MUSIC_REPO_ID,
+        "output_dir": output_folder,
+        "chunked": True
+    }
+    
+    if not request_music_generation(payload, output_file):
+        return False
+    
+    if MUSIC_CACHE_ENABLED:
+        store_music(cache_key, output_file, {
+            "ref_prompt": music_prompt,
+            "audio_length": audio_length,
+            "repo_id": MUSIC_REPO_ID,
+            "section": section
+        })
+    return True
+
+def crossfade_music_sections(section_files, output_file):
+    """Join music sections into one track with equal-power crossfades."""
+    inputs = []
+    for section_file in section_files:
+        inputs += ["-i", section_file]
+    
+    filters = []
+    previous = "[0:a]"
+    for index in range(1, len(section_files)):
+        label = f"[x{index}]"
+        filters.append(f"{previous}[{index}:a]acrossfade=d={MUSIC_CROSSFADE_DURATION}:c1=qsin:c2=qsin{label}")
+        previous = label
+    
+    cmd = ["ffmpeg", "-y"] + inputs + [
+        "-filter_complex", ";".join(filters),
+        "-map", previous, "-acodec", "pcm_s16le", output_file
+    ]
+    print(f"\nCrossfading {len(section_files)} music sections...")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ Error crossfading music sections: {result.stderr}")
+        return False
+    
+    print(f"✅ Music sections joined: {output_file}")
+    return True
+
+def request_music_generation(payload, output_file):
+    """Send a request to the music generation server and wait for the output file."""
+    try:
         # Send request to music generation server
         print("\nSending request to music generation server...")
         response = requests.post(MUSIC_GEN_API_URL, json=payload)
@@ -41,52 +194,126 @@ def generate_music_score(output_folder, music_score):
             print(f"Response: {response.text}")
             return False
             
-        # Check for output file
-        output_file = os.path.join(output_folder, "output.wav")
+        # Wait until the output file exists and its size has stopped changing
         max_wait_time = 300  # 5 minutes timeout
         wait_interval = 5  # Check every 5 seconds
         waited = 0
+        last_size = -1
+        stable_checks = 0
         
         print("\n⏳ Waiting for music generation to complete...")
-        while not os.path.exists(output_file) and waited < max_wait_time:
+        while waited < max_wait_time:
+            size = os.path.getsize(output_file) if os.path.exists(output_file) else -1
+            stable_checks = stable_checks + 1 if size > 0 and size == last_size else 0
+            if stable_checks >= MUSIC_OUTPUT_STABLE_CHECKS:
+                break
+            last_size = size
             print(f"Waiting... ({waited}/{max_wait_time}s)")
             time.sleep(wait_interval)
             waited += wait_interval
         
-        if os.path.exists(output_file):
+        if stable_checks >= MUSIC_OUTPUT_STABLE_CHECKS:
             file_size = os.path.getsize(output_file)
             print(f"\n✅ Music generated successfully: {output_file}")
             print(f"File size: {file_size/1024/1024:.2f} MB")
             return True
         else:
-            print(f"❌ Music file not found after {max_wait_time} seconds")
+            print(f"❌ Music file not complete after {max_wait_time} seconds")
             return False
             
     except Exception as e:
-        print(f"❌ Error generating music: {str(e)}")
+        print(f"❌ Error requesting music generation: {str(e)}")
         return False
 
+def prewarm_sections(max_duration=MUSIC_PREWARM_MAX_DURATION):
+    """Every (section length, section index) pair that plan_music_sections produces for movies up to max_duration."""
+    sections = set()
+    duration = 0
+    while duration <= max_duration:
+        sections.update((length, index) for index, length in enumerate(plan_music_sections(duration)))
+        duration += 1
+    return sorted(sections)
+
+def prewarm_music_cache(genres=None, max_duration=MUSIC_PREWARM_MAX_DURATION):
+    """Generate and cache each genre preset score for every section a movie up to max_duration can use.
+
+    Only the fixed presets in GENRE_MUSIC_SCORES are warmed; a story whose
+    generated music_score differs from its preset still misses. Cache keys
+    also depend on the bucketed section length and the section index, so
+    warming a single movie length only helps movies that land in the same
+    buckets.
+    """
+    genres = genres or list(GENRE_MUSIC_SCORES)
+    sections = prewarm_sections(max_duration)
+    print(f"🔥 Pre-warming {len(sections)} sections per genre for movies up to {max_duration:.0f}s")
+    warmed = 0
+    for genre in genres:
+        music_score = GENRE_MUSIC_SCORES.get(genre)
+        if not music_score:
+            print(f"⚠️ No music preset for genre: {genre}")
+            continue
+        
+        print(f"\n🔥 Pre-warming music cache for genre: {genre}")
+        music_prompt = build_music_prompt(music_score)
+        complete = True
+        for length, index in sections:
+            if has_music(get_cache_key(music_prompt, length, MUSIC_REPO_ID, index)):
+                continue
+            with tempfile.TemporaryDirectory() as work_dir:
+                complete = generate_music_section(work_dir, music_prompt, length, index) and complete
+        warmed += complete
+    
+    print(f"\n✅ Pre-warmed {warmed}/{len(genres)} genres")
+    return warmed
+
 def add_background_music(output_folder):
     """Add background music to the final movie with smooth transitions."""
+    video_duration = None
+    if MUSIC_MIX_ENGINE == "numpy" and audio_mixer.is_available():
+        try:
+            print("\n=== Adding Background Music (in-process mix) ===")
+            input_video = os.path.join(output_folder, "final_movie.mp4")
+            music_file = os.path.join(output_folder, "output.wav")
+            output_video = os.path.join(output_folder, "final_movie_with_music_smooth.mp4")
+            video_duration = get_media_duration(input_video)
+            if audio_mixer.mix_background_music(input_video, music_file, output_video, video_duration=video_duration):
+                print(f"✅ Successfully added background music: {output_video}")
+                return True
+            print("⚠️ In-process mix failed, falling back to ffmpeg passes")
+        except Exception as e:
+            print(f"⚠️ In-process mix failed ({str(e)}), falling back to ffmpeg passes")
+        
+        # Drop whatever the failed mix wrote so the fallback starts clean
+        partial_output = os.path.join(output_folder, "final_movie_with_music_smooth.mp4")
+        if os.path.exists(partial_output):
+            os.remove(partial_output)
+    
+    return add_background_music_ffmpeg(output_folder, video_duration)
+
+def add_background_music_ffmpeg(output_folder, video_duration=None):
+    """Add background music using separate ffmpeg passes for resample, fade, loop and mix.
+
+    The video is probed for its duration unless video_duration is given.
+    """
     try:
         print("\n=== Adding Background Music ===")
         
         # Get video duration
         input_video = os.path.join(output_folder, "final_movie.mp4")
-        cmd = f"ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {input_video}"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"❌ Error getting video duration: {result.stderr}")
-            return False
-            
-        video_duration = float(result.stdout.strip())
+        if not video_duration:
+            cmd = f"ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {input_video}"
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"❌ Error getting video duration: {result.stderr}")
+                return False
+            video_duration = float(result.stdout.strip())
         print(f"Video duration: {video_duration:.2f} seconds")
         
         # Step 1: Process music file (convert to mono, match sample rate)
         print("Processing music file...")
         music_file = os.path.join(output_folder, "output.wav")
         processed_music = os.path.join(output_folder, "processed_music.wav")
-        cmd = f"ffmpeg -i {music_file} -ac 1 -ar 22050 -acodec pcm_s16le {processed_music}"
+        cmd = f"ffmpeg -y -i {music_file} -ac 1 -ar 22050 -acodec pcm_s16le {processed_music}"
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode != 0:
             print(f"❌ Error processing music file: {result.stderr}")
@@ -102,40 +329,44 @@ def add_background_music(output_folder):
         music_duration = float(result.stdout.strip())
         print(f"Music duration: {music_duration:.2f} seconds")
         
-        # Calculate number of loops needed
-        num_loops = int(video_duration / music_duration) + 2  # Add 2 extra loops for safety
+        # Calculate number of loops needed; a fitted score plays exactly once
+        num_loops = math.ceil(video_duration / music_duration)
         print(f"Number of loops needed: {num_loops}")
         
         # Step 2: Add fades to music (2-second fade in/out)
         print("Adding fades to music...")
         faded_music = os.path.join(output_folder, "faded_music.wav")
         fade_duration = min(2.0, music_duration * 0.1)  # Use 10% of music duration or 2s, whichever is smaller
-        fade_out_start = music_duration - fade_duration
-        cmd = f"ffmpeg -i {processed_music} -af \"afade=t=in:st=0:d={fade_duration},afade=t=out:st={fade_out_start}:d={fade_duration}\" {faded_music}"
+        play_duration = min(music_duration, video_duration)  # Fade out with the movie, not the score
+        fade_out_start = play_duration - fade_duration
+        cmd = f"ffmpeg -y -i {processed_music} -t {play_duration} -af \"afade=t=in:st=0:d={fade_duration},afade=t=out:st={fade_out_start}:d={fade_duration}\" {faded_music}"
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode != 0:
             print(f"❌ Error adding fades: {result.stderr}")
             return False
             
         # Step 3: Create loop list
-        print("Creating music loop...")
         music_list = os.path.join(output_folder, "music_list.txt")
-        with open(music_list, 'w') as f:
-            for _ in range(num_loops):
-                f.write("file 'faded_music.wav'\n")
-            
-        # Step 4: Concatenate faded music
         looped_music = os.path.join(output_folder, "looped_music_faded.wav")
-        cmd = f"ffmpeg -f concat -safe 0 -i {music_list} -c copy {looped_music}"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"❌ Error concatenating music: {result.stderr}")
-            return False
+        if num_loops <= 1:
+            looped_music = faded_music
+        else:
+            print("Creating music loop...")
+            with open(music_list, 'w') as f:
+                for _ in range(num_loops):
+                    f.write("file 'faded_music.wav'\n")
+                
+            # Step 4: Concatenate faded music
+            cmd = f"ffmpeg -y -f concat -safe 0 -i {music_list} -c copy {looped_music}"
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"❌ Error concatenating music: {result.stderr}")
+                return False
             
         # Step 5: Final mix (combine video with music at 15% volume)
         print("Mixing music with video...")
         output_video = os.path.join(output_folder, "final_movie_with_music_smooth.mp4")
-        cmd = f"ffmpeg -i {input_video} -i {looped_music} -filter_complex \"[0:a][1:a]amerge=inputs=2,pan=stereo|c0=c0+0.15*c1|c1=c0+0.15*c1[a]\" -map 0:v -map \"[a]\" -c:v copy -c:a aac -b:a 192k {output_video}"
+        cmd = f"ffmpeg -y -i {input_video} -i {looped_music} -filter_complex \"[0:a][1:a]amerge=inputs=2,pan=stereo|c0=c0+0.15*c1|c1=c0+0.15*c1[a]\" -map 0:v -map \"[a]\" -c:v copy -c:a aac -b:a 192k {output_video}"
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode != 0:
             print(f"❌ Error mixing audio: {result.stderr}")
@@ -151,4 +382,12 @@ def add_background_music(output_folder):
         
     except Exception as e:
         print(f"❌ Error adding background music: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the music score cache with the genre presets")
+    parser.add_argument("--genres", nargs="*", help="Genres to pre-warm (default: all)")
+    parser.add_argument("--max-duration", type=float, default=MUSIC_PREWARM_MAX_DURATION,
+                        help="Warm every section length used by movies up to this long, in seconds")
+    args = parser.parse_args()
+    prewarm_music_cache(args.genres, args.max_duration)
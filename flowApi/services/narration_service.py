@@ -1,29 +1,73 @@
 import os
+import re
+import glob
+import json
 import time
-import subprocess
+import hashlib
+import threading
 import requests
-import logging
-import random
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from services.media_service import get_clip_duration, write_silent_wav, get_audio_duration
+from services.duration_model import get_duration_model
 
 TTS_API_URL = "http://localhost:5010/generate-voice"
+TTS_BATCH_API_URL = "http://localhost:5010/generate-voice-batch"
+NARRATION_CONCURRENCY = int(os.getenv("NARRATION_CONCURRENCY", 8))  # Scenes synthesised at once
+NARRATION_MAX_RETRIES = 5
+NARRATION_TIMEOUT = 120  # Seconds per synthesis request
+NARRATION_BATCH_TIMEOUT = 900  # Seconds for a whole-movie batch request
+MAX_CLIP_DURATION = 6.0  # Longest clip the video workflow renders without running out of memory
+
+_tts_session = None
+_tts_session_lock = threading.Lock()
+
+def get_tts_session():
+    """Return a shared keep-alive session sized for concurrent narration requests."""
+    global _tts_session
+    with _tts_session_lock:
+        if _tts_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=NARRATION_CONCURRENCY)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _tts_session = session
+        return _tts_session
+
+def post_tts_request(data, url=TTS_API_URL, timeout=NARRATION_TIMEOUT):
+    """Post a synthesis request, backing off on 429/503 as the server asks."""
+    session = get_tts_session()
+    for attempt in range(NARRATION_MAX_RETRIES):
+        response = session.post(url, json=data, timeout=timeout)
+        if response.status_code not in (429, 503):
+            return response
+        
+        retry_after = response.headers.get("Retry-After")
+        try:
+            wait_time = float(retry_after)
+        except (TypeError, ValueError):
+            wait_time = 2 ** attempt
+        print(f"⏳ TTS API rate limited ({response.status_code}), retrying in {wait_time:.1f}s")
+        time.sleep(wait_time)
+    
+    return response
 
-def estimate_text_duration(text):
-    """Estimate the duration of text based on average speaking rate."""
-    # Average speaking rate is about 150 words per minute
-    # This means each word takes about 0.4 seconds
-    words = len(text.split())
-    estimated_duration = words * 0.4
-    return estimated_duration
+def estimate_text_duration(text, voice="default"):
+    """Estimate the duration of text from the voice's learned speaking rate."""
+    # Starts from ~150 words per minute (0.4s per word) plus punctuation
+    # pauses, and is refined with every clip the voice actually produces
+    return get_duration_model().predict(text, voice)
 
-def adjust_text_for_duration(text, target_duration):
+def adjust_text_for_duration(text, target_duration, voice="default"):
     """Adjust text to fit within target duration."""
-    current_duration = estimate_text_duration(text)
+    current_duration = estimate_text_duration(text, voice)
     if current_duration <= target_duration:
         return text
         
     # If text is too long, try to make it more concise
     words = text.split()
-    target_words = int(target_duration / 0.4)  # 0.4 seconds per word
+    target_words = int(target_duration / get_duration_model().seconds_per_word(voice))
     if target_words < 3:  # Minimum 3 words for coherence
         target_words = 3
         
@@ -33,37 +77,102 @@ def adjust_text_for_duration(text, target_duration):
         return " ".join(kept_words)
     return text
 
-def select_voice(character_data=None):
-    """Select a voice based on character gender and maintain consistency."""
+def fit_narration(text, voice="default", max_duration=None):
+    """Shorten narration predicted to run past the longest clip the video workflow can render."""
+    max_duration = max_duration or MAX_CLIP_DURATION
+    if not text or text.strip() == "...":
+        return text
+    fitted = adjust_text_for_duration(text, max_duration, voice)
+    if fitted != text:
+        print(f"✂️ Narration predicted past {max_duration:.1f}s, shortened to: {fitted}")
+    return fitted
+
+def plan_clip_duration(item, voice="default", narration_duration=None):
+    """Size a clip to cover its narration, up to MAX_CLIP_DURATION.
+    
+    narration_duration is the measured length of the scene's narration
+    when it has already been synthesised; otherwise it is predicted.
+    """
+    clip_duration = min(float(item.get("clip_duration", 3.0625)), MAX_CLIP_DURATION)
+    narration = item.get("voice_narration")
+    if not narration or narration.strip() == "...":
+        return clip_duration
+    
+    if narration_duration is None:
+        narration_duration = estimate_text_duration(narration, voice)
+    if narration_duration > MAX_CLIP_DURATION:
+        print(f"⚠️ Narration runs {narration_duration:.2f}s, past the {MAX_CLIP_DURATION:.1f}s clip limit")
+    elif narration_duration > clip_duration:
+        print(f"⏱️ Extending clip from {clip_duration:.2f}s to narration length {narration_duration:.2f}s")
+    return min(max(clip_duration, narration_duration), MAX_CLIP_DURATION)
+
+def record_narration_duration(text, voice, audio_file):
+    """Feed a synthesised clip's real duration back into the speaking-rate model."""
+    try:
+        get_duration_model().observe(text, voice, get_audio_duration(audio_file))
+    except Exception as e:
+        print(f"⚠️ Could not record narration duration: {str(e)}")
+
+FEMALE_VOICES = ["female1", "female2", "female3"]
+MALE_VOICES = ["male1", "male2", "male3"]
+FEMALE_INDICATORS = re.compile(r"\b(woman|women|female|girl|lady|she|her|hers)\b")
+MALE_INDICATORS = re.compile(r"\b(man|men|male|boy|gentleman|he|him|his)\b")
+
+def select_voice(character_data=None, movie_id=None):
+    """Select a voice based on character gender, stable for a given character and movie.
+    
+    The voice is picked by hashing the character descriptor and movie id,
+    so retries and re-renders get the same narrator and can reuse existing
+    narration files and cached TTS audio.
+    """
     voice = "me"  # Default voice
     if character_data and "base_traits" in character_data:
         base_traits = character_data["base_traits"].lower()
         print(f"\n🔍 Analyzing character traits: {base_traits}")
         
-        # Define gender indicators
-        female_indicators = ["woman", "female", "girl", "lady", "she", "her"]
-        male_indicators = ["man", "male", "boy", "gentleman", "he", "him"]
+        # Match whole words only, so "the" does not count as "he"
+        is_female = bool(FEMALE_INDICATORS.search(base_traits))
+        is_male = bool(MALE_INDICATORS.search(base_traits))
         
-        # Check for gender indicators
-        is_female = any(indicator in base_traits for indicator in female_indicators)
-        is_male = any(indicator in base_traits for indicator in male_indicators)
+        seed_text = f"{movie_id or ''}|{' '.join(base_traits.split())}"
+        seed = int(hashlib.sha256(seed_text.encode("utf-8")).hexdigest(), 16)
         
         if is_female:
-            # Randomly select from female voices
-            female_voices = ["female1", "female2", "female3"]
-            voice = random.choice(female_voices)
+            voice = FEMALE_VOICES[seed % len(FEMALE_VOICES)]
             print(f"🎙️ Selected female voice: {voice}")
         elif is_male:
-            # Randomly select from male voices
-            male_voices = ["male1", "male2", "male3"]
-            voice = random.choice(male_voices)
+            voice = MALE_VOICES[seed % len(MALE_VOICES)]
             print(f"🎙️ Selected male voice: {voice}")
         else:
             print("⚠️ Could not determine gender from base_traits, using default voice")
     
     return voice
 
-def generate_narration(text, image_path, output_folder, logger, character_data=None, selected_voice=None):
+def prepare_narration_folder(output_folder, voice, tts_options=None):
+    """Discard narration made with a different voice or TTS options.
+    
+    Existing `*_00001_.wav` files are reused on re-runs, so a final render
+    must not pick up audio left by a draft on another backend. The settings
+    of the last run are kept in `narration_profile.json`.
+    """
+    profile = {"voice": voice, "tts_options": tts_options or {}}
+    profile_path = os.path.join(output_folder, "narration_profile.json")
+    
+    previous = None
+    if os.path.exists(profile_path):
+        with open(profile_path, "r") as f:
+            previous = json.load(f)
+    
+    if previous is not None and previous != profile:
+        stale = glob.glob(os.path.join(output_folder, "scene_*_00001_.wav"))
+        print(f"🧹 Narration settings changed, removing {len(stale)} existing narration files")
+        for path in stale:
+            os.remove(path)
+    
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+def generate_narration(text, image_path, output_folder, logger, character_data=None, selected_voice=None, tts_options=None):
     """Generate narration audio using TTS API with consistent voice selection"""
     try:
         base_filename = os.path.splitext(os.path.basename(image_path))[0]
@@ -71,30 +180,24 @@ def generate_narration(text, image_path, output_folder, logger, character_data=N
         # Check if text is empty or just "..."
         if not text or text.strip() == "...":
             logger.info("Creating silent audio file for empty narration")
-            # Get video duration to match silent audio length
-            video_file = os.path.join(output_folder, f"{base_filename}_00001.mp4")
             audio_file = os.path.join(output_folder, f"{base_filename}_00001.wav")
             
-            if os.path.exists(video_file):
-                # Get video duration
-                cmd = [
-                    "ffprobe", "-v", "error", "-show_entries", "format=duration",
-                    "-of", "default=noprint_wrappers=1:nokey=1", video_file
-                ]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                duration = float(result.stdout.strip())
-                
-                # Create silent audio file with same properties as TTS audio
-                cmd = [
-                    "ffmpeg", "-f", "lavfi", "-i", f"anullsrc=r=22050:cl=mono",
-                    "-t", str(duration), "-acodec", "pcm_s16le", "-ar", "22050", "-b:a", "352800", audio_file
-                ]
-                subprocess.run(cmd, check=True)
-                logger.info(f"Created silent audio file: {audio_file}")
-                time.sleep(1)  # Add delay after file creation
-                return True, "audio_generated"
+            # Match the clip under any of the names ComfyUI produces
+            video_patterns = [
+                os.path.join(output_folder, f"{base_filename}_00001.mp4"),
+                os.path.join(output_folder, f"{base_filename}__00001.mp4"),
+                os.path.join(output_folder, f"{base_filename}.mp4")
+            ]
+            video_file = next((path for path in video_patterns if os.path.exists(path)), None)
+            
+            if video_file:
+                # Silence of exactly the clip's length, written in-process
+                duration = get_clip_duration(video_file)
+                write_silent_wav(audio_file, duration)
+                logger.info(f"Created silent audio file: {audio_file} ({duration:.2f}s)")
+                return True, "silent_audio_generated"
             else:
-                logger.warning(f"Video file not found: {video_file}")
+                logger.warning(f"Video file not found for: {base_filename}")
                 return False, "video_not_found"
         
         # Use the selected voice if provided, otherwise select a new one
@@ -108,7 +211,9 @@ def generate_narration(text, image_path, output_folder, logger, character_data=N
             "text": text,
             "voice": voice,
             "filename": filename,
-            "filepath": output_folder
+            "filepath": output_folder,
+            "priority": "batch",
+            **(tts_options or {})
         }
         
         audio_file = os.path.join(output_folder, data['filename'] + '.wav')
@@ -124,49 +229,23 @@ def generate_narration(text, image_path, output_folder, logger, character_data=N
             print(f"✅ Audio file already exists: {audio_file}")
             file_size = os.path.getsize(audio_file)
             print(f"File size: {file_size/1024:.2f} KB")
-            time.sleep(1)  # Add delay after file check
             return True, "audio_generated"
         
-        # Send request to TTS API info endpoint first
-        print("\nChecking TTS API info...")
-        info_response = requests.post(TTS_API_URL, json=data)
-        time.sleep(2)  # Add delay after API call
-        
-        if info_response.status_code != 200:
-            print(f"❌ TTS API info check failed: {info_response.text}")
-            return False, "tts_info_check_failed"
-            
-        # Now send request to TTS API
+        # One synthesis request per scene; the TTS service writes the file before responding
         print("\nSending request to TTS API...")
-        response = requests.post(TTS_API_URL, json=data)
-        time.sleep(2)  # Add delay after API call
+        response = post_tts_request(data)
         
         if response.status_code == 200:
             print(f"\n✅ Generated narration: {data['filename']}")
-            # Verify the audio file was created
-            audio_file = os.path.join(output_folder, data['filename'] + '.wav')
-            
-            # Wait for the file to be created (with timeout)
-            max_wait_time = 30  # seconds
-            wait_interval = 1  # seconds
-            waited = 0
-            
-            while not os.path.exists(audio_file) and waited < max_wait_time:
-                print(f"Waiting for audio file to be created... ({waited}/{max_wait_time}s)")
-                time.sleep(wait_interval)
-                waited += wait_interval
             
             if os.path.exists(audio_file):
                 file_size = os.path.getsize(audio_file)
                 print(f"Audio file created: {audio_file}")
                 print(f"File size: {file_size/1024:.2f} KB")
-                
-                # Add a small delay after successful generation to prevent overwhelming the API
-                time.sleep(3)  # Increased delay after successful generation
-                
+                record_narration_duration(text, voice, audio_file)
                 return True, "audio_generated"
             else:
-                print(f"❌ Audio file not found at: {audio_file} after waiting {max_wait_time} seconds")
+                print(f"❌ Audio file not found at: {audio_file}")
                 return False, "audio_file_not_found"
         else:
             print(f"\n❌ Failed to generate narration:")
@@ -175,4 +254,80 @@ def generate_narration(text, image_path, output_folder, logger, character_data=N
             
     except Exception as e:
         print(f"❌ Error generating narration: {str(e)}")
-        return False, str(e) 
\ No newline at end of file
+        return False, str(e)
+
+def generate_narrations(scenes, output_folder, logger, character_data=None, selected_voice=None, tts_options=None,
+                        max_workers=NARRATION_CONCURRENCY):
+    """Generate narration for all scenes of a movie concurrently.
+    
+    `scenes` is a list of (sequence_number, text, image_path) tuples. Returns
+    a dict mapping sequence_number to the (success, status) result of
+    generate_narration.
+    """
+    voice = selected_voice if selected_voice else select_voice(character_data)
+    
+    def narrate(scene):
+        sequence_number, text, image_path = scene
+        return sequence_number, generate_narration(text, image_path, output_folder, logger, character_data, voice, tts_options)
+    
+    print(f"\n🎙️ Narrating {len(scenes)} scenes with up to {max_workers} concurrent requests")
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return dict(executor.map(narrate, scenes))
+
+def generate_narrations_batch(scenes, output_folder, logger, character_data=None, selected_voice=None, tts_options=None):
+    """Generate narration for all scenes of a movie with one batch TTS request.
+    
+    Takes the same `scenes` tuples and returns the same result dict as
+    generate_narrations. Silent scenes are handled locally and scenes that
+    already have audio are skipped; the rest are synthesised together by
+    /generate-voice-batch and split back into per-scene files.
+    """
+    voice = selected_voice if selected_voice else select_voice(character_data)
+    results = {}
+    batch_scenes = []
+    
+    for sequence_number, text, image_path in scenes:
+        base_filename = os.path.splitext(os.path.basename(image_path))[0]
+        filename = f"{base_filename}_00001_"
+        audio_file = os.path.join(output_folder, f"{filename}.wav")
+        
+        if not text or text.strip() == "..." or (os.path.exists(audio_file) and os.path.getsize(audio_file) > 0):
+            results[sequence_number] = generate_narration(text, image_path, output_folder, logger, character_data, voice, tts_options)
+        else:
+            batch_scenes.append((sequence_number, text, filename, audio_file))
+    
+    if not batch_scenes:
+        return results
+    
+    data = {
+        "voice": voice,
+        "filepath": output_folder,
+        "priority": "batch",
+        **(tts_options or {}),
+        "scenes": [{"text": text, "filename": filename} for _, text, filename, _ in batch_scenes]
+    }
+    
+    try:
+        print(f"\n🎙️ Narrating {len(batch_scenes)} scenes in one batch request (voice: {voice})")
+        response = post_tts_request(data, url=TTS_BATCH_API_URL, timeout=NARRATION_BATCH_TIMEOUT)
+        if response.status_code != 200:
+            print(f"❌ Batch narration failed: {response.text}")
+            status = (False, "tts_batch_failed")
+        else:
+            body = response.json()
+            print(f"✅ Batch narration complete in {body.get('synthesis_calls')} synthesis calls ({body.get('cached', 0)} cached)")
+            status = None
+    except Exception as e:
+        print(f"❌ Error in batch narration: {str(e)}")
+        status = (False, str(e))
+    
+    for sequence_number, text, _, audio_file in batch_scenes:
+        if status:
+            results[sequence_number] = status
+        elif os.path.exists(audio_file):
+            record_narration_duration(text, voice, audio_file)
+            results[sequence_number] = (True, "audio_generated")
+        else:
+            results[sequence_number] = (False, "audio_file_not_found")
+    
+    return results
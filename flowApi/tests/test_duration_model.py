@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from services.duration_model import PRIOR_WEIGHTS, SpeakingRateModel, text_features
+
+def test_text_features():
+    assert text_features("Hello there, old friend. Are you ready?") == [7.0, 1.0, 2.0, 1.0]
+
+def test_unseen_voice_uses_the_prior(tmp_path):
+    model = SpeakingRateModel(str(tmp_path / "model.json"))
+    assert model.weights("rachel") == PRIOR_WEIGHTS
+    assert model.predict("one two three.", "rachel") == pytest.approx(3 * 0.4 + 0.3 + 0.1)
+    assert model.predict("   ", "rachel") == 0.0
+
+def test_observations_pull_the_fit_towards_the_voice(tmp_path):
+    model = SpeakingRateModel(str(tmp_path / "model.json"))
+    texts = ["word " * n + "end." for n in range(3, 30, 2)]
+    for text in texts:
+        # A slow voice: 0.6s per word plus the sentence pause
+        model.observe(text, "slow", 0.6 * len(text.split()) + 0.3, persist=False)
+
+    prior = SpeakingRateModel(str(tmp_path / "unused.json"))
+    sample = "word " * 20 + "end."
+    truth = 0.6 * 21 + 0.3
+    assert abs(model.predict(sample, "slow") - truth) < abs(prior.predict(sample, "slow") - truth)
+    assert model.seconds_per_word("slow") > PRIOR_WEIGHTS[0]
+    assert model.weights("other") == PRIOR_WEIGHTS  # Voices are fitted separately
+
+def test_invalid_observations_are_ignored(tmp_path):
+    model = SpeakingRateModel(str(tmp_path / "model.json"))
+    model.observe("", "rachel", 3.0)
+    model.observe("some words", "rachel", 0)
+    assert model.voices == {}
+
+def test_fit_survives_a_restart(tmp_path):
+    path = str(tmp_path / "models" / "model.json")
+    model = SpeakingRateModel(path)
+    model.observe("a short line of narration.", "rachel", 2.4)
+
+    with open(path) as f:
+        assert json.load(f)["voices"]["rachel"]["samples"] == 1
+    assert SpeakingRateModel(path).weights("rachel") == model.weights("rachel")
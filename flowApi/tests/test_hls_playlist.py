@@ -0,0 +1,57 @@
+from services.hls_playlist import read_playlist_entries, rewrite_playlist
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-PLAYLIST-TYPE:EVENT
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4.000000,
+segment_00000.m4s
+#EXTINF:4.000000,
+segment_00001.m4s
+#EXTINF:2.500000,
+segment_00002.m4s
+#EXT-X-ENDLIST
+"""
+
+def write_playlist(tmp_path):
+    path = tmp_path / "playlist.m3u8"
+    path.write_text(PLAYLIST)
+    return str(path)
+
+def urls(*names):
+    return {name: f"https://storage.example/{name}?token=1" for name in names}
+
+def test_read_playlist_entries(tmp_path):
+    assert read_playlist_entries(write_playlist(tmp_path)) == (
+        "init.mp4", ["segment_00000.m4s", "segment_00001.m4s", "segment_00002.m4s"]
+    )
+    assert read_playlist_entries(str(tmp_path / "missing.m3u8")) == (None, [])
+
+def test_partial_upload_lists_only_the_uploaded_prefix(tmp_path):
+    output = tmp_path / "published.m3u8"
+    uploaded = urls("init.mp4", "segment_00000.m4s", "segment_00002.m4s")
+
+    assert rewrite_playlist(write_playlist(tmp_path), str(output), uploaded)
+    lines = output.read_text().splitlines()
+    assert f'#EXT-X-MAP:URI="{uploaded["init.mp4"]}"' in lines
+    assert lines[-2:] == ["#EXTINF:4.000000,", uploaded["segment_00000.m4s"]]
+    # segment_00002 is uploaded but follows a gap, and the event playlist is not ended yet
+    assert uploaded["segment_00002.m4s"] not in lines
+    assert "#EXT-X-ENDLIST" not in lines
+
+def test_complete_upload_ends_the_playlist(tmp_path):
+    output = tmp_path / "published.m3u8"
+    uploaded = urls("init.mp4", "segment_00000.m4s", "segment_00001.m4s", "segment_00002.m4s")
+
+    assert rewrite_playlist(write_playlist(tmp_path), str(output), uploaded)
+    lines = output.read_text().splitlines()
+    assert [line for line in lines if line.startswith("https://")] == [
+        uploaded["segment_00000.m4s"], uploaded["segment_00001.m4s"], uploaded["segment_00002.m4s"]
+    ]
+    assert lines[-1] == "#EXT-X-ENDLIST"
+
+def test_nothing_is_published_before_the_init_segment(tmp_path):
+    output = tmp_path / "published.m3u8"
+    assert not rewrite_playlist(write_playlist(tmp_path), str(output), urls("segment_00000.m4s"))
+    assert not output.exists()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from services import music_cache
+from services.music_cache import get_cache_key, normalize_music_prompt
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "music_cache"
+    monkeypatch.setattr(music_cache, "MUSIC_CACHE_DIR", str(path))
+    return path
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\x01" * size)
+    return str(path)
+
+def age(cache_key, seconds_ago):
+    path = music_cache._entry_path(cache_key)
+    mtime = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+def test_equivalent_prompts_share_a_key():
+    a = "Style: Dark, ominous, Type: ambient, Instrumentation: piano,  strings, Tempo: slow"
+    b = "Style: ominous, dark, Type: Ambient, Instrumentation: strings, piano, Tempo: slow"
+    assert normalize_music_prompt(a) == normalize_music_prompt(b)
+    assert get_cache_key(a, 60, "repo") == get_cache_key(b, 60.2, "repo")
+
+def test_key_depends_on_length_repo_and_section():
+    prompt = "Style: dark, Type: ambient, Instrumentation: piano, Tempo: slow"
+    keys = {
+        get_cache_key(prompt, 60, "repo"),
+        get_cache_key(prompt, 70, "repo"),
+        get_cache_key(prompt, 60, "other-repo"),
+        get_cache_key(prompt, 60, "repo", section=1),
+        get_cache_key(prompt.replace("slow", "fast"), 60, "repo"),
+    }
+    assert len(keys) == 5
+
+def test_store_and_lookup(cache_dir, tmp_path):
+    output = str(tmp_path / "output.wav")
+    assert not music_cache.lookup_music("a" * 64, output)
+
+    assert music_cache.store_music("a" * 64, write(tmp_path / "generated.wav", 100), {"prompt": "x"})
+    assert music_cache.lookup_music("a" * 64, output)
+    assert os.path.getsize(output) == 100
+    assert not os.path.samefile(output, music_cache._entry_path("a" * 64))  # Copied, never linked
+
+def test_empty_entry_is_a_miss(cache_dir, tmp_path):
+    music_cache.store_music("b" * 64, write(tmp_path / "empty.wav", 0))
+    assert not music_cache.lookup_music("b" * 64, str(tmp_path / "output.wav"))
+
+def test_eviction_removes_least_recently_used(cache_dir, tmp_path):
+    source = write(tmp_path / "generated.wav", 100)
+    for index, key in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        music_cache.store_music(key, source, {"prompt": key})
+        age(key, 300 - index * 100)
+    music_cache.lookup_music("a" * 64, str(tmp_path / "output.wav"))  # Now the most recently used
+
+    assert music_cache.evict_music_cache(max_entries=2) == 1
+    assert sorted(os.listdir(cache_dir)) == sorted(f"{key}{suffix}" for key in ("a" * 64, "c" * 64)
+                                                   for suffix in (".wav", ".json"))
+    assert music_cache.evict_music_cache(max_entries=10, max_bytes=150) == 1
+    assert music_cache.has_music("a" * 64) and not music_cache.has_music("c" * 64)
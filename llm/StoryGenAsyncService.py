@@ -0,0 +1,436 @@
+"""Async (ASGI) serving mode for the story service.
+
+Same routes, request bodies and responses as StoryGenService, but every
+LLM call is awaited on the event loop instead of holding a worker thread,
+acts are expanded with asyncio, and in-flight calls are capped per provider.
+Prompts, validation, story assembly, caching and the call ledger come from
+services.story_prompts and services.story_generation, shared with
+StoryGenService; this module only awaits the calls, and runs checkpoint
+and cache file I/O in worker threads.
+
+Run from llm/:
+    uvicorn StoryGenAsyncService:app --host 0.0.0.0 --port 5007
+"""
+import os
+import time
+import asyncio
+import logging
+import anthropic
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from services.story_stream import StoryStreamParser
+from services.prompt_cache import log_usage
+from services.stub_client import AsyncStubAnthropicClient
+from services.story_cache import AsyncSingleFlight
+from services.story_json import validate_story
+from services.story_checkpoint import StoryCheckpoint, valid_job_id
+from services.sequence_budget import plan_chunk_sizes, valid_num_sequences, STORY_MAX_SEQUENCES
+from services.llm_backends import AsyncLLMRouter, AsyncOllamaClient, LLM_PROVIDERS, httpx
+from services.story_continuity import StoryContinuity
+from services.story_prompts import system_prompt, outline_system_prompt, build_outline_prompt, build_chunk_prompt
+from services.story_generation import (
+    OUTLINE_MAX_TOKENS, STORY_CHUNK_RETRIES, STORY_GENERATION_MODE, story_cache, call_ledger, tokens_per_sequence,
+    start_logging, message_params, parse_json_response, read_outline_message, read_chunk_message, check_outline,
+    prepare_chunk, check_chunk_response, apply_sequence_budget, append_chunk, outline_story, log_story_budget,
+    ChunkEvents, cached_story_events, story_cache_key, cache_story, open_story_job, format_stream_event, use_outline
+)
+
+log_listener = start_logging()
+logger = logging.getLogger(__name__)
+
+api_key = os.getenv('ANTHROPIC_API_KEY')
+if not api_key:
+    logger.error("ANTHROPIC_API_KEY not found in environment variables")
+
+# Stories generated at once; further requests wait in the event loop, which keeps memory bounded
+STORY_MAX_CONCURRENT_STORIES = int(os.getenv("STORY_MAX_CONCURRENT_STORIES", 64))
+
+# Initialize async LLM providers (ANTHROPIC_STUB=true runs offline with canned stories)
+async_providers = {}
+if os.getenv('ANTHROPIC_STUB', 'false').lower() in ('true', '1', 't'):
+    async_providers['anthropic'] = AsyncStubAnthropicClient()
+elif api_key:
+    async_providers['anthropic'] = anthropic.AsyncAnthropic(
+        api_key=api_key
+    )
+if 'ollama' in LLM_PROVIDERS and httpx is not None:
+    async_providers['ollama'] = AsyncOllamaClient()
+
+client = AsyncLLMRouter(async_providers)
+story_flights = AsyncSingleFlight()
+
+class StorySlots:
+    """Caps the stories generated at once; /health reports how many slots are free."""
+
+    def __init__(self, size):
+        self.size = size
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self.in_use += 1
+
+    async def __aexit__(self, *exc):
+        self.in_use -= 1
+        self._semaphore.release()
+        return False
+
+    @property
+    def free(self):
+        return self.size - self.in_use
+
+story_slots = StorySlots(STORY_MAX_CONCURRENT_STORIES)
+
+async def with_retries(label, attempt):
+    """Await attempt() until it succeeds, up to STORY_CHUNK_RETRIES times."""
+    for attempt_number in range(1, STORY_CHUNK_RETRIES + 1):
+        try:
+            return await attempt()
+        except Exception as e:
+            if attempt_number == STORY_CHUNK_RETRIES:
+                raise
+            logger.warning(f"{label} failed (attempt {attempt_number}/{STORY_CHUNK_RETRIES}): {str(e)}")
+            await asyncio.sleep(min(2 ** attempt_number, 10))
+
+async def cache_get(cache_key):
+    return await asyncio.to_thread(story_cache.get, cache_key) if story_cache else None
+
+async def cache_put(llm, cache_key, story):
+    if story_cache:
+        await asyncio.to_thread(cache_story, llm, cache_key, story)
+
+async def request_story_outline(client, prompt, chunk_sizes, genre=None):
+    outline_prompt = build_outline_prompt(prompt, chunk_sizes, genre)
+    with call_ledger.timed("outline", total_chunks=len(chunk_sizes), prompt=outline_prompt) as entry:
+        message = await client.messages.create(
+            **message_params("outline", outline_system_prompt, outline_prompt, OUTLINE_MAX_TOKENS)
+        )
+        return read_outline_message(entry, message, len(chunk_sizes))
+
+async def request_story_chunk(client, chunk_prompt, chunk_number, total_chunks, max_tokens):
+    """Make one chunk call and return (parsed chunk, usage report with stop_reason)."""
+    with call_ledger.timed("chunk", chunk_number, total_chunks, prompt=chunk_prompt, max_tokens=max_tokens) as entry:
+        message = await client.messages.create(**message_params("chunk", system_prompt, chunk_prompt, max_tokens))
+        return read_chunk_message(entry, message, chunk_number, total_chunks)
+
+async def generate_story_chunk(client, prompt, chunk_number, total_chunks, sequence_count, continuity=None, genre=None,
+                               outline=None, checkpoint=None):
+    """Async version of StoryGenService.generate_story_chunk."""
+    if checkpoint:
+        saved = await asyncio.to_thread(checkpoint.load_chunk, chunk_number)
+        if saved:
+            logger.info(f"Resuming chunk {chunk_number}/{total_chunks} from checkpoint {checkpoint.job_id}")
+            return saved
+
+    chunk_prompt, require_header, limit = prepare_chunk(prompt, chunk_number, total_chunks, sequence_count, continuity,
+                                                        genre, outline)
+
+    async def attempt():
+        chunk, usage = await request_story_chunk(client, chunk_prompt, chunk_number, total_chunks, limit['max_tokens'])
+        return check_chunk_response(chunk, usage, sequence_count, require_header, limit)
+
+    chunk, usage = await with_retries(f"Chunk {chunk_number}/{total_chunks}", attempt)
+    apply_sequence_budget(chunk, usage, chunk_number, total_chunks, sequence_count)
+
+    if checkpoint:
+        await asyncio.to_thread(checkpoint.save_chunk, chunk_number, chunk)
+    return chunk
+
+async def generate_story_sequential(client, prompt, chunk_sizes, genre=None, checkpoint=None):
+    """Generate chunks one after another, each continuing from a compact summary of the story so far."""
+    total_chunks = len(chunk_sizes)
+    continuity = StoryContinuity()
+    final_story = await generate_story_chunk(client, prompt, 1, total_chunks, chunk_sizes[0], genre=genre,
+                                             checkpoint=checkpoint)
+    budgets = [final_story.pop('budget', None)]
+    continuity.observe_story(final_story)
+
+    for chunk_num in range(2, total_chunks + 1):
+        chunk = await generate_story_chunk(
+            client, prompt, chunk_num, total_chunks, chunk_sizes[chunk_num - 1],
+            continuity=continuity.render(),
+            genre=genre,
+            checkpoint=checkpoint
+        )
+        budgets.append(append_chunk(final_story, chunk, continuity, chunk_num, total_chunks))
+
+    return final_story, budgets
+
+async def generate_story_parallel(client, prompt, chunk_sizes, genre=None, checkpoint=None):
+    """Plan an outline, then expand every act concurrently with asyncio.gather."""
+    total_chunks = len(chunk_sizes)
+    outline = await asyncio.to_thread(checkpoint.load_outline) if checkpoint else None
+    if outline is None:
+        outline = await with_retries("Outline", lambda: request_story_outline(client, prompt, chunk_sizes, genre))
+        if checkpoint:
+            await asyncio.to_thread(checkpoint.save_outline, outline)
+    logger.info(f"Outline ready: {outline['movie_info'].get('title')} ({total_chunks} acts)")
+
+    # Every act runs to completion (and is checkpointed) even if another one fails
+    results = await asyncio.gather(*(
+        generate_story_chunk(client, prompt, chunk_num, total_chunks, chunk_sizes[chunk_num - 1], genre=genre,
+                             outline=outline, checkpoint=checkpoint)
+        for chunk_num in range(1, total_chunks + 1)
+    ), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    return outline_story(outline, results)
+
+async def generate_story(client, prompt, genre, num_sequences, mode=STORY_GENERATION_MODE, checkpoint=None):
+    """Async version of StoryGenService.generate_story."""
+    chunk_sizes = plan_chunk_sizes(num_sequences)
+    logger.info(f"Planned {num_sequences} sequences as chunks of {chunk_sizes}")
+
+    if use_outline(mode, chunk_sizes):
+        final_story, budgets = await generate_story_parallel(client, prompt, chunk_sizes, genre, checkpoint)
+    else:
+        final_story, budgets = await generate_story_sequential(client, prompt, chunk_sizes, genre, checkpoint)
+
+    log_story_budget(num_sequences, budgets)
+    return final_story
+
+async def stream_story_events(client, system, content, max_tokens, label="Stream", route="chunk",
+                              chunk_number=None, total_chunks=None):
+    """Async version of StoryGenService.stream_story_events; cancelling the task closes the upstream stream."""
+    parser = StoryStreamParser()
+    sequences = 0
+    with call_ledger.timed(route, chunk_number, total_chunks, prompt=content, max_tokens=max_tokens, streamed=True) as entry:
+        async with client.messages.stream(**message_params(route, system, content, max_tokens)) as stream:
+            async for text in stream.text_stream:
+                if 'first_token_latency' not in entry.fields:
+                    entry['first_token_latency'] = round(time.time() - entry.started, 3)
+                for event, value in parser.feed(text):
+                    sequences += event == "sequence"
+                    yield event, value
+            message = await stream.get_final_message()
+            entry.response(message)
+            entry['sequences'] = sequences
+            usage = log_usage(label, message.usage)
+    tokens_per_sequence.observe(usage['output_tokens'], sequences)
+    yield ("complete", parser.text)
+
+async def stream_story_sequential(client, prompt, chunk_sizes, genre=None):
+    """Yield story events chunk by chunk; each chunk starts once the previous one has finished."""
+    total_chunks = len(chunk_sizes)
+    continuity = StoryContinuity()
+    for chunk_num, sequence_count in enumerate(chunk_sizes, 1):
+        chunk_prompt = build_chunk_prompt(prompt, chunk_num, total_chunks, sequence_count, continuity.render(), genre)
+        relay = ChunkEvents(chunk_num, sequence_count, continuity)
+        async for event, value in stream_story_events(client, system_prompt, chunk_prompt,
+                                                      tokens_per_sequence.max_tokens_for(sequence_count),
+                                                      f"Chunk {chunk_num}/{total_chunks}", chunk_number=chunk_num,
+                                                      total_chunks=total_chunks):
+            if relay.accept(event, value):
+                yield event, value
+
+async def stream_story_parallel(client, prompt, chunk_sizes, genre=None):
+    """Yield events from a streamed outline, then from all acts streamed concurrently and relayed in story order."""
+    total_chunks = len(chunk_sizes)
+    outline = None
+    async for event, value in stream_story_events(client, outline_system_prompt,
+                                                  build_outline_prompt(prompt, chunk_sizes, genre), OUTLINE_MAX_TOKENS,
+                                                  "Outline", "outline", total_chunks=total_chunks):
+        if event == "complete":
+            outline = check_outline(parse_json_response(value), total_chunks)
+        else:
+            yield event, value
+    if outline is None:
+        return
+
+    queues = [asyncio.Queue() for _ in range(total_chunks)]
+
+    async def expand(chunk_num):
+        events = queues[chunk_num - 1]
+        try:
+            sequence_count = chunk_sizes[chunk_num - 1]
+            chunk_prompt = build_chunk_prompt(prompt, chunk_num, total_chunks, sequence_count, genre=genre, outline=outline)
+            relay = ChunkEvents(chunk_num, sequence_count)
+            async for event, value in stream_story_events(client, system_prompt, chunk_prompt,
+                                                          tokens_per_sequence.max_tokens_for(sequence_count),
+                                                          f"Chunk {chunk_num}/{total_chunks}", chunk_number=chunk_num,
+                                                          total_chunks=total_chunks):
+                if relay.accept(event, value):
+                    events.put_nowait((event, value))
+        except Exception as e:
+            events.put_nowait(("error", f"Act {chunk_num} failed: {str(e)}"))
+        finally:
+            events.put_nowait(None)
+
+    tasks = [asyncio.ensure_future(expand(chunk_num)) for chunk_num in range(1, total_chunks + 1)]
+    try:
+        for events in queues:
+            while True:
+                item = await events.get()
+                if item is None:
+                    break
+                if item[0] == "error":
+                    raise RuntimeError(item[1])
+                yield item
+    finally:
+        # Stops act streams that are still running once the client has what it asked for
+        for task in tasks:
+            task.cancel()
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+async def generate_cinematic_story(request):
+    try:
+        data = await read_json(request)
+        logger.info(f"Story request: num_sequences={data.get('num_sequences') if data else None}, "
+                    f"genre={data.get('genre') if data else None}, mode={data.get('mode') if data else None}")
+
+        if data and data.get('job_id') is not None and not valid_job_id(data['job_id']):
+            return JSONResponse({'error': f"Invalid job_id: {data['job_id']!r} (use 1-64 letters, digits, _ or -)", 'status': 'error'}, 400)
+        
+        # A job id alone resumes a partially generated story with its original request
+        if data and data.get('job_id') and 'prompt' not in data:
+            saved_request = await asyncio.to_thread(lambda: StoryCheckpoint(data['job_id']).load_request())
+            if not saved_request:
+                return JSONResponse({'error': f"Unknown story job: {data['job_id']}", 'status': 'error'}, 404)
+            data = dict(saved_request, job_id=data['job_id'])
+
+        if not data or 'prompt' not in data:
+            return JSONResponse({'error': 'Please provide a prompt', 'status': 'error'}, 400)
+
+        prompt = data.get('prompt')
+        genre = data.get('genre')
+        num_sequences = data.get('num_sequences', 25)
+        if not valid_num_sequences(num_sequences):
+            return JSONResponse({'error': f"Invalid num_sequences: {num_sequences!r} (use a whole number from 1 to {STORY_MAX_SEQUENCES})", 'status': 'error'}, 400)
+        mode = data.get('mode', STORY_GENERATION_MODE)
+        llm = client.prefer(data.get('provider'), chunk=data.get('chunk_provider'))
+        variant = data.get('variant', data.get('seed'))
+        cache_key = story_cache_key(prompt, genre, num_sequences, mode, variant, data.get('provider'), data.get('chunk_provider'))
+        job_id = data.get('job_id') or cache_key[:16]
+
+        final_story = await cache_get(cache_key)
+        cache_status = 'hit'
+        if final_story is None:
+            async def build():
+                checkpoint = await asyncio.to_thread(open_story_job, job_id, {
+                    'prompt': prompt, 'genre': genre, 'num_sequences': num_sequences, 'mode': mode, 'variant': variant
+                })
+                try:
+                    async with story_slots:
+                        story = await generate_story(llm, prompt, genre, num_sequences, mode, checkpoint)
+                except Exception as e:
+                    e.job_id = job_id
+                    e.completed_chunks = await asyncio.to_thread(checkpoint.completed_chunks)
+                    raise
+                await cache_put(llm, cache_key, story)
+                await asyncio.to_thread(checkpoint.clear)
+                return story
+
+            final_story, shared = await story_flights.do(cache_key, build)
+            cache_status = 'shared' if shared else 'miss'
+        logger.info(f"Story cache {cache_status} for {cache_key[:12]}")
+
+        return JSONResponse(final_story, headers={'X-Story-Cache': cache_status, 'X-Story-Job': job_id})
+
+    except Exception as e:
+        logger.error(f"Error generating cinematic story: {str(e)}")
+        error = {
+            'error': f"Error: {str(e)}",
+            'status': 'error'
+        }
+        if hasattr(e, 'job_id'):
+            error['job_id'] = e.job_id
+            error['completed_chunks'] = e.completed_chunks
+        return JSONResponse(error, 500)
+
+async def generate_cinematic_story_stream(request):
+    """Stream a story as NDJSON (or SSE) events while it is being written; see StoryGenService."""
+    data = await read_json(request)
+    if not data or 'prompt' not in data:
+        return JSONResponse({'error': 'Please provide a prompt', 'status': 'error'}, 400)
+
+    prompt = data.get('prompt')
+    genre = data.get('genre')
+    num_sequences = data.get('num_sequences', 25)
+    if not valid_num_sequences(num_sequences):
+        return JSONResponse({'error': f"Invalid num_sequences: {num_sequences!r} (use a whole number from 1 to {STORY_MAX_SEQUENCES})", 'status': 'error'}, 400)
+    chunk_sizes = plan_chunk_sizes(num_sequences)
+    mode = data.get('mode', STORY_GENERATION_MODE)
+    llm = client.prefer(data.get('provider'), chunk=data.get('chunk_provider'))
+    sse = 'text/event-stream' in request.headers.get('accept', '')
+
+    variant = data.get('variant', data.get('seed'))
+    cache_key = story_cache_key(prompt, genre, num_sequences, mode, variant, data.get('provider'), data.get('chunk_provider'))
+    cached_story = await cache_get(cache_key)
+
+    async def replay(story):
+        for event, value in cached_story_events(story):
+            yield format_stream_event(event, value, sse)
+
+    async def generate():
+        produce = stream_story_parallel if use_outline(mode, chunk_sizes) else stream_story_sequential
+        story = {'sequence': []}
+        emitted = 0
+        events = produce(llm, prompt, chunk_sizes, genre)
+        try:
+            async with story_slots:
+                async for event, value in events:
+                    if event == "sequence":
+                        emitted += 1
+                        value['sequence_number'] = emitted
+                        story['sequence'].append(value)
+                    else:
+                        story[event] = value
+                    yield format_stream_event(event, value, sse)
+                    if emitted >= num_sequences:
+                        break
+            # A stream cut short or missing its header is reported, never cached
+            validate_story(story, num_sequences)
+            await cache_put(llm, cache_key, story)
+            yield format_stream_event("done", {"sequences": emitted}, sse)
+        except Exception as e:
+            logger.error(f"Error streaming cinematic story: {str(e)}")
+            yield format_stream_event("error", {"error": str(e), "sequences": emitted}, sse)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        replay(cached_story) if cached_story else generate(),
+        media_type='text/event-stream' if sse else 'application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'}
+    )
+
+async def health_check(request):
+    # Passive: reports the outcomes of recent story calls and never calls a provider itself
+    llm_stats = client.stats()
+    healthy = [name for name, provider in llm_stats['providers'].items() if provider['healthy']]
+    body = {
+        'status': 'healthy' if healthy else 'degraded',
+        'providers': llm_stats['providers'],
+        'provider_order': llm_stats['order'],
+        'anthropic_status': 'connected' if 'anthropic' in healthy else 'disconnected',
+        'story_slots_free': story_slots.free
+    }
+    if not healthy:
+        body['error'] = 'No LLM provider is available'
+        return JSONResponse(body, 503)
+    return JSONResponse(body)
+
+app = Starlette(
+    routes=[
+        Route('/generate-cinematic-story', generate_cinematic_story, methods=['POST']),
+        Route('/generate-cinematic-story/stream', generate_cinematic_story_stream, methods=['POST']),
+        Route('/health', health_check, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5007)
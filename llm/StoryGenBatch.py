@@ -0,0 +1,298 @@
+"""Offline bulk story generation through a message-batch interface.
+
+Stories from a prompt list are generated in rounds of batch requests
+instead of interactive calls: one round for the outlines (and for stories
+small enough to be a single chunk), then one round with every act of every
+outlined story. Failed or invalid items are resubmitted in the next round.
+Batch ids and story status are persisted, so the job survives restarts and
+can be advanced from cron. Finished stories go to a JSONL or Firestore sink
+and into the story cache, so the interactive service serves them instantly.
+
+Usage (from llm/):
+    python StoryGenBatch.py submit prompts.jsonl --sink jsonl:stories.jsonl
+    python StoryGenBatch.py run <bulk_id>       # poll until every story is finished
+    python StoryGenBatch.py advance <bulk_id>   # one polling step, e.g. from cron
+    python StoryGenBatch.py status <bulk_id>
+"""
+import os
+import re
+import json
+import time
+import argparse
+import threading
+
+from StoryGenService import logger, client, llm_providers
+from services.story_prompts import system_prompt, outline_system_prompt, build_outline_prompt, build_chunk_prompt
+from services.story_generation import (
+    STORY_MODEL, STORY_TEMPERATURE, OUTLINE_MAX_TOKENS, STORY_CHUNK_RETRIES, story_cache, tokens_per_sequence,
+    check_outline, parse_json_response, check_chunk_response, apply_sequence_budget, outline_story, story_cache_key,
+    open_story_job
+)
+from services.prompt_cache import system_blocks
+from services.story_checkpoint import StoryCheckpoint
+from services.sequence_budget import plan_chunk_sizes, valid_num_sequences, STORY_MAX_SEQUENCES
+from services.story_batch import (
+    AnthropicBatchBackend, LocalBatchBackend, open_sink, STORY_BATCH_DIR, STORY_BATCH_MAX_REQUESTS
+)
+
+BULK_POLL_INTERVAL = int(os.getenv("BULK_POLL_INTERVAL", 60))  # Seconds between batch status checks
+
+def story_id_for(line, cache_key):
+    """Use the line's id (sanitised for batch custom_ids) or a prefix of the story cache key."""
+    raw = str(line.get("id") or line.get("request_id") or cache_key[:16])
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", raw)[:48]
+
+class BulkStoryJob:
+    """One bulk generation run, persisted as `{STORY_BATCH_DIR}/{bulk_id}.json`.
+
+    Outlines and acts are stored in each story's regular job checkpoint
+    (StoryCheckpoint, keyed like interactive requests), so the state file
+    only tracks batch ids, attempts and story status.
+    """
+
+    def __init__(self, bulk_id, state):
+        self.bulk_id = bulk_id
+        self.state = state
+        self.backend = make_backend(state["backend"], state.get("provider"))
+        self.sink = open_sink(state["sink"])
+
+    @staticmethod
+    def path(bulk_id):
+        return os.path.join(STORY_BATCH_DIR, f"{bulk_id}.json")
+
+    @classmethod
+    def create(cls, prompt_lines, sink, backend="anthropic", provider=None, genre=None, num_sequences=25):
+        bulk_id = time.strftime("bulk-%Y%m%d-%H%M%S")
+        stories = {}
+        for line in prompt_lines:
+            prompt = line.get("prompt") or line.get("body")
+            if not prompt:
+                continue
+            count = line.get("num_sequences", num_sequences)
+            if not valid_num_sequences(count):
+                logger.warning(f"Skipping prompt with invalid num_sequences {count!r} "
+                               f"(use a whole number from 1 to {STORY_MAX_SEQUENCES})")
+                continue
+            request_fields = {
+                "prompt": prompt,
+                "genre": line.get("genre", genre),
+                "num_sequences": count,
+                "mode": "outline",
+                "variant": line.get("variant", line.get("seed"))
+            }
+            cache_key = story_cache_key(**request_fields, provider=provider if backend == "local" else None)
+            story_id = story_id_for(line, cache_key)
+            if story_id in stories or any(story["cache_key"] == cache_key for story in stories.values()):
+                logger.warning(f"Skipping duplicate story {story_id}")
+                continue
+            stories[story_id] = {
+                "request": request_fields,
+                "cache_key": cache_key,
+                "job_id": cache_key[:16],
+                "chunk_sizes": plan_chunk_sizes(request_fields["num_sequences"]),
+                "status": "pending",
+                "attempts": {},
+                "max_tokens": {},
+                "error": None
+            }
+
+        state = {"backend": backend, "provider": provider, "sink": sink, "created": time.time(),
+                 "stories": stories, "batches": []}
+        job = cls(bulk_id, state)
+        for story in stories.values():
+            open_story_job(story["job_id"], story["request"])
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, bulk_id):
+        with open(cls.path(bulk_id), "r") as f:
+            return cls(bulk_id, json.load(f))
+
+    def save(self):
+        os.makedirs(STORY_BATCH_DIR, exist_ok=True)
+        temp_path = f"{self.path(self.bulk_id)}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.path(self.bulk_id))
+
+    def pending_items(self, story):
+        """Items a story still needs: "outline", or "chunk<n>" for each act not yet checkpointed."""
+        checkpoint = StoryCheckpoint(story["job_id"])
+        chunk_sizes = story["chunk_sizes"]
+        if len(chunk_sizes) > 1 and checkpoint.load_outline() is None:
+            return ["outline"]
+        done = set(checkpoint.completed_chunks())
+        return [f"chunk{n}" for n in range(1, len(chunk_sizes) + 1) if n not in done]
+
+    def build_request(self, story_id, story, item):
+        request_fields = story["request"]
+        chunk_sizes = story["chunk_sizes"]
+        if item == "outline":
+            system, content, max_tokens = (outline_system_prompt,
+                                           build_outline_prompt(request_fields["prompt"], chunk_sizes, request_fields["genre"]),
+                                           OUTLINE_MAX_TOKENS)
+        else:
+            chunk_number = int(item[5:])
+            outline = StoryCheckpoint(story["job_id"]).load_outline() if len(chunk_sizes) > 1 else None
+            sequence_count = chunk_sizes[chunk_number - 1]
+            system = system_prompt
+            content = build_chunk_prompt(request_fields["prompt"], chunk_number, len(chunk_sizes), sequence_count,
+                                         genre=request_fields["genre"], outline=outline)
+            max_tokens = story["max_tokens"].get(item) or tokens_per_sequence.max_tokens_for(sequence_count)
+        return {
+            "custom_id": f"{story_id}-{item}",
+            "route": "outline" if item == "outline" else "chunk",
+            "params": {
+                "model": STORY_MODEL,
+                "max_tokens": max_tokens,
+                "temperature": STORY_TEMPERATURE,
+                "system": system_blocks(system),
+                "messages": [{"role": "user", "content": content}]
+            }
+        }
+
+    def handle_result(self, result):
+        story_id, _, item = result["custom_id"].rpartition("-")
+        story = self.state["stories"].get(story_id)
+        if story is None or story["status"] != "pending":
+            return
+        checkpoint = StoryCheckpoint(story["job_id"])
+        chunk_sizes = story["chunk_sizes"]
+        try:
+            if not result["ok"]:
+                raise RuntimeError(result["error"])
+            if result.get("fallback"):
+                story["fallback"] = True  # Kept out of the story cache
+            if item == "outline":
+                checkpoint.save_outline(check_outline(parse_json_response(result["text"]), len(chunk_sizes)))
+                return
+            chunk_number = int(item[5:])
+            sequence_count = chunk_sizes[chunk_number - 1]
+            limit = {"max_tokens": story["max_tokens"].get(item) or tokens_per_sequence.max_tokens_for(sequence_count)}
+            usage = dict(result["usage"], stop_reason=result["stop_reason"])
+            try:
+                chunk, usage = check_chunk_response(parse_json_response(result["text"]), usage, sequence_count,
+                                                     len(chunk_sizes) == 1, limit)
+            finally:
+                story["max_tokens"][item] = limit["max_tokens"]
+            apply_sequence_budget(chunk, usage, chunk_number, len(chunk_sizes), sequence_count)
+            checkpoint.save_chunk(chunk_number, chunk)
+        except Exception as e:
+            story["attempts"][item] = story["attempts"].get(item, 0) + 1
+            logger.warning(f"Bulk {self.bulk_id}: {result['custom_id']} failed "
+                           f"(attempt {story['attempts'][item]}/{STORY_CHUNK_RETRIES}): {str(e)}")
+            if story["attempts"][item] >= STORY_CHUNK_RETRIES:
+                story["status"] = "failed"
+                story["error"] = f"{item}: {str(e)}"
+
+    def finish(self, story_id, story):
+        """Stitch a story whose pieces are all checkpointed, write it to the sink and the story cache."""
+        checkpoint = StoryCheckpoint(story["job_id"])
+        chunks = [checkpoint.load_chunk(n) for n in range(1, len(story["chunk_sizes"]) + 1)]
+        if len(chunks) == 1:
+            final_story = chunks[0]
+            final_story.pop("budget", None)
+        else:
+            final_story, _ = outline_story(checkpoint.load_outline(), chunks)
+        self.sink.write(story_id, story["request"], final_story)
+        if story_cache and not story.get("fallback"):
+            story_cache.put(story["cache_key"], final_story)
+        checkpoint.clear()
+        story["status"] = "done"
+
+    def advance(self):
+        """Collect ended batches, finish complete stories and submit the next round. Returns status counts."""
+        for batch in self.state["batches"]:
+            if batch["collected"]:
+                continue
+            batch["status"] = self.backend.status(batch["id"])
+            if batch["status"] == "ended":
+                for result in self.backend.results(batch["id"]):
+                    self.handle_result(result)
+                batch["collected"] = True
+                self.save()
+
+        in_flight = {custom_id for batch in self.state["batches"] if not batch["collected"]
+                     for custom_id in batch["custom_ids"]}
+        requests = []
+        for story_id, story in self.state["stories"].items():
+            if story["status"] != "pending":
+                continue
+            cached = story_cache.get(story["cache_key"]) if story_cache else None
+            if cached is not None:
+                self.sink.write(story_id, story["request"], cached)
+                story["status"] = "done"
+                continue
+            items = self.pending_items(story)
+            if not items:
+                self.finish(story_id, story)
+                continue
+            requests += [self.build_request(story_id, story, item) for item in items
+                         if f"{story_id}-{item}" not in in_flight]
+
+        for start in range(0, len(requests), STORY_BATCH_MAX_REQUESTS):
+            part = requests[start:start + STORY_BATCH_MAX_REQUESTS]
+            batch_id = self.backend.submit(part)
+            self.state["batches"].append({"id": batch_id, "submitted": time.time(), "status": "in_progress",
+                                          "collected": False, "custom_ids": [request["custom_id"] for request in part]})
+            logger.info(f"Bulk {self.bulk_id}: submitted batch {batch_id} with {len(part)} requests")
+        self.save()
+        return self.counts()
+
+    def counts(self):
+        counts = {"pending": 0, "done": 0, "failed": 0}
+        for story in self.state["stories"].values():
+            counts[story["status"]] += 1
+        counts["open_batches"] = sum(1 for batch in self.state["batches"] if not batch["collected"])
+        return counts
+
+def make_backend(name, provider=None):
+    if name == "anthropic":
+        anthropic_client = llm_providers.get("anthropic")
+        if anthropic_client is None or not hasattr(anthropic_client.messages, "batches"):
+            raise RuntimeError("The Anthropic batch backend needs ANTHROPIC_API_KEY; use --backend local")
+        return AnthropicBatchBackend(anthropic_client)
+    if name == "local":
+        return LocalBatchBackend(client, provider)
+    raise ValueError(f"Unknown batch backend: {name}")
+
+def read_prompt_lines(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate catalog stories offline through batch requests")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Start a bulk job from a JSONL prompt list")
+    submit.add_argument("prompts", help="JSONL file with a prompt (or body) per line, plus optional genre, num_sequences, id")
+    submit.add_argument("--sink", required=True, help="jsonl:<path> or firestore[:<collection>]")
+    submit.add_argument("--backend", default="anthropic", choices=["anthropic", "local"])
+    submit.add_argument("--provider", help="Provider for the local backend (default: LLM_PROVIDERS order)")
+    submit.add_argument("--genre", help="Genre for lines that do not set one")
+    submit.add_argument("--num-sequences", type=int, default=25, help="Sequences for lines that do not set num_sequences")
+
+    for name, help_text in (("advance", "Collect finished batches and submit the next round once"),
+                            ("run", "Advance until every story is done or failed"),
+                            ("status", "Show story and batch counts")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("bulk_id")
+        if name == "run":
+            command.add_argument("--poll", type=int, default=BULK_POLL_INTERVAL, help="Seconds between polls")
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        job = BulkStoryJob.create(read_prompt_lines(args.prompts), args.sink, args.backend, args.provider,
+                                  args.genre, args.num_sequences)
+        print(f"{job.bulk_id}: {len(job.state['stories'])} stories, {job.advance()}")
+    elif args.command == "status":
+        print(json.dumps(BulkStoryJob.load(args.bulk_id).counts()))
+    else:
+        job = BulkStoryJob.load(args.bulk_id)
+        while True:
+            counts = job.advance()
+            print(json.dumps(counts))
+            if args.command == "advance" or (counts["pending"] == 0):
+                break
+            time.sleep(args.poll)
@@ -0,0 +1,225 @@
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import queue
+import atexit
+import random
+import argparse
+import threading
+
+from services.prompt_cache import usage_report, blocks_text
+
+LLM_LEDGER_ENABLED = os.getenv("LLM_LEDGER_ENABLED", "true").lower() in ("true", "1", "t")
+LLM_LEDGER_DIR = os.getenv("LLM_LEDGER_DIR", os.path.expanduser("~/.cache/deepflix/llm_ledger"))
+LLM_LEDGER_SAMPLE_RATE = float(os.getenv("LLM_LEDGER_SAMPLE_RATE", 0.01))  # Share of calls stored with prompt and response
+LLM_LEDGER_MAX_BYTES = int(os.getenv("LLM_LEDGER_MAX_BYTES", 64 * 1024 * 1024))  # Compressed size before rotating
+LLM_LEDGER_KEEP_FILES = int(os.getenv("LLM_LEDGER_KEEP_FILES", 30))
+LLM_LEDGER_QUEUE_SIZE = 10000  # Records waiting for the writer; more are dropped rather than blocking a request
+
+class LedgerEntry:
+    """One LLM call being recorded. Fill it in inside `CallLedger.timed`."""
+
+    def __init__(self, fields, prompt=None):
+        self.fields = fields
+        self.prompt = prompt
+        self.text = None
+        self.started = time.time()
+
+    def __setitem__(self, key, value):
+        self.fields[key] = value
+
+    def response(self, message):
+        """Record the model, token usage, stop reason and latency of a finished response."""
+        self.fields["latency"] = round(time.time() - self.started, 3)
+        self.fields["model"] = getattr(message, "model", None)
+        self.fields["stop_reason"] = getattr(message, "stop_reason", None)
+        self.fields.update(usage_report(getattr(message, "usage", None)))
+        self.text = message.content[0].text if getattr(message, "content", None) else None
+
+class CallLedger:
+    """Structured per-call record of every LLM request, written off the request thread.
+
+    Records go onto a bounded queue and a background thread appends them in
+    batches to gzip-compressed JSONL (one gzip member per batch, so files
+    stay readable while they grow). Files rotate at LLM_LEDGER_MAX_BYTES
+    and only the newest LLM_LEDGER_KEEP_FILES are kept. Prompt and response
+    bodies are stored for a LLM_LEDGER_SAMPLE_RATE share of calls and for
+    every failed one.
+    """
+
+    def __init__(self, ledger_dir=LLM_LEDGER_DIR, sample_rate=LLM_LEDGER_SAMPLE_RATE,
+                 max_bytes=LLM_LEDGER_MAX_BYTES, keep_files=LLM_LEDGER_KEEP_FILES):
+        self.ledger_dir = ledger_dir
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.keep_files = keep_files
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=LLM_LEDGER_QUEUE_SIZE)
+        self._path = None
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        self._writer = threading.Thread(target=self._run, name="llm-ledger", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def timed(self, route, chunk=None, total_chunks=None, prompt=None, **fields):
+        """Context manager around one call; yields a LedgerEntry and records it on exit.
+
+        An exception inside the block is recorded as the call's error and re-raised.
+        """
+        return _TimedCall(self, dict(fields, route=route, chunk=chunk, total_chunks=total_chunks), prompt)
+
+    def record(self, entry, error=None):
+        fields = dict(entry.fields, ts=round(time.time(), 3))
+        if "latency" not in fields:
+            fields["latency"] = round(time.time() - entry.started, 3)
+        if error is not None:
+            fields["error"] = str(error)
+        if error is not None or random.random() < self.sample_rate:
+            fields["prompt"] = blocks_text(entry.prompt) if entry.prompt is not None else None
+            fields["response"] = entry.text
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                self.dropped += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        if self._path is None or not os.path.exists(self._path) or os.path.getsize(self._path) >= self.max_bytes:
+            self._rotate()
+        lines = "".join(json.dumps(fields) + "\n" for fields in batch)
+        with gzip.open(self._path, "at", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _rotate(self):
+        self._path = os.path.join(self.ledger_dir, f"calls-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+        for old_path in ledger_files(self.ledger_dir)[:-self.keep_files]:
+            os.remove(old_path)
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self.flush()
+
+class _TimedCall:
+    def __init__(self, ledger, fields, prompt):
+        self.ledger = ledger
+        self.entry = LedgerEntry(fields, prompt)
+
+    def __enter__(self):
+        return self.entry
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, GeneratorExit):
+            self.entry["cancelled"] = True  # A streaming consumer stopped early
+            exc = None
+        if self.ledger is not None:
+            self.ledger.record(self.entry, exc)
+        return False
+
+class NullLedger:
+    """Stand-in when the ledger is disabled; entries are filled in but never written."""
+
+    dropped = 0
+
+    def timed(self, route, chunk=None, total_chunks=None, prompt=None, **fields):
+        return _TimedCall(None, dict(fields, route=route), prompt)
+
+    def flush(self):
+        pass
+
+def ledger_files(ledger_dir=LLM_LEDGER_DIR):
+    return sorted(glob.glob(os.path.join(ledger_dir, "calls-*.jsonl.gz")))
+
+def read_ledger(ledger_dir=LLM_LEDGER_DIR, since=None):
+    """Yield ledger records, oldest first, optionally only those newer than `since` (a timestamp)."""
+    for path in ledger_files(ledger_dir):
+        if since and os.path.getmtime(path) < since:
+            continue
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if not since or record.get("ts", 0) >= since:
+                        yield record
+        except (OSError, EOFError, ValueError):
+            continue  # A file still being written can end mid-member
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(records, group_by="route"):
+    """Aggregate call counts, latency percentiles and token use per group."""
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get(group_by) or "-", []).append(record)
+
+    summary = {}
+    for name, calls in sorted(groups.items(), key=lambda item: str(item[0])):
+        succeeded = [call for call in calls if not call.get("error")]
+        latencies = [call["latency"] for call in succeeded if call.get("latency") is not None]
+        sequences = sum(call.get("sequences") or 0 for call in succeeded)
+        output_tokens = sum(call.get("output_tokens", 0) for call in succeeded)
+        sequence_tokens = sum(call.get("output_tokens", 0) for call in succeeded if call.get("sequences"))
+        summary[name] = {
+            "calls": len(calls),
+            "errors": len(calls) - len(succeeded),
+            "p50_latency": percentile(latencies, 0.5),
+            "p95_latency": percentile(latencies, 0.95),
+            "input_tokens": sum(call.get("input_tokens", 0) for call in succeeded),
+            "cache_read_tokens": sum(call.get("cache_read_input_tokens", 0) for call in succeeded),
+            "output_tokens": output_tokens,
+            "max_tokens_stops": sum(1 for call in succeeded if call.get("stop_reason") == "max_tokens"),
+            "tokens_per_sequence": round(sequence_tokens / sequences, 1) if sequences else None,
+        }
+    return summary
+
+def parse_since(value):
+    """Turn '24h', '30m', '7d' or '90s' into a timestamp that many seconds ago."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value or "")
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid duration: {value} (use e.g. 30m, 24h, 7d)")
+    seconds = float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return time.time() - seconds
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report latency and token use from the LLM call ledger")
+    parser.add_argument("--since", type=parse_since, help="Only calls newer than this, e.g. 24h or 7d")
+    parser.add_argument("--by", default="route", choices=["route", "model", "stop_reason", "chunk"],
+                        help="Field to group calls by")
+    parser.add_argument("--dir", default=LLM_LEDGER_DIR, help="Ledger directory")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(read_ledger(args.dir, args.since), args.by)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{args.by:<28} {'calls':>6} {'errors':>6} {'p50 s':>7} {'p95 s':>7} {'input':>9} {'cached':>9} "
+              f"{'output':>9} {'tok/seq':>8}")
+        for name, row in summary.items():
+            print(f"{str(name)[:28]:<28} {row['calls']:>6} {row['errors']:>6} {row['p50_latency'] or 0:>7.2f} "
+                  f"{row['p95_latency'] or 0:>7.2f} {row['input_tokens']:>9} {row['cache_read_tokens']:>9} "
+                  f"{row['output_tokens']:>9} {row['tokens_per_sequence'] or '-':>8}")
@@ -0,0 +1,540 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+from services.prompt_cache import blocks_text
+
+logger = logging.getLogger(__name__)
+
+# Providers in failover order; a request or chunk can prefer another one
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "anthropic,ollama").split(",") if name.strip()]
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi4")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Keep the model loaded between chunks
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 16384))  # The story system prompt alone is several thousand tokens
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 600))
+
+# In-flight calls per provider in the async service; further calls wait for a slot
+LLM_CONCURRENCY = {
+    "anthropic": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", 16)),
+    "ollama": int(os.getenv("OLLAMA_MAX_CONCURRENCY", 2)),  # A local GPU serves few generations at once
+}
+
+# Passive health: a provider is skipped for a cooldown after repeated failures
+HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", 20))  # Recent calls kept per provider
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("LLM_HEALTH_FAILURE_THRESHOLD", 3))  # Consecutive failures before cooldown
+HEALTH_COOLDOWN = float(os.getenv("LLM_HEALTH_COOLDOWN", 60))  # Seconds an unhealthy provider is skipped
+
+# Errors that mean the provider could not answer, as opposed to the request being wrong
+FAILOVER_ERRORS = (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)
+if httpx is not None:
+    FAILOVER_ERRORS += (httpx.TransportError,)
+if anthropic is not None:
+    FAILOVER_ERRORS += (anthropic.APIConnectionError,)  # Includes APITimeoutError
+
+class _Object:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def is_failover_error(error):
+    """True for errors another provider may not hit: connection failures, timeouts, 429 and 5xx.
+
+    Anything else (a 400 for a malformed request, a bug in the caller) would
+    fail the same way on every provider, so it is raised without failover.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, FAILOVER_ERRORS)
+
+class ProviderHealth:
+    """Health of one provider, derived only from the outcomes of real calls.
+
+    Nothing is probed: /health reads this state, so checking it is free.
+    After HEALTH_FAILURE_THRESHOLD consecutive failures the provider is
+    cooled down and skipped; once the cooldown ends the next call tries it
+    again, and a success clears the failure count.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.outcomes = deque(maxlen=HEALTH_WINDOW)  # (timestamp, ok, latency)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency, error=None):
+        with self._lock:
+            self.outcomes.append((time.time(), ok, latency))
+            if ok:
+                self.consecutive_failures = 0
+                self.cooldown_until = 0.0
+                return
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.consecutive_failures >= HEALTH_FAILURE_THRESHOLD:
+                self.cooldown_until = time.time() + HEALTH_COOLDOWN
+                logger.warning(f"LLM provider {self.name} unhealthy after {self.consecutive_failures} failures: {error}")
+
+    @property
+    def healthy(self):
+        return time.time() >= self.cooldown_until
+
+    def snapshot(self):
+        with self._lock:
+            calls = list(self.outcomes)
+        successes = [latency for _, ok, latency in calls if ok]
+        return {
+            "healthy": self.healthy,
+            "recent_calls": len(calls),
+            "recent_failures": len(calls) - len(successes),
+            "consecutive_failures": self.consecutive_failures,
+            "avg_latency": round(sum(successes) / len(successes), 2) if successes else None,
+            "last_call": round(calls[-1][0], 1) if calls else None,
+            "retry_in": max(0.0, round(self.cooldown_until - time.time(), 1)),
+            "last_error": self.last_error,
+        }
+
+class OllamaMessages:
+    """`client.messages` for a local Ollama server, returning Anthropic-shaped messages.
+
+    Uses one pooled keep-alive session and /api/chat, and asks Ollama to
+    keep the model loaded between calls.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL):
+        self.base_url = base_url
+        self.model = model
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+    def _payload(self, max_tokens, system, messages, temperature, stream):
+        chat = [{"role": "system", "content": blocks_text(system)}] if system else []
+        chat += [{"role": message["role"], "content": blocks_text(message["content"])} for message in messages]
+        return {
+            "model": self.model,
+            "messages": chat,
+            "stream": stream,
+            "format": "json",
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"temperature": temperature, "num_predict": max_tokens, "num_ctx": OLLAMA_NUM_CTX},
+        }
+
+    def _message(self, text, final):
+        return _Object(
+            model=self.model,
+            content=[_Object(type="text", text=text)],
+            stop_reason="max_tokens" if final.get("done_reason") == "length" else "end_turn",
+            usage=_Object(
+                input_tokens=final.get("prompt_eval_count", 0),
+                output_tokens=final.get("eval_count", 0),
+                cache_creation_input_tokens=0,
+                cache_read_input_tokens=0,
+            ),
+        )
+
+    def create(self, model=None, max_tokens=4000, system=None, messages=None, temperature=0.7, **kwargs):
+        response = self.session.post(f"{self.base_url}/api/chat",
+                                     json=self._payload(max_tokens, system, messages, temperature, False),
+                                     timeout=OLLAMA_TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
+        return self._message(result["message"]["content"], result)
+
+    def stream(self, model=None, max_tokens=4000, system=None, messages=None, temperature=0.7, **kwargs):
+        response = self.session.post(f"{self.base_url}/api/chat",
+                                     json=self._payload(max_tokens, system, messages, temperature, True),
+                                     timeout=OLLAMA_TIMEOUT, stream=True)
+        response.raise_for_status()
+        return OllamaStream(self, response)
+
+class OllamaStream:
+    """Context manager mirroring the SDK's MessageStream over Ollama's NDJSON stream."""
+
+    def __init__(self, messages, response):
+        self._messages = messages
+        self._response = response
+        self._parts = []
+        self._final = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._response.close()
+        return False
+
+    @property
+    def text_stream(self):
+        for line in self._response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("done"):
+                self._final = event
+                return
+            text = event.get("message", {}).get("content", "")
+            if text:
+                self._parts.append(text)
+                yield text
+
+    def get_final_message(self):
+        return self._messages._message("".join(self._parts), self._final)
+
+class OllamaClient:
+    """Client for a local Ollama server with the same `messages` interface as the Anthropic SDK."""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL):
+        self.messages = OllamaMessages(base_url, model)
+
+class LLMRouter:
+    """Routes story calls across LLM providers with passive health and failover.
+
+    Each call goes to the preferred provider for its route (per request, or
+    per route such as "outline" or "chunk"), then to the remaining
+    providers in LLM_PROVIDERS order. Providers in cooldown are skipped
+    unless every provider is. A call that fails with a connection error,
+    timeout, 429 or 5xx is recorded against its provider and retried on the
+    next one; any other error is raised as is.
+    """
+
+    def __init__(self, providers, order=None):
+        self.providers = providers
+        self.order = [name for name in (order or LLM_PROVIDERS) if name in providers]
+        self.order += [name for name in providers if name not in self.order]
+        self.health = {name: ProviderHealth(name) for name in providers}
+        self.messages = self._messages_view({})
+
+    def _messages_view(self, preferences):
+        return RoutedMessages(self, preferences)
+
+    def prefer(self, provider=None, **route_providers):
+        """Return a client view that tries `provider` first, or a per-route provider (e.g. chunk="ollama")."""
+        preferences = {route: name for route, name in route_providers.items() if name}
+        if provider:
+            preferences.setdefault("default", provider)
+        view = _Object(providers=self.providers)
+        view.messages = self._messages_view(preferences)
+        return view
+
+    def candidates(self, preferred=None):
+        ordered = ([preferred] if preferred in self.providers else []) + [name for name in self.order if name != preferred]
+        healthy = [name for name in ordered if self.health[name].healthy]
+        return healthy or ordered
+
+    def call(self, preferred, operation):
+        """Run operation(name, provider_client) on each candidate until one succeeds."""
+        last_error = None
+        for name in self.candidates(preferred):
+            start = time.time()
+            try:
+                result = operation(name, self.providers[name])
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                self.health[name].record(False, time.time() - start, e)
+                logger.warning(f"LLM provider {name} failed, trying the next one: {str(e)}")
+                last_error = e
+                continue
+            self.health[name].record(True, time.time() - start)
+            return result
+        raise last_error or RuntimeError("No LLM providers configured")
+
+    def stats(self):
+        return {
+            "order": self.order,
+            "providers": {name: self.health[name].snapshot() for name in self.order},
+        }
+
+class RoutedMessages:
+    """`client.messages` view of a router. Calls take an optional `route` keyword ("outline", "chunk").
+
+    `fallbacks` counts the calls through this view that were answered by a
+    provider other than the one their route asked for, so a story written
+    partly by a failover provider can be kept out of the story cache.
+    """
+
+    def __init__(self, router, preferences):
+        self.router = router
+        self.preferences = preferences
+        self.fallbacks = 0
+
+    def _preferred(self, route):
+        return self.preferences.get(route) or self.preferences.get("default")
+
+    def _served(self, route, name):
+        preferred = self._preferred(route)
+        if name != (preferred if preferred in self.router.providers else self.router.order[0]):
+            self.fallbacks += 1
+
+    def create(self, route=None, **kwargs):
+        def operation(name, provider):
+            message = provider.messages.create(**kwargs)
+            self._served(route, name)
+            return message
+        return self.router.call(self._preferred(route), operation)
+
+    def stream(self, route=None, **kwargs):
+        return RoutedStream(self.router, self._preferred(route), kwargs, lambda name: self._served(route, name))
+
+class RoutedStream:
+    """Streams from the first provider that produces text.
+
+    Failover is only possible before any text reaches the caller; an error
+    after that is recorded and re-raised.
+    """
+
+    def __init__(self, router, preferred, kwargs, on_open=None):
+        self.router = router
+        self.preferred = preferred
+        self.kwargs = kwargs
+        self.on_open = on_open
+        self._manager = None
+        self._stream = None
+        self._name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._manager is not None:
+            self._manager.__exit__(*exc)
+        return False
+
+    def _open(self, name, provider):
+        manager = provider.messages.stream(**self.kwargs)
+        stream = manager.__enter__()
+        try:
+            texts = iter(stream.text_stream)
+            first = next(texts, None)
+        except BaseException:
+            manager.__exit__(None, None, None)
+            raise
+        return name, manager, stream, texts, first
+
+    @property
+    def text_stream(self):
+        start = time.time()
+        self._name, self._manager, self._stream, texts, first = self.router.call(self.preferred, self._open)
+        if self.on_open:
+            self.on_open(self._name)
+        try:
+            if first is not None:
+                yield first
+            yield from texts
+        except Exception as e:
+            self.router.health[self._name].record(False, time.time() - start, e)
+            raise
+
+    def get_final_message(self):
+        return self._stream.get_final_message()
+
+class AsyncOllamaMessages(OllamaMessages):
+    """Async `client.messages` for Ollama over one pooled keep-alive httpx client."""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL):
+        self.base_url = base_url
+        self.model = model
+        self.session = httpx.AsyncClient(base_url=base_url, timeout=OLLAMA_TIMEOUT,
+                                         limits=httpx.Limits(max_connections=16, max_keepalive_connections=8))
+
+    async def create(self, model=None, max_tokens=4000, system=None, messages=None, temperature=0.7, **kwargs):
+        response = await self.session.post("/api/chat", json=self._payload(max_tokens, system, messages, temperature, False))
+        response.raise_for_status()
+        result = response.json()
+        return self._message(result["message"]["content"], result)
+
+    def stream(self, model=None, max_tokens=4000, system=None, messages=None, temperature=0.7, **kwargs):
+        return AsyncOllamaStream(self, self._payload(max_tokens, system, messages, temperature, True))
+
+class AsyncOllamaStream:
+    """Async context manager mirroring the SDK's AsyncMessageStream over Ollama's NDJSON stream."""
+
+    def __init__(self, messages, payload):
+        self._messages = messages
+        self._payload = payload
+        self._request = None
+        self._response = None
+        self._parts = []
+        self._final = {}
+
+    async def __aenter__(self):
+        self._request = self._messages.session.stream("POST", "/api/chat", json=self._payload)
+        self._response = await self._request.__aenter__()
+        self._response.raise_for_status()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._request.__aexit__(*exc)
+        return False
+
+    @property
+    async def text_stream(self):
+        async for line in self._response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("done"):
+                self._final = event
+                return
+            text = event.get("message", {}).get("content", "")
+            if text:
+                self._parts.append(text)
+                yield text
+
+    async def get_final_message(self):
+        return self._messages._message("".join(self._parts), self._final)
+
+class AsyncOllamaClient:
+    """Async client for a local Ollama server with the same `messages` interface as the Anthropic SDK."""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL):
+        self.messages = AsyncOllamaMessages(base_url, model)
+
+class AsyncLLMRouter(LLMRouter):
+    """LLMRouter for asyncio clients, with a concurrency limit per provider.
+
+    Each provider has a semaphore sized from LLM_CONCURRENCY, held for the
+    whole call (or stream), so a burst of stories queues cheaply in the
+    event loop instead of opening unbounded upstream requests.
+    """
+
+    def __init__(self, providers, order=None):
+        super().__init__(providers, order)
+        self.limits = {name: asyncio.Semaphore(LLM_CONCURRENCY.get(name, 8)) for name in providers}
+
+    def _messages_view(self, preferences):
+        return AsyncRoutedMessages(self, preferences)
+
+    async def call(self, preferred, operation):
+        """Await operation(name, provider_client) on each candidate until one succeeds."""
+        last_error = None
+        for name in self.candidates(preferred):
+            async with self.limits[name]:
+                start = time.time()
+                try:
+                    result = await operation(name, self.providers[name])
+                except Exception as e:
+                    if not is_failover_error(e):
+                        raise
+                    self.health[name].record(False, time.time() - start, e)
+                    logger.warning(f"LLM provider {name} failed, trying the next one: {str(e)}")
+                    last_error = e
+                    continue
+            self.health[name].record(True, time.time() - start)
+            return result
+        raise last_error or RuntimeError("No LLM providers configured")
+
+    def stats(self):
+        stats = super().stats()
+        for name, provider in stats["providers"].items():
+            provider["concurrency_limit"] = LLM_CONCURRENCY.get(name, 8)
+        return stats
+
+class AsyncRoutedMessages(RoutedMessages):
+    async def create(self, route=None, **kwargs):
+        async def operation(name, provider):
+            message = await provider.messages.create(**kwargs)
+            self._served(route, name)
+            return message
+        return await self.router.call(self._preferred(route), operation)
+
+    def stream(self, route=None, **kwargs):
+        return AsyncRoutedStream(self.router, self._preferred(route), kwargs, lambda name: self._served(route, name))
+
+class AsyncRoutedStream:
+    """Async stream from the first provider that produces text, holding its concurrency slot until closed.
+
+    As with RoutedStream, failover is only possible before any text reaches the caller.
+    """
+
+    def __init__(self, router, preferred, kwargs, on_open=None):
+        self.router = router
+        self.preferred = preferred
+        self.kwargs = kwargs
+        self.on_open = on_open
+        self._manager = None
+        self._stream = None
+        self._name = None
+        self._texts = None
+        self._first = None
+
+    async def __aenter__(self):
+        last_error = None
+        for name in self.router.candidates(self.preferred):
+            await self.router.limits[name].acquire()
+            start = time.time()
+            entered = None
+            try:
+                manager = self.router.providers[name].messages.stream(**self.kwargs)
+                stream = await manager.__aenter__()
+                entered = manager
+                texts = stream.text_stream.__aiter__()
+                first = await anext(texts, None)
+            except Exception as e:
+                # Only a stream that opened is closed; a failed __aenter__ has nothing to exit
+                if entered is not None:
+                    try:
+                        await entered.__aexit__(type(e), e, e.__traceback__)
+                    except Exception as close_error:
+                        logger.debug(f"Closing the failed {name} stream raised: {str(close_error)}")
+                self.router.limits[name].release()
+                if not is_failover_error(e):
+                    raise
+                self.router.health[name].record(False, time.time() - start, e)
+                logger.warning(f"LLM provider {name} failed, trying the next one: {str(e)}")
+                last_error = e
+                continue
+            except BaseException:  # Cancelled while opening: give the slot back before unwinding
+                if entered is not None:
+                    await entered.__aexit__(None, None, None)
+                self.router.limits[name].release()
+                raise
+            self._name, self._manager, self._stream, self._texts, self._first = name, manager, stream, texts, first
+            self._start = start
+            if self.on_open:
+                self.on_open(name)
+            return self
+        raise last_error or RuntimeError("No LLM providers configured")
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._manager.__aexit__(exc_type, exc, tb)
+        finally:
+            self.router.limits[self._name].release()
+        if exc is None or isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            self.router.health[self._name].record(True, time.time() - self._start)
+        else:
+            self.router.health[self._name].record(False, time.time() - self._start, exc)
+        return False
+
+    @property
+    async def text_stream(self):
+        if self._first is not None:
+            yield self._first
+        async for text in self._texts:
+            yield text
+
+    async def get_final_message(self):
+        return await self._stream.get_final_message()
@@ -0,0 +1,53 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHING_ENABLED = os.getenv("PROMPT_CACHING_ENABLED", "true").lower() in ("true", "1", "t")
+
+def cacheable(text):
+    """Return a text block marked as a prompt-cache breakpoint (plain when caching is off)."""
+    block = {"type": "text", "text": text}
+    if PROMPT_CACHING_ENABLED:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+def plain(text):
+    """Return an uncached text block for the dynamic part of a prompt."""
+    return {"type": "text", "text": text}
+
+def system_blocks(text):
+    """Wrap a static system prompt so it is cached across calls."""
+    return [cacheable(text)]
+
+def blocks_text(blocks):
+    """Join content blocks back into one string, for logging and prompt inspection."""
+    if isinstance(blocks, str):
+        return blocks
+    return "".join(block["text"] for block in blocks)
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), for budgets that must not cost an API call."""
+    return len(text) // 4 + 1
+
+def usage_report(usage):
+    """Summarise a response's token usage, including prompt-cache reads and writes."""
+    report = {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+    }
+    prompt_tokens = report["input_tokens"] + report["cache_creation_input_tokens"] + report["cache_read_input_tokens"]
+    report["cache_hit_ratio"] = round(report["cache_read_input_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0
+    return report
+
+def log_usage(label, usage):
+    """Log one call's token usage and return the report."""
+    report = usage_report(usage)
+    logger.info(
+        f"{label}: {report['input_tokens']} input, {report['cache_read_input_tokens']} cache read, "
+        f"{report['cache_creation_input_tokens']} cache write, {report['output_tokens']} output tokens "
+        f"(cache hit {report['cache_hit_ratio']:.0%})"
+    )
+    return report
@@ -0,0 +1,77 @@
+import os
+import math
+import threading
+
+MAX_SEQUENCES_PER_CHUNK = int(os.getenv("MAX_SEQUENCES_PER_CHUNK", 12))  # Largest chunk one call writes reliably
+STORY_MAX_SEQUENCES = int(os.getenv("STORY_MAX_SEQUENCES", 200))  # Largest story a request may ask for
+STORY_MAX_OUTPUT_TOKENS = int(os.getenv("STORY_MAX_OUTPUT_TOKENS", 8192))
+
+# Starting estimates until real chunks have been measured
+PRIOR_TOKENS_PER_SEQUENCE = 230
+CHUNK_HEADER_TOKENS = 350  # movie_info, character and music_score repeated in every chunk
+MAX_TOKENS_MARGIN = 1.3  # Headroom over the estimate so chunks are not cut off
+
+def valid_num_sequences(num_sequences):
+    return isinstance(num_sequences, int) and not isinstance(num_sequences, bool) and 1 <= num_sequences <= STORY_MAX_SEQUENCES
+
+def plan_chunk_sizes(num_sequences, max_per_chunk=MAX_SEQUENCES_PER_CHUNK):
+    """Split num_sequences into an exact count per chunk.
+
+    Stories that fit one call are written in a single chunk. Longer ones
+    use at least three chunks for the 3-act structure, and any remainder
+    goes to the middle (confrontation) chunks first.
+    """
+    num_sequences = int(num_sequences)
+    if num_sequences < 1:
+        raise ValueError(f"A story needs at least one sequence, got {num_sequences}")
+    if num_sequences <= max_per_chunk:
+        return [num_sequences]
+
+    total_chunks = max(3, math.ceil(num_sequences / max_per_chunk))
+    sizes = [num_sequences // total_chunks] * total_chunks
+    middle_first = list(range(1, total_chunks - 1)) + [0, total_chunks - 1]
+    for i in middle_first[:num_sequences % total_chunks]:
+        sizes[i] += 1
+    return sizes
+
+class TokensPerSequence:
+    """Running measurement of output tokens per generated sequence.
+
+    Updated from every chunk's usage with an exponential moving average,
+    and used to size max_tokens for the next chunks.
+    """
+
+    def __init__(self, prior=PRIOR_TOKENS_PER_SEQUENCE, smoothing=0.2):
+        self.value = float(prior)
+        self.samples = 0
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def observe(self, output_tokens, sequences):
+        if sequences <= 0 or output_tokens <= CHUNK_HEADER_TOKENS:
+            return
+        measured = (output_tokens - CHUNK_HEADER_TOKENS) / sequences
+        with self._lock:
+            self.samples += 1
+            weight = max(self.smoothing, 1.0 / self.samples)  # Plain mean for the first few chunks
+            self.value += weight * (measured - self.value)
+
+    def max_tokens_for(self, sequences):
+        """Return the max_tokens to request for a chunk of `sequences` sequences."""
+        estimate = CHUNK_HEADER_TOKENS + sequences * self.value
+        return min(STORY_MAX_OUTPUT_TOKENS, int(math.ceil(estimate * MAX_TOKENS_MARGIN)))
+
+def waste_report(num_sequences, chunk_budgets, tokens_per_sequence):
+    """Summarise what a story cost and how much of it was generated only to be discarded."""
+    generated = sum(budget["generated"] for budget in chunk_budgets)
+    kept = sum(budget["kept"] for budget in chunk_budgets)
+    output_tokens = sum(budget["output_tokens"] for budget in chunk_budgets)
+    discarded = generated - kept
+    return {
+        "requested_sequences": num_sequences,
+        "generated_sequences": generated,
+        "discarded_sequences": discarded,
+        "output_tokens": output_tokens,
+        "wasted_output_tokens": int(discarded * tokens_per_sequence),
+        "tokens_per_sequence": round(tokens_per_sequence, 1),
+    }
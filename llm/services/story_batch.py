@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.prompt_cache import usage_report
+
+try:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+except ImportError:
+    firebase_admin = None
+
+STORY_BATCH_DIR = os.getenv("STORY_BATCH_DIR", os.path.expanduser("~/.cache/deepflix/story_batches"))
+STORY_BATCH_MAX_REQUESTS = int(os.getenv("STORY_BATCH_MAX_REQUESTS", 10000))  # Per submitted batch (API limit is 100,000)
+LOCAL_BATCH_WORKERS = int(os.getenv("LOCAL_BATCH_WORKERS", 2))
+STORY_BATCH_COLLECTION = os.getenv("STORY_BATCH_COLLECTION", "stories")
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "deepflix-cc642-firebase-adminsdk-fbsvc-140547cc0d.json")
+
+def batch_result(custom_id, message=None, error=None):
+    """Normalise one batch result to a dict with the response text, usage and stop reason, or an error."""
+    if message is None:
+        return {"custom_id": custom_id, "ok": False, "error": str(error or "no result")}
+    return {
+        "custom_id": custom_id,
+        "ok": True,
+        "text": message.content[0].text,
+        "usage": usage_report(message.usage),
+        "stop_reason": message.stop_reason,
+    }
+
+class AnthropicBatchBackend:
+    """Submits requests through the Anthropic Message Batches API (half the price of interactive calls).
+
+    Results arrive asynchronously, usually within an hour and at most 24.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests):
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": request["custom_id"], "params": request["params"]} for request in requests]
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Return "ended" once every result is available, otherwise the API's processing_status."""
+        return self.client.messages.batches.retrieve(batch_id).processing_status
+
+    def results(self, batch_id):
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                yield batch_result(entry.custom_id, entry.result.message)
+            else:
+                yield batch_result(entry.custom_id, error=getattr(entry.result, "error", None) or entry.result.type)
+
+class LocalBatchBackend:
+    """Local stand-in for the batch API, for providers without one (e.g. an overnight Ollama run).
+
+    Submitted requests are written to disk; polling a batch runs its
+    pending requests through the `router` (preferring `provider`) with
+    LOCAL_BATCH_WORKERS threads and stores the results next to them, so an
+    interrupted run resumes. A result answered by a failover provider is
+    marked `fallback`.
+    """
+
+    name = "local"
+
+    def __init__(self, router, provider=None, batch_dir=STORY_BATCH_DIR, workers=LOCAL_BATCH_WORKERS):
+        self.router = router
+        self.provider = provider
+        self.batch_dir = os.path.join(batch_dir, "local")
+        self.workers = workers
+        self._lock = threading.Lock()
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+    def _path(self, batch_id, kind):
+        return os.path.join(self.batch_dir, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, requests):
+        batch_id = f"local_{uuid.uuid4().hex[:16]}"
+        with open(self._path(batch_id, "requests"), "w") as f:
+            for request in requests:
+                f.write(json.dumps(request) + "\n")
+        return batch_id
+
+    def _done_ids(self, batch_id):
+        try:
+            with open(self._path(batch_id, "results"), "r") as f:
+                return {json.loads(line)["custom_id"] for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def _run(self, request, results_file):
+        try:
+            messages = self.router.prefer(self.provider).messages
+            message = messages.create(route=request.get("route"), **request["params"])
+            result = batch_result(request["custom_id"], message)
+            result["fallback"] = messages.fallbacks > 0
+        except Exception as e:
+            result = batch_result(request["custom_id"], error=e)
+        with self._lock:
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+
+    def status(self, batch_id):
+        done = self._done_ids(batch_id)
+        with open(self._path(batch_id, "requests"), "r") as f:
+            pending = [request for request in map(json.loads, f) if request["custom_id"] not in done]
+        if pending:
+            with open(self._path(batch_id, "results"), "a") as results_file, \
+                    ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(lambda request: self._run(request, results_file), pending))
+        return "ended"
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, "results"), "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+class JsonlSink:
+    """Appends finished stories to a JSONL file, one {"id", "request", "story"} object per line."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, story_id, request_fields, story):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"id": story_id, "request": request_fields, "story": story}) + "\n")
+
+class FirestoreSink:
+    """Writes finished stories to a Firestore collection, one document per story id."""
+
+    def __init__(self, collection=STORY_BATCH_COLLECTION):
+        if firebase_admin is None:
+            raise RuntimeError("firebase_admin is not installed; use a jsonl sink instead")
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+        self.collection = firestore.client().collection(collection)
+
+    def write(self, story_id, request_fields, story):
+        self.collection.document(story_id).set({
+            "prompt": request_fields["prompt"],
+            "genre": request_fields.get("genre"),
+            "num_sequences": request_fields["num_sequences"],
+            "story": story,
+            "created_at": time.time(),
+        })
+
+def open_sink(spec):
+    """Build a sink from "jsonl:<path>" or "firestore[:<collection>]"."""
+    kind, _, target = spec.partition(":")
+    if kind == "jsonl" and target:
+        return JsonlSink(target)
+    if kind == "firestore":
+        return FirestoreSink(target or STORY_BATCH_COLLECTION)
+    raise ValueError(f"Unknown sink: {spec} (use jsonl:<path> or firestore[:<collection>])")
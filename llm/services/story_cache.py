@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+STORY_CACHE_DIR = os.getenv("STORY_CACHE_DIR", os.path.expanduser("~/.cache/deepflix/stories"))
+STORY_CACHE_TTL = int(os.getenv("STORY_CACHE_TTL", 24 * 60 * 60))  # Seconds a cached story stays valid
+
+def normalize_story_request(prompt, genre, num_sequences, mode):
+    """Normalise request fields so trivially different submissions share a key."""
+    return {
+        "prompt": " ".join(str(prompt).split()).casefold(),
+        "genre": (genre or "").strip().lower(),
+        "num_sequences": int(num_sequences),
+        "mode": mode
+    }
+
+class StoryCache:
+    """On-disk cache of finished stories with a time-to-live.
+
+    Keys cover the normalised request plus the model and temperature, so a
+    model change never serves an old story. A `variant` (the request's
+    seed or variant field) is part of the key: a new value forces a fresh
+    story, while retries of the same variant still hit.
+    """
+
+    def __init__(self, cache_dir=STORY_CACHE_DIR, ttl=STORY_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(request_fields, model, temperature, variant=None):
+        key_data = json.dumps({
+            "request": request_fields,
+            "model": model,
+            "temperature": temperature,
+            "variant": variant
+        }, sort_keys=True)
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached story, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, story):
+        temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(story, f)
+        os.replace(temp_path, self._path(key))
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared), where shared is True if another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"], False
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent callers with the same key await one shared task."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Return (result, shared), where shared is True if another caller did the work."""
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(task), False
+        finally:
+            if task.done():
+                self._calls.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._calls.pop(key, None))
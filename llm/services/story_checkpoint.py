@@ -0,0 +1,77 @@
+import os
+import re
+import json
+import shutil
+import threading
+
+STORY_CHECKPOINT_DIR = os.getenv("STORY_CHECKPOINT_DIR", os.path.expanduser("~/.cache/deepflix/story_jobs"))
+
+# Job ids come from clients and name a directory, so only plain names are accepted
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def valid_job_id(job_id):
+    return isinstance(job_id, str) and bool(JOB_ID_PATTERN.match(job_id))
+
+class StoryCheckpoint:
+    """Completed pieces of one story job, kept on disk so a failed job can resume.
+
+    The request, the outline and each finished chunk are written as
+    separate JSON files under `{STORY_CHECKPOINT_DIR}/{job_id}/`. The
+    directory is created on the first save, so looking a job up has no
+    side effects.
+    """
+
+    def __init__(self, job_id, base_dir=STORY_CHECKPOINT_DIR):
+        if not valid_job_id(job_id):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        base_dir = os.path.realpath(base_dir)
+        self.job_id = job_id
+        self.path = os.path.realpath(os.path.join(base_dir, job_id))
+        if os.path.dirname(self.path) != base_dir:
+            raise ValueError(f"Invalid job id: {job_id!r}")
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.json")
+
+    def _load(self, name):
+        try:
+            with open(self._file(name), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, name, value):
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = f"{self._file(name)}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(temp_path, self._file(name))
+
+    def load_request(self):
+        return self._load("request")
+
+    def save_request(self, request_fields):
+        self._save("request", request_fields)
+
+    def load_outline(self):
+        return self._load("outline")
+
+    def save_outline(self, outline):
+        self._save("outline", outline)
+
+    def load_chunk(self, chunk_number):
+        return self._load(f"chunk_{chunk_number:02d}")
+
+    def save_chunk(self, chunk_number, chunk):
+        self._save(f"chunk_{chunk_number:02d}", chunk)
+
+    def completed_chunks(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            int(name[6:8]) for name in os.listdir(self.path)
+            if name.startswith("chunk_") and name.endswith(".json")
+        )
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
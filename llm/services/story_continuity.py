@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+from collections import Counter, deque
+
+from services.prompt_cache import estimate_tokens
+
+STORY_CONTINUITY_MAX_TOKENS = int(os.getenv("STORY_CONTINUITY_MAX_TOKENS", 300))  # Cap on the rendered block
+STORY_CONTINUITY_BEATS = int(os.getenv("STORY_CONTINUITY_BEATS", 4))  # Most recent sequences summarised
+STORY_CONTINUITY_LOCATIONS = 6
+STORY_CONTINUITY_PALETTE = 6
+
+# Atmosphere terms every sequence repeats; they say nothing about this story's look
+BOILERPLATE_ATMOSPHERE = {"8k uhd", "photorealistic", "studio lighting quality", "cinematic color grading"}
+
+def character_hash(character):
+    """Short stable hash of a character sheet, to tell whether a later chunk changed it."""
+    return hashlib.sha256(json.dumps(character, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+
+def clip(text, limit):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+class StoryContinuity:
+    """Compact rolling state of a story, passed to each chunk after the first.
+
+    Instead of the previous chunk's character JSON and last sequence, later
+    chunks get the character sheet (with its hash), the visual palette seen
+    so far, the locations visited and the last few beats. The rendered
+    block is capped at `max_tokens`, so the context stays the same size
+    however long the story gets. The character sheet is always passed
+    whole, since the next chunk is told to keep it exactly; only the
+    palette, locations and beats are trimmed to fit.
+    """
+
+    def __init__(self, max_tokens=STORY_CONTINUITY_MAX_TOKENS, recent_beats=STORY_CONTINUITY_BEATS):
+        self.max_tokens = max_tokens
+        self.character = None
+        self.character_hash = None
+        self.palette = Counter()
+        self.locations = []
+        self.beats = deque(maxlen=recent_beats)
+        self.sequences = 0
+
+    def observe_character(self, character):
+        """Record the story's character sheet; returns False if it differs from the one already recorded."""
+        if not character:
+            return True
+        if self.character is None:
+            self.character = character
+            self.character_hash = character_hash(character)
+            return True
+        return character_hash(character) == self.character_hash
+
+    def observe(self, sequence):
+        """Fold one finished sequence into the palette, location list and recent beats."""
+        self.sequences += 1
+        environment = [part.strip() for part in str(sequence.get("environment") or "").split(" - ")]
+        for term in str(sequence.get("atmosphere") or "").split(","):
+            term = term.strip().lower()
+            if term and term not in BOILERPLATE_ATMOSPHERE:
+                self.palette[clip(term, 48)] += 1
+        location = next((part for part in environment if part.upper().startswith(("INT", "EXT"))), None)
+        if location:
+            location = clip(location, 60)
+            if location in self.locations:
+                self.locations.remove(location)
+            self.locations = (self.locations + [location])[-STORY_CONTINUITY_LOCATIONS:]
+
+        beat = f"{self.sequences}. {sequence.get('type', 'scene')}, {environment[0] or 'shot'}: {clip(sequence.get('clip_action'), 110)}"
+        narration = clip(sequence.get("voice_narration"), 60)
+        if narration and narration != "...":
+            beat += f' / "{narration}"'
+        self.beats.append(beat)
+
+    def observe_story(self, story):
+        """Fold in a chunk or partial story; returns False if its character header differs from the recorded one."""
+        consistent = self.observe_character(story.get("character"))
+        for sequence in story.get("sequence", []):
+            self.observe(sequence)
+        return consistent
+
+    def render(self):
+        """The continuity block for the next chunk's prompt, trimmed to at most max_tokens."""
+        if not self.sequences and self.character is None:
+            return ""
+        beats = list(self.beats)
+        palette = [term for term, _ in self.palette.most_common(STORY_CONTINUITY_PALETTE)]
+        locations = list(self.locations)
+        while True:
+            text = self._format(beats, palette, locations)
+            if estimate_tokens(text) <= self.max_tokens:
+                return text
+            # Drop the least useful detail first: rarer palette terms, older locations, then older beats
+            if len(palette) > 3:
+                palette.pop()
+            elif len(locations) > 3:
+                locations.pop(0)
+            elif len(beats) > 1:
+                beats.pop(0)
+            elif palette or locations:
+                palette, locations = [], []
+            else:
+                return text  # Only the sheet and the last beat are left; a long sheet may go over max_tokens
+
+    def _format(self, beats, palette, locations):
+        lines = [f"\nStory so far ({self.sequences} sequences):"]
+        if isinstance(self.character, dict):
+            sheet = "; ".join(" ".join(str(value).split()) for value in self.character.values() if value)
+            lines.append(f"Character sheet {self.character_hash} (keep exactly): {sheet}")
+        if palette:
+            lines.append(f"Visual palette: {', '.join(palette)}")
+        if locations:
+            lines.append(f"Locations so far: {'; '.join(locations)}")
+        if beats:
+            lines.append("Most recent beats:")
+            lines.extend(f"- {beat}" for beat in beats)
+        lines.append("Continue from the last beat, keeping the character, palette and locations consistent "
+                     "while evolving the visual style to match this part of the story.")
+        return "\n".join(lines)
@@ -0,0 +1,254 @@
+import os
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Dict
+
+from dotenv import load_dotenv
+
+from services.prompt_cache import system_blocks, log_usage
+from services.story_prompts import build_chunk_prompt
+from services.story_cache import StoryCache, normalize_story_request
+from services.story_json import repair_json, validate_story_chunk
+from services.story_checkpoint import StoryCheckpoint
+from services.sequence_budget import TokensPerSequence, waste_report, STORY_MAX_OUTPUT_TOKENS
+from services.call_ledger import CallLedger, NullLedger, LLM_LEDGER_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Both story services read their settings from .env, so load it before the constants below
+load_dotenv()
+
+STORY_MODEL = "claude-3-7-sonnet-20250219"
+STORY_TEMPERATURE = 0.7
+OUTLINE_MAX_TOKENS = 2000
+
+# Attempts per outline or chunk call before the job fails (finished chunks stay checkpointed)
+STORY_CHUNK_RETRIES = int(os.getenv("STORY_CHUNK_RETRIES", 3))
+
+# Finished stories are reused for identical requests (retries, double submits)
+STORY_CACHE_ENABLED = os.getenv("STORY_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+
+# "sequential" chains each chunk on the last; "outline" (opt-in) plans an outline and expands all acts in parallel
+STORY_GENERATION_MODE = os.getenv("STORY_GENERATION_MODE", "sequential")
+
+story_cache = StoryCache() if STORY_CACHE_ENABLED else None
+
+# Per-call record of model, tokens, latency and stop reason (LLM_LEDGER_ENABLED=false turns it off)
+call_ledger = CallLedger() if LLM_LEDGER_ENABLED else NullLedger()
+
+# Measured output tokens per sequence, used to size max_tokens for each chunk
+tokens_per_sequence = TokensPerSequence()
+
+def start_logging(log_file='anthropic_api.log'):
+    """Send log records through a queue to a rotated log file and the console.
+
+    Request threads and the event loop only enqueue records; a listener
+    thread does the formatting and file writes.
+    """
+    log_queue = queue.Queue(-1)
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.handlers.QueueHandler(log_queue)]
+    )
+    log_listener = logging.handlers.QueueListener(
+        log_queue,
+        logging.handlers.RotatingFileHandler(log_file, maxBytes=20 * 1024 * 1024, backupCount=5),
+        logging.StreamHandler()
+    )
+    log_listener.start()
+    return log_listener
+
+def message_params(route, system, content, max_tokens):
+    """Keyword arguments for one story call (`messages.create` or `messages.stream`) through the router."""
+    return {
+        "route": route,
+        "model": STORY_MODEL,
+        "max_tokens": max_tokens,
+        "temperature": STORY_TEMPERATURE,
+        "system": system_blocks(system),
+        "messages": [{"role": "user", "content": content}],
+    }
+
+def parse_json_response(response_text: str) -> Dict:
+    """Parse JSON response using json module."""
+    try:
+        # Parse the JSON directly (sampled bodies are kept in the call ledger, not the log)
+        return json.loads(response_text)
+    except Exception as e:
+        logger.error(f"Failed to parse JSON: {e}")
+        logger.error(f"Error occurred at position: {e.pos if hasattr(e, 'pos') else 'unknown'}")
+
+    # Fall back to extracting whatever complete objects the response contains
+    parsed_json = repair_json(response_text)
+    logger.warning(f"Recovered JSON from malformed response ({len(parsed_json.get('sequence', []))} sequences)")
+    return parsed_json
+
+def read_outline_message(entry, message, total_chunks):
+    """Record an outline response in the ledger and return the checked outline."""
+    entry.response(message)
+    log_usage("Outline", message.usage)
+    return check_outline(parse_json_response(message.content[0].text), total_chunks)
+
+def read_chunk_message(entry, message, chunk_number, total_chunks):
+    """Record a chunk response in the ledger and return (parsed chunk, usage report with stop_reason)."""
+    entry.response(message)
+    usage = log_usage(f"Chunk {chunk_number}/{total_chunks}", message.usage)
+    usage['stop_reason'] = message.stop_reason
+
+    chunk = parse_json_response(message.content[0].text)
+    entry['sequences'] = len(chunk.get('sequence') or [])
+    return chunk, usage
+
+def check_outline(outline, total_chunks):
+    """Make sure the outline has the story header and one act per chunk."""
+    missing = [key for key in ("movie_info", "character", "music_score") if not isinstance(outline.get(key), dict)]
+    if missing:
+        raise ValueError(f"Outline is missing {', '.join(missing)}")
+    if len(outline.get("acts", [])) != total_chunks:
+        raise ValueError(f"Outline has {len(outline.get('acts', []))} acts, expected {total_chunks}")
+    return outline
+
+def prepare_chunk(prompt, chunk_number, total_chunks, sequence_count, continuity=None, genre=None, outline=None):
+    """Return (chunk prompt, require_header, limit) for one chunk call.
+
+    Outline mode takes the header from the outline; otherwise the first
+    chunk supplies it. `limit['max_tokens']` starts from the measured
+    tokens per sequence and is raised by check_chunk_response.
+    """
+    chunk_prompt = build_chunk_prompt(prompt, chunk_number, total_chunks, sequence_count, continuity, genre, outline)
+    require_header = outline is None and chunk_number == 1
+    limit = {'max_tokens': tokens_per_sequence.max_tokens_for(sequence_count)}
+    return chunk_prompt, require_header, limit
+
+def check_chunk_response(chunk, usage, sequence_count, require_header, limit):
+    """Validate a chunk response; one cut off by max_tokens short of the count doubles limit['max_tokens'] and raises.
+
+    The doubled limit never exceeds STORY_MAX_OUTPUT_TOKENS, which the API would reject.
+    """
+    validate_story_chunk(chunk, require_header)
+    if usage['stop_reason'] == 'max_tokens' and len(chunk['sequence']) < sequence_count:
+        limit['max_tokens'] = min(limit['max_tokens'] * 2, STORY_MAX_OUTPUT_TOKENS)
+        raise ValueError(f"Cut off by max_tokens after {len(chunk['sequence'])} of {sequence_count} sequences")
+    return chunk, usage
+
+def apply_sequence_budget(chunk, usage, chunk_number, total_chunks, sequence_count):
+    """Update the tokens-per-sequence measurement, trim extra sequences and attach the chunk's budget."""
+    generated = len(chunk['sequence'])
+    tokens_per_sequence.observe(usage['output_tokens'], generated)
+    if generated > sequence_count:
+        logger.warning(f"Chunk {chunk_number}/{total_chunks} returned {generated} sequences, keeping {sequence_count}")
+        chunk['sequence'] = chunk['sequence'][:sequence_count]
+    elif generated < sequence_count:
+        logger.warning(f"Chunk {chunk_number}/{total_chunks} returned only {generated} of {sequence_count} sequences")
+    chunk['budget'] = {'output_tokens': usage['output_tokens'], 'generated': generated, 'kept': len(chunk['sequence'])}
+    return chunk
+
+def append_chunk(story, chunk, continuity, chunk_number, total_chunks):
+    """Add a sequential-mode chunk to the story so far and return the chunk's budget."""
+    renumber_sequences(chunk['sequence'], len(story['sequence']) + 1)
+    if not continuity.observe_story(chunk):
+        logger.warning(f"Chunk {chunk_number}/{total_chunks} returned a different character; "
+                       f"keeping sheet {continuity.character_hash}")
+    story['sequence'].extend(chunk['sequence'])
+    logger.debug(f"Generated chunk {chunk_number} with {len(chunk['sequence'])} sequences")
+    return chunk.pop('budget', None)
+
+def outline_story(outline, chunks):
+    """Stitch expanded acts into one story under the outline's header. Returns (story, per-chunk budgets)."""
+    # The outline is authoritative for everything but the scenes
+    final_story = {
+        'movie_info': outline['movie_info'],
+        'character': outline['character'],
+        'music_score': outline['music_score'],
+        'sequence': []
+    }
+    for chunk_num, chunk in enumerate(chunks, 1):
+        renumber_sequences(chunk['sequence'], len(final_story['sequence']) + 1)
+        final_story['sequence'].extend(chunk['sequence'])
+        logger.debug(f"Stitched act {chunk_num} with {len(chunk['sequence'])} sequences")
+
+    return final_story, [chunk.pop('budget', None) for chunk in chunks]
+
+def renumber_sequences(sequences, start_seq_num):
+    for i, seq in enumerate(sequences):
+        seq['sequence_number'] = start_seq_num + i
+
+def log_story_budget(num_sequences, budgets):
+    report = waste_report(num_sequences, [budget for budget in budgets if budget], tokens_per_sequence.value)
+    logger.info(f"Story budget: {report}")
+    return report
+
+class ChunkEvents:
+    """Decides which streamed events of one chunk are relayed to the client.
+
+    At most `sequence_count` sequences pass. With a StoryContinuity
+    (sequential mode) the first chunk's header passes too and every relayed
+    element is folded into the continuity for the next chunk; without one
+    (outline mode, where the header comes from the outline) only sequences do.
+    """
+
+    def __init__(self, chunk_number, sequence_count, continuity=None):
+        self.chunk_number = chunk_number
+        self.sequence_count = sequence_count
+        self.continuity = continuity
+        self.emitted = 0
+
+    def accept(self, event, value):
+        if event == "sequence":
+            if self.emitted >= self.sequence_count:
+                return False
+            self.emitted += 1
+            if self.continuity is not None:
+                self.continuity.observe(value)
+            return True
+        if self.continuity is None:
+            return False
+        if event == "character" and self.continuity.character is None:
+            self.continuity.observe_character(value)
+            return True
+        return event in ("movie_info", "music_score") and self.chunk_number == 1
+
+def cached_story_events(story):
+    """Yield the stream events for a finished story, ending with a cached done event."""
+    for key in ("movie_info", "character", "music_score"):
+        yield key, story[key]
+    for seq in story['sequence']:
+        yield "sequence", seq
+    yield "done", {"sequences": len(story['sequence']), "cached": True}
+
+def story_cache_key(prompt, genre, num_sequences, mode, variant, provider=None, chunk_provider=None):
+    request_fields = normalize_story_request(prompt, genre, num_sequences, mode)
+    # A story asked of a specific provider is not interchangeable with the default one
+    for field, name in (("provider", provider), ("chunk_provider", chunk_provider)):
+        if name:
+            request_fields[field] = name
+    return StoryCache.make_key(request_fields, STORY_MODEL, STORY_TEMPERATURE, variant)
+
+def cache_story(llm, cache_key, story):
+    """Put a finished story in the cache unless a failover provider wrote any of it."""
+    if llm.messages.fallbacks:
+        logger.info(f"Not caching story {cache_key[:12]}: {llm.messages.fallbacks} calls were served by a failover provider")
+        return
+    story_cache.put(cache_key, story)
+
+def open_story_job(job_id, job_request):
+    """Return the checkpoint for a story job, cleared first if it was saved for a different request."""
+    checkpoint = StoryCheckpoint(job_id)
+    if checkpoint.load_request() not in (None, job_request):
+        checkpoint.clear()  # Same job id, different story
+        checkpoint = StoryCheckpoint(job_id)
+    checkpoint.save_request(job_request)
+    return checkpoint
+
+def format_stream_event(event, data, sse=False):
+    """Serialise one story event as an NDJSON line or a Server-Sent Event."""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+def use_outline(mode, chunk_sizes):
+    """Outline mode only pays off when there is more than one act to expand in parallel."""
+    return mode == 'outline' and len(chunk_sizes) > 1
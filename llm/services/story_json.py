@@ -0,0 +1,72 @@
+import re
+import json
+
+from services.story_stream import StoryStreamParser, STORY_OBJECT_KEYS
+
+SEQUENCE_TYPES = ("character", "b-roll")
+SEQUENCE_TEXT_FIELDS = ("clip_action", "voice_narration", "environment", "atmosphere")
+
+def repair_json(response_text):
+    """Recover a story object from a response that is not valid JSON as a whole.
+
+    Handles prose or code fences around the object, trailing commas, and
+    truncated output: every top-level object and sequence element that was
+    closed before the cut is kept. Raises ValueError if nothing usable is found.
+    """
+    text = re.sub(r"```(?:json)?", "", response_text)
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        candidate = re.sub(r",\s*([}\]])", r"\1", text[start:end + 1])
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+
+    story = {}
+    for event, value in StoryStreamParser().feed(text):
+        if event == "sequence":
+            story.setdefault("sequence", []).append(value)
+        else:
+            story[event] = value
+    if not story:
+        raise ValueError("No JSON object could be recovered from the response")
+    return story
+
+def validate_story_chunk(chunk, require_header=True):
+    """Check a parsed chunk against the story schema. Raises ValueError listing the problems."""
+    problems = []
+    if not isinstance(chunk, dict):
+        raise ValueError("Chunk is not a JSON object")
+
+    if require_header:
+        problems += [f"missing {key}" for key in STORY_OBJECT_KEYS if not isinstance(chunk.get(key), dict)]
+
+    sequences = chunk.get("sequence")
+    if not isinstance(sequences, list) or not sequences:
+        problems.append("no sequences")
+        sequences = []
+
+    for i, seq in enumerate(sequences, 1):
+        if not isinstance(seq, dict):
+            problems.append(f"sequence {i} is not an object")
+            continue
+        if not isinstance(seq.get("clip_duration"), (int, float)) or seq["clip_duration"] <= 0:
+            problems.append(f"sequence {i} has no valid clip_duration")
+        if seq.get("type") not in SEQUENCE_TYPES:
+            problems.append(f"sequence {i} has unknown type {seq.get('type')!r}")
+        if seq.get("type") == "character" and not isinstance(seq.get("pose"), str):
+            problems.append(f"sequence {i} is a character shot without a pose")
+        for field in SEQUENCE_TEXT_FIELDS:
+            if not isinstance(seq.get(field), str):
+                problems.append(f"sequence {i} is missing {field}")
+
+    if problems:
+        raise ValueError("Invalid story chunk: " + "; ".join(problems[:10]))
+    return chunk
+
+def validate_story(story, num_sequences):
+    """Check a finished story: the chunk checks with its header, plus exactly num_sequences sequences."""
+    validate_story_chunk(story, require_header=True)
+    if len(story["sequence"]) != num_sequences:
+        raise ValueError(f"Incomplete story: {len(story['sequence'])} of {num_sequences} sequences")
+    return story
@@ -0,0 +1,72 @@
+import json
+
+# Top-level story fields emitted as soon as their object closes
+STORY_OBJECT_KEYS = ("movie_info", "character", "music_score")
+
+class StoryStreamParser:
+    """Incremental scanner that finds complete story elements in a streamed JSON response.
+
+    Text is fed in arbitrary pieces as tokens arrive. Each top-level
+    `movie_info`, `character` and `music_score` object, and every element of
+    the `sequence` array, is returned as ("movie_info" | ..., dict) the moment
+    its closing brace is seen. Anything before the first "{" (stray prose
+    or a code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._stack = []  # (bracket, start index, key of the containing top-level field)
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_string = None  # Candidate key at the top level
+
+    def feed(self, chunk):
+        """Consume more text and return the list of (event, value) pairs it completed."""
+        self.text += chunk
+        events = []
+        text = self.text
+        for i in range(self._position, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i
+            elif char in "{[":
+                if len(self._stack) == 1:
+                    key = self._last_string
+                elif self._stack:
+                    key = self._stack[-1][2]
+                else:
+                    key = None
+                self._stack.append((char, i, key))
+            elif char in "}]" and self._stack:
+                _, start, key = self._stack.pop()
+                event = self._completed(key, len(self._stack))
+                if event:
+                    try:
+                        events.append((event, json.loads(text[start:i + 1])))
+                    except json.JSONDecodeError:
+                        pass  # Malformed element; the full-text parse will report it
+        self._position = len(text)
+        return events
+
+    def _completed(self, key, depth):
+        """Return the event name for a container that closed at `depth`, if it is one we emit."""
+        if depth == 1 and key in STORY_OBJECT_KEYS:
+            return key
+        if depth == 2 and key == "sequence":
+            return "sequence"
+        return None
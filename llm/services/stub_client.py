@@ -0,0 +1,161 @@
+import re
+import json
+import hashlib
+import threading
+
+from services.prompt_cache import estimate_tokens
+
+class _Object:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def _as_blocks(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return content
+
+class StubMessages:
+    """Offline stand-in for `client.messages` that returns well-formed story JSON.
+
+    Token usage imitates prompt caching: the prefix up to each cache_control
+    breakpoint is a cache write the first time it is seen and a cache read
+    afterwards, so caching can be checked without network access or cost.
+    """
+
+    def __init__(self):
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _usage(self, system, messages, output_text):
+        blocks = _as_blocks(system or "")
+        for message in messages:
+            blocks = blocks + _as_blocks(message["content"])
+
+        digest = hashlib.sha256()
+        position = 0
+        breakpoints = []  # (tokens up to breakpoint, prefix key)
+        for block in blocks:
+            digest.update(block["text"].encode("utf-8"))
+            position += estimate_tokens(block["text"])
+            if block.get("cache_control"):
+                breakpoints.append((position, digest.hexdigest()))
+
+        with self._lock:
+            read = max((tokens for tokens, key in breakpoints if key in self._cached_prefixes), default=0)
+            written = breakpoints[-1][0] - read if breakpoints and breakpoints[-1][0] > read else 0
+            self._cached_prefixes.update(key for _, key in breakpoints)
+
+        return _Object(
+            input_tokens=position - read - written,
+            output_tokens=estimate_tokens(output_text),
+            cache_creation_input_tokens=written,
+            cache_read_input_tokens=read,
+        )
+
+    def _story_text(self, system, messages):
+        system_text = "".join(block["text"] for block in _as_blocks(system or ""))
+        prompt = "".join(block["text"] for block in _as_blocks(messages[-1]["content"]))
+        subject = re.search(r"story about: (.+)", prompt)
+        subject = subject.group(1).strip() if subject else "an untitled story"
+
+        story = {
+            "movie_info": {"genre": "cinematic", "title": f"Stub: {subject[:40]}", "description": subject,
+                           "release_year": 2025, "director": "Stub Director", "rating": 7.5},
+            "character": {"base_traits": "adult female, athletic build", "facial_features": "sharp eyes",
+                          "distinctive_features": "scar over left brow", "clothing": "weathered leather jacket"},
+            "music_score": {"type": "ambient", "style": "dark, suspenseful", "tempo": "slow",
+                            "instrumentation": "piano, strings"},
+        }
+
+        if '"acts"' in system_text:
+            acts = re.search(r"told in (\d+) acts", prompt)
+            story["acts"] = [
+                {"act": n, "summary": f"Act {n} of {subject}", "beats": [f"Beat {n}.{b}" for b in range(1, 4)],
+                 "locations": [f"Location {n}"], "visual_palette": "teal and amber", "handoff": f"End of act {n}"}
+                for n in range(1, int(acts.group(1)) + 1 if acts else 4)
+            ]
+        else:
+            count = re.search(r"exactly (\d+)", prompt)
+            story["sequence"] = [
+                {"sequence_number": n, "clip_duration": 3.0,
+                 "clip_action": "dust drifting through a beam of light", "voice_narration": "...",
+                 "type": "b-roll", "environment": "WIDE SHOT - EXT. CITY STREET - NIGHT",
+                 "atmosphere": "8k uhd, photorealistic, cinematic lighting"}
+                for n in range(1, (int(count.group(1)) if count else 8) + 1)
+            ]
+        return json.dumps(story, indent=2)
+
+    def create(self, model=None, max_tokens=None, system=None, messages=None, **kwargs):
+        text = self._story_text(system, messages)
+        return _Object(
+            model=model,
+            content=[_Object(type="text", text=text)],
+            stop_reason="end_turn",
+            usage=self._usage(system, messages, text),
+        )
+
+    def stream(self, **kwargs):
+        return StubStream(self.create(**kwargs))
+
+class StubStream:
+    """Context manager mirroring the SDK's MessageStream."""
+
+    def __init__(self, message):
+        self._message = message
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._message.content[0].text
+        for i in range(0, len(text), 32):
+            yield text[i:i + 32]
+
+    def get_final_message(self):
+        return self._message
+
+class StubAnthropicClient:
+    """Anthropic client replacement for running the story service offline."""
+
+    def __init__(self):
+        self.messages = StubMessages()
+
+class AsyncStubMessages:
+    """Async `client.messages` over StubMessages, for the ASGI service."""
+
+    def __init__(self):
+        self._messages = StubMessages()
+
+    async def create(self, **kwargs):
+        return self._messages.create(**kwargs)
+
+    def stream(self, **kwargs):
+        return AsyncStubStream(self._messages.create(**kwargs))
+
+class AsyncStubStream(StubStream):
+    """Async context manager mirroring the SDK's AsyncMessageStream."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        text = self._message.content[0].text
+        for i in range(0, len(text), 32):
+            yield text[i:i + 32]
+
+    async def get_final_message(self):
+        return self._message
+
+class AsyncStubAnthropicClient:
+    """AsyncAnthropic replacement for running the async story service offline."""
+
+    def __init__(self):
+        self.messages = AsyncStubMessages()
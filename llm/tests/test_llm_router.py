@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("requests")  # llm_backends pools Ollama connections with requests
+
+from services import llm_backends
+from services.llm_backends import AsyncLLMRouter, LLMRouter
+from services.stub_client import AsyncStubAnthropicClient, StubAnthropicClient
+
+MESSAGES = [{"role": "user", "content": "Write exactly 2 sequences for a story about: a lighthouse"}]
+
+class Overloaded(Exception):
+    status_code = 529
+
+class FailingMessages:
+    def __init__(self, error=Overloaded):
+        self.error = error
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        raise self.error("provider down")
+
+    def stream(self, **kwargs):
+        self.calls += 1
+        raise self.error("provider down")
+
+class FailingClient:
+    def __init__(self, error=Overloaded):
+        self.messages = FailingMessages(error)
+
+class AsyncFailingMessages(FailingMessages):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+    def stream(self, **kwargs):
+        messages = self
+
+        class Manager:
+            async def __aenter__(self):
+                messages.calls += 1
+                raise messages.error("provider down")
+
+            async def __aexit__(self, *exc):
+                raise AssertionError("__aexit__ called on a stream that never opened")
+
+        return Manager()
+
+class AsyncFailingClient:
+    def __init__(self, error=Overloaded):
+        self.messages = AsyncFailingMessages(error)
+
+def story_text(message):
+    return json.loads(message.content[0].text)
+
+def test_failover_to_the_next_provider():
+    failing = FailingClient()
+    router = LLMRouter({"anthropic": failing, "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+
+    message = router.messages.create(model="stub", max_tokens=100, messages=MESSAGES)
+    assert len(story_text(message)["sequence"]) == 2
+    assert failing.messages.calls == 1
+
+    stats = router.stats()["providers"]
+    assert stats["anthropic"]["recent_failures"] == 1
+    assert stats["ollama"]["recent_failures"] == 0
+
+def test_unhealthy_provider_is_skipped_during_cooldown(monkeypatch):
+    monkeypatch.setattr(llm_backends, "HEALTH_FAILURE_THRESHOLD", 2)
+    failing = FailingClient()
+    router = LLMRouter({"anthropic": failing, "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+
+    for _ in range(4):
+        router.messages.create(model="stub", messages=MESSAGES)
+    assert failing.messages.calls == 2
+    assert not router.stats()["providers"]["anthropic"]["healthy"]
+
+def test_preferred_provider_is_tried_first():
+    failing = FailingClient()
+    router = LLMRouter({"anthropic": StubAnthropicClient(), "ollama": failing}, order=["anthropic", "ollama"])
+    view = router.prefer(chunk="ollama")
+
+    view.messages.create(route="outline", model="stub", messages=MESSAGES)
+    assert failing.messages.calls == 0
+    view.messages.create(route="chunk", model="stub", messages=MESSAGES)
+    assert failing.messages.calls == 1
+
+def test_last_error_is_raised_when_every_provider_fails():
+    router = LLMRouter({"anthropic": FailingClient(), "ollama": FailingClient()})
+    with pytest.raises(Overloaded):
+        router.messages.create(model="stub", messages=MESSAGES)
+
+def test_stream_fails_over_before_any_text():
+    router = LLMRouter({"anthropic": FailingClient(), "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+    with router.messages.stream(model="stub", messages=MESSAGES) as stream:
+        text = "".join(stream.text_stream)
+        final = stream.get_final_message()
+    assert json.loads(text) == story_text(final)
+
+def test_async_stream_fails_over_without_closing_the_unopened_stream():
+    failing = AsyncFailingClient()
+    router = AsyncLLMRouter({"anthropic": failing, "ollama": AsyncStubAnthropicClient()}, order=["anthropic", "ollama"])
+
+    async def run():
+        async with router.messages.stream(model="stub", messages=MESSAGES) as stream:
+            text = "".join([piece async for piece in stream.text_stream])
+            return text, await stream.get_final_message()
+
+    text, final = asyncio.run(run())
+    assert json.loads(text) == story_text(final)
+    assert failing.messages.calls == 1
+    assert router.stats()["providers"]["ollama"]["recent_calls"] == 1
+
+def test_async_create_fails_over():
+    router = AsyncLLMRouter({"anthropic": AsyncFailingClient(), "ollama": AsyncStubAnthropicClient()},
+                            order=["anthropic", "ollama"])
+    message = asyncio.run(router.messages.create(model="stub", messages=MESSAGES))
+    assert len(story_text(message)["sequence"]) == 2
+
+class BadRequest(Exception):
+    status_code = 400
+
+@pytest.mark.parametrize("error", [BadRequest, ValueError])
+def test_request_errors_do_not_fail_over(error):
+    router = LLMRouter({"anthropic": FailingClient(error), "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+    with pytest.raises(error):
+        router.messages.create(model="stub", messages=MESSAGES)
+    assert router.stats()["providers"]["anthropic"]["recent_failures"] == 0
+
+@pytest.mark.parametrize("error", [ConnectionError, TimeoutError])
+def test_connection_errors_and_timeouts_fail_over(error):
+    router = LLMRouter({"anthropic": FailingClient(error), "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+    message = router.messages.create(model="stub", messages=MESSAGES)
+    assert len(story_text(message)["sequence"]) == 2
+
+def test_async_request_errors_do_not_fail_over(monkeypatch):
+    monkeypatch.setitem(llm_backends.LLM_CONCURRENCY, "anthropic", 1)
+    router = AsyncLLMRouter({"anthropic": AsyncFailingClient(BadRequest), "ollama": AsyncStubAnthropicClient()},
+                            order=["anthropic", "ollama"])
+
+    async def run():
+        async with router.messages.stream(model="stub", messages=MESSAGES):
+            pass
+
+    with pytest.raises(BadRequest):
+        asyncio.run(run())
+    with pytest.raises(BadRequest):
+        asyncio.run(router.messages.create(model="stub", messages=MESSAGES))
+    assert not router.limits["anthropic"].locked()  # The slot was given back
+
+def test_fallbacks_are_counted_per_view():
+    router = LLMRouter({"anthropic": FailingClient(), "ollama": StubAnthropicClient()}, order=["anthropic", "ollama"])
+    preferred = router.prefer("ollama")
+    preferred.messages.create(model="stub", messages=MESSAGES)
+    assert preferred.messages.fallbacks == 0
+
+    default = router.prefer()
+    default.messages.create(model="stub", messages=MESSAGES)
+    with default.messages.stream(model="stub", messages=MESSAGES) as stream:
+        "".join(stream.text_stream)
+    assert default.messages.fallbacks == 2
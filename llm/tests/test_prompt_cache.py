@@ -0,0 +1,60 @@
+from services import prompt_cache
+from services.prompt_cache import cacheable, estimate_tokens, plain, system_blocks, usage_report
+from services.stub_client import StubAnthropicClient
+
+SYSTEM = "You write cinematic stories as JSON. " * 200
+CHARACTER = "Character sheet: adult female, athletic build, scar over left brow. " * 20
+
+def chunk_messages(chunk_number):
+    return [{"role": "user", "content": [
+        cacheable(CHARACTER),
+        plain(f"Write chunk {chunk_number}: exactly 3 sequences for a story about: a heist"),
+    ]}]
+
+def create(client, chunk_number):
+    return client.messages.create(model="stub", max_tokens=1000, system=system_blocks(SYSTEM),
+                                  messages=chunk_messages(chunk_number))
+
+def test_first_call_writes_the_cache_and_later_calls_read_it():
+    client = StubAnthropicClient()
+    prefix_tokens = estimate_tokens(SYSTEM) + estimate_tokens(CHARACTER)
+
+    first = usage_report(create(client, 1).usage)
+    assert first["cache_creation_input_tokens"] == prefix_tokens
+    assert first["cache_read_input_tokens"] == 0
+    assert first["cache_hit_ratio"] == 0.0
+
+    second = usage_report(create(client, 2).usage)
+    assert second["cache_creation_input_tokens"] == 0
+    assert second["cache_read_input_tokens"] == prefix_tokens
+    assert second["input_tokens"] == first["input_tokens"]  # Only the dynamic tail is billed in full
+    assert second["cache_hit_ratio"] > 0.9
+
+def test_changed_prefix_reads_only_the_shared_part():
+    client = StubAnthropicClient()
+    create(client, 1)
+    usage = client.messages.create(model="stub", max_tokens=1000, system=system_blocks(SYSTEM), messages=[
+        {"role": "user", "content": [cacheable("A different character. " * 20), plain("exactly 2")]}
+    ]).usage
+    assert usage.cache_read_input_tokens == estimate_tokens(SYSTEM)
+    assert usage.cache_creation_input_tokens == estimate_tokens("A different character. " * 20)
+
+def test_disabled_caching_marks_no_breakpoints(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHING_ENABLED", False)
+    assert "cache_control" not in cacheable("text")
+
+    client = StubAnthropicClient()
+    create(client, 1)
+    report = usage_report(create(client, 2).usage)
+    assert report["cache_creation_input_tokens"] == report["cache_read_input_tokens"] == 0
+
+def test_usage_report_tolerates_missing_fields():
+    class Usage:
+        input_tokens = 10
+        output_tokens = 5
+        cache_read_input_tokens = None
+
+    report = usage_report(Usage())
+    assert report["cache_read_input_tokens"] == 0
+    assert report["cache_creation_input_tokens"] == 0
+    assert report["cache_hit_ratio"] == 0.0
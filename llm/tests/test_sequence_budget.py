@@ -0,0 +1,57 @@
+import pytest
+
+from services.sequence_budget import (
+    CHUNK_HEADER_TOKENS, STORY_MAX_OUTPUT_TOKENS, STORY_MAX_SEQUENCES, TokensPerSequence, plan_chunk_sizes,
+    valid_num_sequences, waste_report
+)
+
+@pytest.mark.parametrize("num_sequences", [1, 5, 12])
+def test_short_stories_are_one_chunk(num_sequences):
+    assert plan_chunk_sizes(num_sequences, max_per_chunk=12) == [num_sequences]
+
+@pytest.mark.parametrize("num_sequences", [13, 20, 36, 37, 50, 100, 241])
+def test_long_stories_split_into_at_least_three_bounded_chunks(num_sequences):
+    sizes = plan_chunk_sizes(num_sequences, max_per_chunk=12)
+    assert sum(sizes) == num_sequences
+    assert len(sizes) >= 3
+    assert max(sizes) <= 12
+    assert max(sizes) - min(sizes) <= 1
+
+def test_remainder_goes_to_the_middle_chunks_first():
+    assert plan_chunk_sizes(14, max_per_chunk=12) == [5, 5, 4]
+    assert plan_chunk_sizes(50, max_per_chunk=12) == [10, 10, 10, 10, 10]
+    assert plan_chunk_sizes(52, max_per_chunk=12) == [10, 11, 11, 10, 10]
+    assert plan_chunk_sizes(53, max_per_chunk=12) == [10, 11, 11, 11, 10]
+
+@pytest.mark.parametrize("num_sequences", [0, -3])
+def test_empty_stories_are_rejected(num_sequences):
+    with pytest.raises(ValueError):
+        plan_chunk_sizes(num_sequences)
+
+@pytest.mark.parametrize("num_sequences, valid", [
+    (1, True), (25, True), (STORY_MAX_SEQUENCES, True),
+    (0, False), (-1, False), (STORY_MAX_SEQUENCES + 1, False), ("25", False), (2.5, False), (True, False), (None, False),
+])
+def test_valid_num_sequences(num_sequences, valid):
+    assert valid_num_sequences(num_sequences) is valid
+
+def test_tokens_per_sequence_tracks_measured_chunks():
+    estimate = TokensPerSequence(prior=230)
+    estimate.observe(CHUNK_HEADER_TOKENS + 10 * 150, 10)
+    assert estimate.value == 150  # The first sample replaces the prior
+    estimate.observe(CHUNK_HEADER_TOKENS + 10 * 250, 10)
+    assert estimate.value == 200
+    estimate.observe(100, 10)  # Too small to measure anything
+    assert estimate.samples == 2
+
+def test_max_tokens_is_capped_at_the_output_limit():
+    estimate = TokensPerSequence(prior=230)
+    assert estimate.max_tokens_for(4) > CHUNK_HEADER_TOKENS + 4 * 230
+    assert estimate.max_tokens_for(1000) == STORY_MAX_OUTPUT_TOKENS
+
+def test_waste_report_counts_discarded_sequences():
+    budgets = [{"generated": 12, "kept": 10, "output_tokens": 2500}, {"generated": 10, "kept": 10, "output_tokens": 2300}]
+    report = waste_report(20, budgets, 200.0)
+    assert report["discarded_sequences"] == 2
+    assert report["wasted_output_tokens"] == 400
+    assert report["output_tokens"] == 4800
@@ -0,0 +1,31 @@
+from services.prompt_cache import estimate_tokens
+from services.story_continuity import StoryContinuity
+
+def sequence(number):
+    return {
+        "type": "scene",
+        "environment": f"WIDE SHOT - EXT. HARBOUR PIER {number} - NIGHT",
+        "atmosphere": f"8k uhd, sodium lamp glow, fog bank {number}",
+        "clip_action": "the keeper climbs the spiral stairs " * 4,
+        "voice_narration": "The light must not go out.",
+    }
+
+def continuity(max_tokens, character):
+    state = StoryContinuity(max_tokens=max_tokens)
+    state.observe_character(character)
+    for number in range(1, 9):
+        state.observe(sequence(number))
+    return state
+
+def test_block_is_trimmed_to_the_token_cap():
+    text = continuity(150, {"base_traits": "adult male", "clothing": "oilskin coat"}).render()
+    assert estimate_tokens(text) <= 150
+    assert "8. scene" in text  # The last beat is always kept
+    assert "8k uhd" not in text
+
+def test_character_sheet_is_never_shortened():
+    character = {"base_traits": "weathered lighthouse keeper with a grey beard " * 6, "clothing": "oilskin coat"}
+    text = continuity(60, character).render()
+    assert " ".join(character["base_traits"].split()) in text
+    assert "oilskin coat" in text
+    assert "Visual palette" not in text and "Locations so far" not in text
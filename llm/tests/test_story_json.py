@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from services.stub_client import StubAnthropicClient
+from services.story_json import repair_json, validate_story, validate_story_chunk
+from services.story_stream import StoryStreamParser
+
+def stub_story(num_sequences=4):
+    message = StubAnthropicClient().messages.create(
+        system="", messages=[{"role": "user", "content": f"Write exactly {num_sequences} sequences"}]
+    )
+    return message.content[0].text
+
+@pytest.mark.parametrize("piece", [1, 7, 32, 10_000])
+def test_stream_parser_emits_each_element_as_it_closes(piece):
+    text = stub_story(4)
+    parser = StoryStreamParser()
+    events = []
+    for i in range(0, len(text), piece):
+        events += parser.feed(text[i:i + piece])
+
+    story = json.loads(text)
+    assert [event for event, _ in events] == ["movie_info", "character", "music_score"] + ["sequence"] * 4
+    assert [value for event, value in events if event == "sequence"] == story["sequence"]
+    assert dict(events)["character"] == story["character"]
+
+def test_stream_parser_ignores_braces_inside_strings_and_leading_prose():
+    text = 'Here you go:\n```json\n{"movie_info": {"title": "A } tricky { \\"title\\""}, "sequence": [{"a": "]"}, {"b": 2}]}'
+    events = StoryStreamParser().feed(text)
+    assert events == [("movie_info", {"title": 'A } tricky { "title"'}), ("sequence", {"a": "]"}), ("sequence", {"b": 2})]
+
+def test_stream_parser_skips_nested_objects():
+    events = StoryStreamParser().feed('{"sequence": [{"shot": {"lens": "35mm"}}], "extra": {"movie_info": {}}}')
+    assert events == [("sequence", {"shot": {"lens": "35mm"}})]
+
+def test_repair_json_strips_fences_and_trailing_commas():
+    text = 'Sure!\n```json\n{"movie_info": {"title": "X",}, "sequence": [{"n": 1},],}\n```'
+    assert repair_json(text) == {"movie_info": {"title": "X"}, "sequence": [{"n": 1}]}
+
+def test_repair_json_keeps_everything_closed_before_a_truncation():
+    text = stub_story(5)
+    story = json.loads(text)
+    cut = text.index('"sequence_number": 4')  # Cut inside the fourth sequence
+    repaired = repair_json(text[:cut])
+    assert repaired["movie_info"] == story["movie_info"]
+    assert repaired["sequence"] == story["sequence"][:3]
+
+def test_repair_json_raises_when_nothing_is_recoverable():
+    with pytest.raises(ValueError):
+        repair_json("I'm sorry, I can't write that story.")
+    with pytest.raises(ValueError):
+        repair_json('{"movie_info": {"title": "cut off')
+
+def test_stub_story_validates():
+    story = json.loads(stub_story(3))
+    assert validate_story(story, 3) is story
+    with pytest.raises(ValueError, match="Incomplete story"):
+        validate_story(story, 4)
+
+def test_validate_story_chunk_lists_problems():
+    chunk = {"sequence": [{"type": "character", "clip_duration": 0}]}
+    with pytest.raises(ValueError) as exc:
+        validate_story_chunk(chunk, require_header=True)
+    message = str(exc.value)
+    assert "missing movie_info" in message
+    assert "no valid clip_duration" in message
+    assert "without a pose" in message
+    assert validate_story_chunk({"sequence": [json.loads(stub_story(1))["sequence"][0]]}, require_header=False)
@@ -1,5 +1,6 @@
 import requests
 import json
+import math
 import time
 import sys
 import os
@@ -21,6 +22,7 @@ MUSIC_GEN_API = "http://localhost:5009/generate"
 DEFAULT_PROMPT = "Create a psychological thriller about Marcus, a shy 16-year-old boy who becomes increasingly obsessed with an underground social media platform that seems to predict world events with uncanny accuracy. As he delves deeper into the rabbit hole of conspiracy theories and personalized content, the boundary between reality and digital manipulation begins to blur. When his online mentor starts giving him 'missions' in the real world, Marcus must confront the possibility that he's being radicalized by an artificial intelligence designed to exploit psychological vulnerabilities. With his grasp on reality weakening and his relationships deteriorating, he must find a way to distinguish truth from manipulation before he loses himself completely to the digital labyrinth."
 DEFAULT_GENRE = "psychological thriller"
 DEFAULT_NUM_SEQUENCES = 50
+MUSIC_MAX_LENGTH = 95  # Longest clip DiffRhythm-base generates in one request
 
 def setup_logging():
     """Set up logging configuration"""
@@ -152,9 +154,19 @@ def generate_videos(folder_id, sequence_data, music_score):
         print(f"❌ Error generating videos: {str(e)}")
         return None
 
-def generate_music(music_score, output_dir, audio_length=95):
+def estimate_movie_duration(sequence_data):
+    """Estimate the final movie length from the planned scene durations."""
+    # Clips are capped at 6s and rendered with a 0.5s buffer by the video service
+    return sum(min(float(item.get("clip_duration", 3.0625)), 6.0) + 0.5 for item in sequence_data)
+
+def generate_music(music_score, output_dir, audio_length=None, sequence_data=None):
     """Generate music based on the music score data."""
     try:
+        # Size the score to the movie instead of always requesting the maximum
+        if audio_length is None:
+            planned = estimate_movie_duration(sequence_data) + 2 if sequence_data else MUSIC_MAX_LENGTH
+            audio_length = min(MUSIC_MAX_LENGTH, math.ceil(planned))
+        
         # Convert music score data to comma-separated string
         ref_prompt = ", ".join([
             f"instrumentation: {music_score.get('instrumentation', '')}",
@@ -279,7 +291,7 @@ def main():
         return
         
     # Generate music
-    music_result = generate_music(music_score, folder_id)
+    music_result = generate_music(music_score, folder_id, sequence_data=sequence_data)
     if not music_result:
         print("❌ Failed to generate music. Exiting.")
         return